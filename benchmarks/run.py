@@ -0,0 +1,475 @@
+"""Time the public entry points of dse_polars on synthetic data and save the results as JSON.
+
+    python benchmarks/run.py --rows 10000 100000 --output benchmarks/baselines/0.7.0.json
+    python benchmarks/run.py --rows 10000 --compare benchmarks/baselines/0.6.1.json
+
+Each case is run once to warm up, then repeatedly until `--min-time` seconds
+have passed (at least `--repeat` times). Memory is measured in a fresh child
+process, which builds the inputs the case used and then runs it once while a
+thread samples the resident set size (RSS). RSS includes polars' native
+allocations, and a fresh process keeps earlier cases' memory out of the
+figure; each case reports the RSS before the call, the peak during it and
+their difference, along with the estimated size of the returned frame. RSS is
+read from /proc, so it is only reported on Linux.
+"""
+
+import argparse
+import gc
+import json
+import multiprocessing
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from functools import cached_property
+from pathlib import Path
+
+import polars as pl
+
+SRC = Path(__file__).resolve().parents[1] / "src"
+if str(SRC) not in sys.path:
+    sys.path.insert(0, str(SRC))
+
+import dse_polars  # noqa: E402
+from dse_polars import (  # noqa: E402
+    DSE,
+    CexLibrary,
+    DSEGraph,
+    DSEPassages,
+    cts_containment_join,
+    ctsurn_contains,
+    ptinrect,
+    retrieve_leafnode_range,
+    retrieve_leafnode_ranges,
+    textcontents,
+)
+from dse_polars.texts import md_passages, write_md_passages  # noqa: E402
+
+from synthetic import (  # noqa: E402
+    DEFAULT_VERSION,
+    VERSES_PER_CHAPTER,
+    synthetic_cex,
+    synthetic_dse,
+    synthetic_passages,
+    write_synthetic_cex,
+)
+
+BATCH_SIZE = 100
+CEX_FILES = 4
+
+
+class Context:
+    """Inputs shared by the cases for one data size.
+
+    Each input is built the first time a case needs it, and before the case
+    is timed, so that running a few cases at 10^8 rows only builds what they use.
+    """
+
+    def __init__(self, rows: int, workdir: Path):
+        self.rows = rows
+        self.workdir = workdir
+
+    @cached_property
+    def df(self) -> pl.DataFrame:
+        return synthetic_dse(self.rows)
+
+    @cached_property
+    def passages(self) -> pl.DataFrame:
+        return synthetic_passages(self.rows)
+
+    @cached_property
+    def cex_text(self) -> str:
+        return synthetic_cex(self.rows)
+
+    @cached_property
+    def cexfile(self) -> Path:
+        path = self.workdir / f"synthetic-{self.rows}.cex"
+        write_synthetic_cex(path, self.rows)
+        return path
+
+    @cached_property
+    def cexfiles(self) -> list[str]:
+        "`CEX_FILES` libraries sharing the rows between them."
+        paths = []
+        for seed in range(CEX_FILES):
+            path = self.workdir / f"synthetic-{self.rows}-{seed}.cex"
+            write_synthetic_cex(path, max(self.rows // CEX_FILES, 1), seed=seed)
+            paths.append(str(path))
+        return paths
+
+    @cached_property
+    def dsepassages(self) -> DSEPassages:
+        return DSEPassages(self.passages)
+
+    @cached_property
+    def dse(self) -> DSE:
+        dse = DSE(self.df)
+        dse.df  # derive every column once, outside the timed calls
+        return dse
+
+    @cached_property
+    def indexed(self) -> DSE:
+        return DSE(self.df).build_indexes()
+
+    @cached_property
+    def updatable(self) -> DSE:
+        "An indexed DSE kept apart from `indexed`, for the cases that update records in place."
+        return DSE(self.df).build_indexes()
+
+    @cached_property
+    def cached(self) -> DSE:
+        "A derived DSE with its selector cache turned on."
+        dse = DSE(self.df).cache()
+        dse.df
+        return dse
+
+    @cached_property
+    def other(self) -> DSE:
+        "A second edition of the same records, with different ROIs."
+        dse = DSE(synthetic_dse(self.rows, seed=1))
+        dse.df
+        return dse
+
+    @cached_property
+    def combined(self) -> DSE:
+        return DSE.combine({"a": self.dse, "b": self.other})
+
+    @cached_property
+    def graph(self) -> DSEGraph:
+        return self.dse.graph()
+
+    @cached_property
+    def snapshot(self) -> Path:
+        "An Arrow IPC snapshot of `indexed`; written once, since loaded snapshots memory-map it."
+        return self._snapshot("ipc")
+
+    @cached_property
+    def parquet_snapshot(self) -> Path:
+        return self._snapshot("parquet")
+
+    def _snapshot(self, format: str) -> Path:
+        path = self.workdir / f"snapshot-{self.rows}-{format}"
+        if not (path / "dse.json").exists():
+            self.indexed.save(path, format=format)
+        return path
+
+    @cached_property
+    def middle(self) -> dict:
+        return self.dse.df.row(self.rows // 2, named=True)
+
+    @cached_property
+    def sample(self) -> pl.DataFrame:
+        return self.dse.df.gather_every(max(self.rows // BATCH_SIZE, 1)).head(BATCH_SIZE)
+
+    @property
+    def passage(self) -> str:
+        return self.middle["passage"]
+
+    @property
+    def surface(self) -> str:
+        return self.middle["surface"]
+
+    @property
+    def image(self) -> str:
+        return self.middle["wholeimage"]
+
+    @property
+    def point(self) -> tuple[float, float]:
+        return self.middle["x"] + self.middle["w"] / 2, self.middle["y"] + self.middle["h"] / 2
+
+    @property
+    def rect(self) -> tuple[float, float, float, float]:
+        "The rectangle of the middle record, grown to cover its neighbours."
+        return self.middle["x"] - 0.05, self.middle["y"] - 0.1, self.middle["w"] + 0.1, self.middle["h"] + 0.2
+
+    @property
+    def passage_batch(self) -> list[str]:
+        return self.sample["passage"].to_list()
+
+    @property
+    def surface_batch(self) -> list[str]:
+        return self.sample["surface"].unique(maintain_order=True).to_list()
+
+    @property
+    def image_batch(self) -> list[str]:
+        return self.sample["wholeimage"].unique(maintain_order=True).to_list()
+
+    @cached_property
+    def points(self) -> pl.DataFrame:
+        return self.sample.select(
+            pl.col("image"),
+            (pl.col("x") + pl.col("w") / 2).alias("px"),
+            (pl.col("y") + pl.col("h") / 2).alias("py"),
+        )
+
+    @property
+    def chapters(self) -> int:
+        return max(self.rows // VERSES_PER_CHAPTER, 1)
+
+    @property
+    def range_urn(self) -> str:
+        start, end = max(self.chapters // 4, 1), max(self.chapters // 2, 1)
+        return f"urn:cts:compnov:bible.genesis.{DEFAULT_VERSION}:{start}.1-{end}.15"
+
+    @property
+    def range_batch(self) -> list[str]:
+        "One range of 25 verses in each of up to `BATCH_SIZE` chapters spread over the text."
+        step = max(self.chapters // BATCH_SIZE, 1)
+        return [
+            f"urn:cts:compnov:bible.genesis.{DEFAULT_VERSION}:{chapter}.1-{chapter}.25"
+            for chapter in range(1, self.chapters + 1, step)
+        ][:BATCH_SIZE]
+
+    @cached_property
+    def chapter_queries(self) -> pl.DataFrame:
+        "Version-agnostic URNs of up to `BATCH_SIZE` chapters spread over the text."
+        step = max(self.chapters // BATCH_SIZE, 1)
+        chapters = range(1, self.chapters + 1, step)
+        return pl.DataFrame({"urn": [f"urn:cts:compnov:bible.genesis:{chapter}" for chapter in chapters][:BATCH_SIZE]})
+
+    @property
+    def chapter_urn(self) -> str:
+        return f"urn:cts:compnov:bible.genesis.{DEFAULT_VERSION}:{max(self.chapters // 2, 1)}"
+
+
+CASES = {
+    # Construction and loading
+    "DSE": lambda c: DSE(c.df),
+    "DSE.trusted": lambda c: DSE.trusted(c.df),
+    "DSE.df": lambda c: DSE(c.df).df,
+    "DSE.from_cex_text": lambda c: DSE.from_cex_text(c.cex_text),
+    "DSE.from_cex_file": lambda c: DSE.from_cex_file(str(c.cexfile)),
+    "DSE.from_cex_stream": lambda c: DSE.from_cex_stream(c.cexfile),
+    "DSE.from_cex_files": lambda c: DSE.from_cex_files(c.cexfiles),
+    "CexLibrary.from_cex_text": lambda c: CexLibrary.from_cex_text(c.cex_text),
+    "CexLibrary.from_cex_file": lambda c: CexLibrary.from_cex_file(c.cexfile),
+    "DSE.build_indexes": lambda c: DSE(c.df).build_indexes(),
+    "DSE.save": lambda c: c.indexed.save(c.workdir / "saved-ipc"),
+    "DSE.save[parquet]": lambda c: c.indexed.save(c.workdir / "saved-parquet", format="parquet"),
+    "DSE.load": lambda c: DSE.load(c.snapshot),
+    "DSE.load[parquet]": lambda c: DSE.load(c.parquet_snapshot),
+    "DSE.combine": lambda c: DSE.combine({"a": c.dse, "b": c.other}),
+    "DSE.graph": lambda c: DSE.trusted(c.dse.df).graph(),
+    "DSEPassages": lambda c: DSEPassages(c.passages),
+    # Updates; removing and re-adding the middle record leaves the DSE the same size for the next call
+    "DSE.remove+extend[indexed]": lambda c: c.updatable.remove(pl.col("passage") == c.passage).extend(
+        c.dse.df.slice(c.rows // 2, 1)
+    ),
+    "DSEPassages.from_cex_text": lambda c: DSEPassages.from_cex_text(c.cex_text),
+    # Inventories
+    "DSE.surfaces": lambda c: c.dse.surfaces(),
+    "DSE.images": lambda c: c.dse.images(),
+    "DSE.texts": lambda c: c.dse.texts(),
+    "DSE.surfaces[cached]": lambda c: c.cached.surfaces(),
+    "DSE.editionsforimage": lambda c: c.combined.editionsforimage(c.image),
+    "DSE.editionsforpassage": lambda c: c.combined.editionsforpassage(c.passage),
+    "DSE.editionsforimages": lambda c: c.combined.editionsforimages(c.image_batch),
+    # Selectors
+    "DSE.surfacesforimage": lambda c: c.dse.surfacesforimage(c.image),
+    "DSE.surfacesforpassage": lambda c: c.dse.surfacesforpassage(c.passage),
+    "DSE.imagesforpassage": lambda c: c.dse.imagesforpassage(c.passage),
+    "DSE.imagesforsurface": lambda c: c.dse.imagesforsurface(c.surface),
+    "DSE.wholeimagesforsurface": lambda c: c.dse.wholeimagesforsurface(c.surface),
+    "DSE.wholeimagesforpassage": lambda c: c.dse.wholeimagesforpassage(c.passage),
+    "DSE.rectsforsurface": lambda c: c.dse.rectsforsurface(c.surface),
+    "DSE.passagesforsurface": lambda c: c.dse.passagesforsurface(c.surface),
+    "DSE.passagesforimage": lambda c: c.dse.passagesforimage(c.image),
+    "DSE.passagesforsurface[indexed]": lambda c: c.indexed.passagesforsurface(c.surface),
+    "DSE.surfacesforpassage[indexed]": lambda c: c.indexed.surfacesforpassage(c.passage),
+    "DSE.passagesforsurface[cached]": lambda c: c.cached.passagesforsurface(c.surface),
+    "DSE.passagesforsurface[edition]": lambda c: c.combined.passagesforsurface(c.surface, edition="b"),
+    "DSE.passagesforsurface[scan]": lambda c: DSE.scan(c.parquet_snapshot / "frame.parquet")
+    .passagesforsurface(c.surface)
+    .collect(),
+    "DSE.passagesforsurface[load]": lambda c: DSE.load(c.snapshot).passagesforsurface(c.surface),
+    "DSE.imagesforcitation": lambda c: c.dse.imagesforcitation(c.chapter_queries["urn"][0]),
+    # Batch selectors
+    "DSE.surfacesforpassages": lambda c: c.dse.surfacesforpassages(c.passage_batch),
+    "DSE.imagesforsurfaces": lambda c: c.dse.imagesforsurfaces(c.surface_batch),
+    "DSE.passagesforsurfaces": lambda c: c.dse.passagesforsurfaces(c.surface_batch),
+    "DSE.passagesforimages": lambda c: c.dse.passagesforimages(c.image_batch),
+    # Spatial queries
+    "DSE.roisforpoint": lambda c: c.dse.roisforpoint(c.image, *c.point),
+    "DSE.roisforrect": lambda c: c.dse.roisforrect(c.image, *c.rect),
+    "DSE.roisforpoints": lambda c: c.dse.roisforpoints(c.points),
+    "DSE.roioverlaps": lambda c: c.dse.roioverlaps(),
+    "DSE.roicoverage": lambda c: c.dse.roicoverage(),
+    "ptinrect": lambda c: c.dse.df.filter(ptinrect(*c.point)),
+    # Graph
+    "DSEGraph.neighbors": lambda c: c.graph.neighbors(c.image_batch, "passage"),
+    "DSEGraph.expand": lambda c: c.graph.expand([c.passage], hops=4),
+    "DSEGraph.components": lambda c: c.graph.components(),
+    # Texts
+    "ctsurn_contains": lambda c: c.passages.filter(ctsurn_contains(pl.col("urn"), c.chapter_urn)),
+    "cts_containment_join": lambda c: cts_containment_join(c.passages, c.chapter_queries),
+    "retrieve_leafnode_range": lambda c: retrieve_leafnode_range(c.passages, c.range_urn),
+    "DSEPassages.passagerange": lambda c: c.dsepassages.passagerange(c.range_urn),
+    "retrieve_leafnode_ranges": lambda c: retrieve_leafnode_ranges(c.passages, c.range_batch),
+    "DSEPassages.passageranges": lambda c: c.dsepassages.passageranges(c.range_batch),
+    "DSEPassages.nextpassage": lambda c: c.dsepassages.nextpassage(c.chapter_urn + ".1", n=25),
+    "md_passages": lambda c: md_passages(c.passages),
+    "write_md_passages": lambda c: write_md_passages(c.passages, c.workdir / "passages.md"),
+    "textcontents": lambda c: textcontents(c.passages),
+}
+
+
+def result_bytes(result) -> int | None:
+    "Estimated size of a returned frame (or a DSE's or a CEX library's DSE frame), or None for other results."
+    if isinstance(result, CexLibrary):
+        result = result.dse
+    if isinstance(result, DSE):
+        result = result._df
+    if isinstance(result, DSEPassages):
+        result = result.df
+    if isinstance(result, pl.DataFrame):
+        return result.estimated_size()
+    return None
+
+
+def measure(name: str, context: Context, repeat: int, min_time: float, memory: bool = True) -> dict:
+    "Time and measure one case on one context; the first, untimed call also builds the inputs it needs."
+    case = CASES[name]
+    case(context)
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < repeat or time.perf_counter() - started < min_time:
+        start = time.perf_counter()
+        case(context)
+        timings.append(time.perf_counter() - start)
+
+    measured = {
+        "seconds_min": min(timings),
+        "seconds_median": statistics.median(timings),
+        "repeats": len(timings),
+        "result_bytes": None,
+        "rss_before_bytes": None,
+        "rss_peak_bytes": None,
+        "rss_peak_delta_bytes": None,
+    }
+    if memory:
+        inputs = [attribute for attribute in vars(context) if attribute not in ("rows", "workdir")]
+        with multiprocessing.get_context("spawn").Pool(1) as pool:
+            size, before, peak = pool.apply(measure_memory, (name, context.rows, context.workdir, inputs))
+        measured.update(
+            result_bytes=size,
+            rss_before_bytes=before,
+            rss_peak_bytes=peak,
+            rss_peak_delta_bytes=None if before is None else peak - before,
+        )
+    else:
+        measured["result_bytes"] = result_bytes(case(context))
+    return measured
+
+
+def measure_memory(name: str, rows: int, workdir: Path, inputs: list[str]) -> tuple[int | None, int | None, int | None]:
+    "In a child process, build the `inputs` of a new context and run case `name` once, sampling RSS."
+    context = Context(rows, workdir)
+    for attribute in inputs:
+        getattr(context, attribute)
+    gc.collect()
+    result, before, peak = sample_rss(lambda: CASES[name](context))
+    return result_bytes(result), before, peak
+
+
+def current_rss() -> int | None:
+    "Resident set size of this process in bytes, or None where /proc is not available."
+    try:
+        with open("/proc/self/statm", encoding="ascii") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def sample_rss(call, interval: float = 0.001):
+    "Run `call` while a thread samples this process's RSS; return its result, the RSS before it and the peak RSS during it."
+    before = current_rss()
+    if before is None:
+        return call(), None, None
+    peak = before
+    done = threading.Event()
+
+    def sample():
+        nonlocal peak
+        while not done.wait(interval):
+            peak = max(peak, current_rss())
+
+    sampler = threading.Thread(target=sample, daemon=True)
+    sampler.start()
+    try:
+        result = call()
+    finally:
+        done.set()
+        sampler.join()
+    return result, before, max(peak, current_rss())
+
+
+def run(rows: list[int], cases: list[str], repeat: int, min_time: float, memory: bool = True) -> dict:
+    "Run `cases` at each size in `rows` and return the results with a description of the environment."
+    results = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in rows:
+            context = Context(size, Path(workdir))
+            for name in cases:
+                measured = measure(name, context, repeat, min_time, memory)
+                results.append({"case": name, "rows": size, **measured})
+                delta = measured["rss_peak_delta_bytes"]
+                shown = "" if delta is None else f" {delta / 2**20:>10.1f} MiB"
+                print(f"{name:36} {size:>11,} {measured['seconds_median'] * 1000:>12.3f} ms{shown}", flush=True)
+    return {
+        "dse_polars": dse_polars.__version__,
+        "polars": pl.__version__,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "results": results,
+    }
+
+
+def compare(current: dict, baseline: dict, threshold: float) -> list[dict]:
+    "Pair each result with the baseline result for the same case and size, flagging those slower than `threshold` times."
+    previous = {(result["case"], result["rows"]): result for result in baseline["results"]}
+    compared = []
+    for result in current["results"]:
+        before = previous.get((result["case"], result["rows"]))
+        if before is None:
+            continue
+        ratio = result["seconds_median"] / before["seconds_median"] if before["seconds_median"] else float("inf")
+        compared.append({"case": result["case"], "rows": result["rows"], "ratio": ratio, "slower": ratio > threshold})
+    return compared
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, nargs="+", default=[10_000, 100_000], help="data sizes to run (10^4 to 10^8)")
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=list(CASES), metavar="CASE", help="cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3, help="minimum number of timed calls per case")
+    parser.add_argument("--min-time", type=float, default=0.2, help="minimum seconds of timed calls per case")
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the per-case memory measurement")
+    parser.add_argument("--output", type=Path, help="write the results to this JSON file")
+    parser.add_argument("--compare", type=Path, help="compare the results with a baseline JSON file")
+    parser.add_argument("--threshold", type=float, default=1.25, help="slowdown ratio reported as a regression")
+    args = parser.parse_args(argv)
+
+    current = run(args.rows, args.cases, args.repeat, args.min_time, args.memory)
+    if args.output:
+        args.output.parent.mkdir(parents=True, exist_ok=True)
+        args.output.write_text(json.dumps(current, indent=2) + "\n", encoding="utf-8")
+
+    if args.compare:
+        baseline = json.loads(args.compare.read_text(encoding="utf-8"))
+        compared = compare(current, baseline, args.threshold)
+        print(f"\nCompared with dse_polars {baseline['dse_polars']} ({args.compare}):")
+        for row in compared:
+            flag = "  SLOWER" if row["slower"] else ""
+            print(f"{row['case']:36} {row['rows']:>11,} {row['ratio']:>8.2f}x{flag}")
+        if any(row["slower"] for row in compared):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
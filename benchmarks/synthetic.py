@@ -0,0 +1,93 @@
+"""Synthetic DSE data shaped like the Genesis editions in `test/data`.
+
+The bundled files index about 30 verses per chapter, 12 verses per manuscript
+page, with one image per page and each verse's ROI a line-shaped rectangle in
+a single column of the page. The generators below reproduce that shape at any
+size with polars expressions, so that 10^8 rows can be built without a Python
+loop.
+"""
+
+import polars as pl
+
+VERSES_PER_CHAPTER = 30
+ROWS_PER_PAGE = 12
+DEFAULT_VERSION = "sept_latin"
+
+
+def synthetic_dse(rows: int, version: str = DEFAULT_VERSION, seed: int = 0) -> pl.DataFrame:
+    "Generate `rows` DSE records with `passage`, `image` and `surface` columns."
+    index = pl.int_range(rows, dtype=pl.Int64)
+    page = (index // ROWS_PER_PAGE).cast(pl.String)
+    line = index % ROWS_PER_PAGE
+
+    def jitter(salt: int, scale: float) -> pl.Expr:
+        return (index.hash(seed + salt) % 1000).cast(pl.Float64) / 1000 * scale
+
+    roi = pl.concat_str(
+        [
+            (0.05 + jitter(1, 0.01)).round(4).cast(pl.String),
+            (0.06 + line * 0.075 + jitter(2, 0.01)).round(4).cast(pl.String),
+            (0.25 + jitter(3, 0.05)).round(4).cast(pl.String),
+            (0.025 + jitter(4, 0.04)).round(4).cast(pl.String),
+        ],
+        separator=",",
+    )
+    return pl.select(
+        passage_urns(index, version).alias("passage"),
+        pl.concat_str([pl.lit("urn:cite2:citebne:complutensian.v1:v1p"), page, pl.lit("@"), roi]).alias("image"),
+        pl.concat_str([pl.lit("urn:cite2:complut:pages.bne:vol1_"), page]).alias("surface"),
+    )
+
+
+def synthetic_passages(rows: int, version: str = DEFAULT_VERSION) -> pl.DataFrame:
+    "Generate `rows` passages with `urn` and `text` columns, matching the passages of `synthetic_dse`."
+    index = pl.int_range(rows, dtype=pl.Int64)
+    return pl.select(
+        passage_urns(index, version).alias("urn"),
+        pl.concat_str([pl.lit("In principio creavit Deus caelum et terram "), index.cast(pl.String)]).alias("text"),
+    )
+
+
+def passage_urns(index: pl.Expr, version: str) -> pl.Expr:
+    "Polars expression for the CTS URN of the `index`-th verse of Genesis in `version`."
+    chapter = (index // VERSES_PER_CHAPTER + 1).cast(pl.String)
+    verse = (index % VERSES_PER_CHAPTER + 1).cast(pl.String)
+    return pl.concat_str([pl.lit(f"urn:cts:compnov:bible.genesis.{version}:"), chapter, pl.lit("."), verse])
+
+
+CEX_HEADER = [
+    "#!datamodels",
+    "Collection|Model|Label|Description",
+    "urn:cite2:bench:dse.v1:all|urn:cite2:cite:datamodels.v1:dsemodel|Synthetic DSE|Synthetic DSE records",
+    "",
+    "#!citerelationset",
+    "urn|urn:cite2:bench:dse.v1:all",
+    "label|Synthetic DSE records",
+    "passage|imageroi|surface",
+]
+
+
+def synthetic_cex_lines(rows: int, version: str = DEFAULT_VERSION, seed: int = 0) -> pl.DataFrame:
+    "Generate the lines of a CEX library with a DSE relation set of `rows` records and a `ctsdata` block of their passages."
+    relations = synthetic_dse(rows, version, seed).select(
+        pl.concat_str(["passage", "image", "surface"], separator="|").alias("line")
+    )
+    passages = synthetic_passages(rows, version).select(pl.concat_str(["urn", "text"], separator="#").alias("line"))
+    return pl.concat(
+        [
+            pl.DataFrame({"line": CEX_HEADER}),
+            relations,
+            pl.DataFrame({"line": ["", "#!ctsdata"]}),
+            passages,
+        ]
+    )
+
+
+def synthetic_cex(rows: int, version: str = DEFAULT_VERSION, seed: int = 0) -> str:
+    "Generate the text of the CEX library of `synthetic_cex_lines`."
+    return synthetic_cex_lines(rows, version, seed).select(pl.col("line").str.join("\n")).item() + "\n"
+
+
+def write_synthetic_cex(path, rows: int, version: str = DEFAULT_VERSION, seed: int = 0):
+    "Write the CEX library of `synthetic_cex_lines` to the file `path`, without building its text in Python."
+    synthetic_cex_lines(rows, version, seed).write_csv(path, include_header=False, quote_style="never")
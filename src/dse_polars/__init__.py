@@ -7,20 +7,42 @@ except PackageNotFoundError:
     __version__ = "unknown"
 
 from .dse import DSE
-from .texts import DSEPassages, ctsurn_contains, retrieve_leafnode_range, textcontents
-from .images import CitableIIIFService, roi, strip_roi, ptinrect, rois
+from .graph import DSEGraph
+from .index import ColumnIndex
+from .instrument import Operation, Recorder, add_hook, recording, remove_hook
+from .texts import CitationIndex, DSEPassages, citation_key, cts_containment_join, ctsurn_contains, retrieve_leafnode_range, retrieve_leafnode_ranges, textcontents
+from .images import CitableIIIFService, roi, strip_roi, ptinrect, rectsintersect, rois
+from .library import CexLibrary
+from .spatial import SpatialIndex, points_in_rois, roi_coverage, roi_overlaps
 from .urnutils import passagecomponent_re
 
 __all__ = [
     "DSE",
+    "ColumnIndex",
+    "DSEGraph",
+    "Operation",
+    "Recorder",
+    "add_hook",
+    "remove_hook",
+    "recording",
     "passagecomponent_re",
     "DSEPassages",
+    "CitationIndex",
+    "citation_key",
+    "cts_containment_join",
     "ctsurn_contains",
     "retrieve_leafnode_range",
+    "retrieve_leafnode_ranges",
     "textcontents",
     "CitableIIIFService",
     "roi",
     "strip_roi",
     "ptinrect",
+    "rectsintersect",
     "rois",
+    "CexLibrary",
+    "SpatialIndex",
+    "points_in_rois",
+    "roi_overlaps",
+    "roi_coverage",
 ]
\ No newline at end of file
@@ -0,0 +1,85 @@
+import functools
+from collections import OrderedDict
+from collections.abc import Hashable
+
+
+class SelectorCache:
+    """Least-recently-used cache of selector results, keyed by method name and arguments.
+
+    `hits` and `misses` count lookups since the cache was created or last
+    reset, to help choose `maxsize`.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        if maxsize < 1:
+            raise ValueError("maxsize must be a positive integer.")
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.entries
+
+    def get(self, key: Hashable, compute):
+        "Return the result cached under `key`, calling `compute` and caching its result on a miss."
+        if key in self.entries:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key]
+        self.misses += 1
+        result = compute()
+        self.entries[key] = result
+        if len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+        return result
+
+    def clear(self):
+        "Drop every cached result, keeping the hit and miss counts."
+        self.entries.clear()
+
+    def info(self) -> dict:
+        "Return the hit and miss counts, the number of cached results and `maxsize`."
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.maxsize}
+
+
+_UNCACHEABLE = object()
+
+
+def cache_key(name: str, args: tuple, kwargs: dict) -> tuple | None:
+    """Form a cache key from a method name and its arguments.
+
+    Lists and tuples of values are keyed by their contents. Returns None if an
+    argument is anything other than a string, number, boolean, None or a
+    sequence of those, such as a dataframe, so that the call is not cached.
+    """
+
+    def freeze(value):
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        if isinstance(value, (list, tuple)):
+            frozen = tuple(freeze(item) for item in value)
+            return frozen if _UNCACHEABLE not in frozen else _UNCACHEABLE
+        return _UNCACHEABLE
+
+    frozen = (freeze(args), tuple((key, freeze(value)) for key, value in sorted(kwargs.items())))
+    if frozen[0] is _UNCACHEABLE or any(value is _UNCACHEABLE for _, value in frozen[1]):
+        return None
+    return (name, *frozen)
+
+
+def cached(method):
+    "Decorator serving a DSE method's results from the DSE's selector cache, if it has one."
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        cache = self._cache
+        key = None if cache is None else cache_key(method.__name__, args, kwargs)
+        if key is None:
+            return method(self, *args, **kwargs)
+        return cache.get(key, lambda: method(self, *args, **kwargs))
+
+    return wrapper
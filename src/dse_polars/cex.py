@@ -0,0 +1,244 @@
+import itertools
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+
+import polars as pl
+
+from .instrument import instrumented
+
+DSE_MODEL = "urn:cite2:cite:datamodels.v1:dsemodel"
+DSE_ROW_ERROR = "Invalid DSE relation row in CEX: expected 3 pipe-delimited fields (passage|image|surface)."
+MAX_REPORTED_LINES = 10
+
+
+class CexScanner:
+    """Split CEX source lines into the data lines of their blocks with polars expressions.
+
+    `scan` may be called with consecutive chunks of the lines of one source:
+    the line number, the block and its label, and the position and first line
+    of the block in progress carry over from one chunk to the next, so a file
+    can be scanned a chunk at a time in bounded memory.
+    """
+
+    def __init__(self):
+        self.lineno = 0
+        self.block = -1
+        self.label = None
+        self.position = 0
+        self.head = None
+
+    def scan(self, lines: Iterable[str] | pl.Series) -> pl.DataFrame:
+        """Tokenize the next chunk of source lines.
+
+        Returns a `block`, `label`, `lineno`, `position`, `head` and `line`
+        row for every data line, where `block` counts the `#!` block labels
+        seen so far, `lineno` is the 1-based line number in the source,
+        `position` is the line's position among the data lines of its block
+        and `head` is the block's first data line. As in `CexBlock.from_text`,
+        blank lines, `//` comments and lines before the first block label are
+        skipped.
+        """
+        line = pl.col("line")
+        header = line.str.starts_with("#!")
+        tokens = (
+            pl.Series("line", lines if isinstance(lines, pl.Series) else list(lines), dtype=pl.String)
+            .str.strip_suffix("\n")
+            .to_frame()
+            .with_row_index("lineno", offset=self.lineno + 1)
+            .with_columns(
+                (header.cast(pl.Int64).cum_sum() + self.block).alias("block"),
+                pl.when(header).then(line.str.slice(2)).forward_fill().fill_null(pl.lit(self.label, dtype=pl.String)).alias("label"),
+            )
+        )
+        self.lineno += tokens.height
+        blocks = tokens.get_column("block")
+        data = tokens.filter(~header & pl.col("label").is_not_null() & (line != "") & ~line.str.starts_with("//"))
+
+        # Lines of the block left open by the previous chunk continue its count.
+        continued = pl.col("block") == self.block
+        head = line.first().over("block")
+        if self.head is not None:
+            head = pl.when(continued).then(pl.lit(self.head)).otherwise(head)
+        data = data.select(
+            "block",
+            "label",
+            pl.col("lineno").cast(pl.Int64),
+            (pl.int_range(pl.len()).over("block") + pl.when(continued).then(self.position).otherwise(0)).alias("position"),
+            head.alias("head"),
+            "line",
+        )
+
+        last = blocks[-1] if blocks.len() else self.block
+        if last != self.block:
+            self.block, self.position, self.head = last, 0, None
+            self.label = tokens.get_column("label")[-1]
+        inlast = data.filter(pl.col("block") == last)
+        if inlast.height:
+            self.position = inlast.get_column("position")[-1] + 1
+            self.head = inlast.get_column("head")[0]
+        return data
+
+
+def scan_cex(lines: Iterable[str] | pl.Series) -> pl.DataFrame:
+    "Tokenize all the lines of a CEX source at once with a `CexScanner`."
+    return CexScanner().scan(lines)
+
+
+def declares_dse(line: pl.Expr) -> pl.Expr:
+    "Polars expression that is true for a `datamodels` line declaring a collection with the DSE model."
+    return line.str.contains(DSE_MODEL, literal=True)
+
+
+def dse_urns(lines: Iterable[str] | pl.Series) -> list[str]:
+    "Find the URNs of collections declared with the DSE data model in `datamodels` blocks."
+    return _dse_collections(scan_cex(lines)).to_list()
+
+
+def _dse_collections(tokens: pl.DataFrame) -> pl.Series:
+    "The URNs of the DSE collections declared in tokens from `CexScanner.scan`."
+    return tokens.filter(
+        (pl.col("label") == "datamodels") & (pl.col("position") > 0) & declares_dse(pl.col("line"))
+    ).select(pl.col("line").str.split("|").list.first()).to_series()
+
+
+def _relation_rows(tokens: pl.DataFrame) -> pl.DataFrame:
+    """The `relationset`, `lineno` and `row` of the relation rows in tokens from `CexScanner.scan`.
+
+    The first three data lines of a relation block (URN, label and column
+    header) are skipped.
+    """
+    return tokens.filter(
+        (pl.col("label") == "citerelationset") & (pl.col("position") >= 3) & (pl.col("line").str.strip_chars() != "")
+    ).select(
+        pl.col("head").str.replace("urn|", "", literal=True).alias("relationset"),
+        "lineno",
+        pl.col("line").alias("row"),
+    )
+
+
+@instrumented
+def relation_frame(rows: list[str] | pl.Series, linenos: list[int] | pl.Series | None = None) -> pl.DataFrame:
+    """Parse pipe-delimited DSE relation rows into a dataframe with `passage`, `image` and `surface` columns.
+
+    Rows are split with polars string expressions rather than in a Python loop.
+    If any row does not have exactly three fields, a ValueError lists the
+    offending line numbers from `linenos`, or 1-based row positions if no line
+    numbers are given.
+    """
+    frame = pl.DataFrame({"row": rows}, schema={"row": pl.String})
+    if linenos is None:
+        frame = frame.with_row_index("lineno", offset=1)
+    else:
+        frame = frame.with_columns(pl.Series("lineno", linenos, dtype=pl.Int64))
+
+    bad_lines = frame.filter(
+        pl.col("row").str.count_matches("|", literal=True) != 2
+    ).get_column("lineno").to_list()
+    if bad_lines:
+        shown = ", ".join(str(lineno) for lineno in bad_lines[:MAX_REPORTED_LINES])
+        if len(bad_lines) > MAX_REPORTED_LINES:
+            shown += f" and {len(bad_lines) - MAX_REPORTED_LINES} more"
+        label = "rows" if linenos is None else "lines"
+        raise ValueError(f"{DSE_ROW_ERROR} Offending {label}: {shown}.")
+
+    parts = pl.col("row").str.split_exact("|", 2)
+    return frame.select(
+        parts.struct.field("field_0").alias("passage"),
+        parts.struct.field("field_1").alias("image"),
+        parts.struct.field("field_2").alias("surface"),
+    )
+
+
+@instrumented
+def parse_cex(lines: Iterable[str] | pl.Series) -> tuple[pl.DataFrame, pl.DataFrame, pl.DataFrame]:
+    """Tokenize CEX source lines once and collect the blocks a DSE library needs.
+
+    Returns three dataframes:
+
+    - the datamodel catalog from `datamodels` blocks, with `collection`,
+      `model`, `label` and `description` columns;
+    - the raw rows of every `citerelationset` block, with the block's
+      `relationset` URN and each row's `lineno`;
+    - the passages of `ctsdata` blocks, with `urn` and `text` columns.
+    """
+    tokens = scan_cex(lines)
+    label = pl.col("label")
+    model_parts = pl.col("line").str.splitn("|", 4)
+    datamodel_frame = tokens.filter((label == "datamodels") & (pl.col("position") > 0)).select(
+        model_parts.struct.field("field_0").alias("collection"),
+        model_parts.struct.field("field_1").alias("model"),
+        model_parts.struct.field("field_2").alias("label"),
+        model_parts.struct.field("field_3").alias("description"),
+    )
+    passage_parts = pl.col("line").str.splitn("#", 2)
+    ctsdata_frame = tokens.filter(label == "ctsdata").select(
+        passage_parts.struct.field("field_0").alias("urn"),
+        passage_parts.struct.field("field_1").alias("text"),
+    )
+    return datamodel_frame, _relation_rows(tokens), ctsdata_frame
+
+
+@instrumented
+def dse_relations(datamodels: pl.DataFrame, relations: pl.DataFrame) -> pl.DataFrame:
+    "Parse the rows of relation sets declared with the DSE model in a datamodel catalog from `parse_cex`."
+    # The catalog's fields joined back together are the datamodel line.
+    line = pl.concat_str("collection", "model", "label", "description", separator="|", ignore_nulls=True)
+    dseurns = datamodels.filter(declares_dse(line)).get_column("collection")
+    rows = relations.filter(pl.col("relationset").is_in(dseurns.implode()))
+    return relation_frame(rows.get_column("row"), rows.get_column("lineno"))
+
+
+@instrumented
+def read_dse_relations(cexfile: str | Path) -> pl.DataFrame:
+    """Read the DSE relation rows of a CEX file into a dataframe of raw `passage`, `image` and `surface` values.
+
+    The file is split into lines and tokenized with polars expressions, so
+    most of the work runs without holding the GIL and several files can be
+    read in parallel threads.
+    """
+    with open(cexfile, encoding="utf-8") as f:
+        text = f.read()
+    datamodels, relations, _ = parse_cex(pl.Series("line", [text]).str.split("\n").explode())
+    return dse_relations(datamodels, relations)
+
+
+def iter_dse_batches(
+    cexfile: str | Path, batch_size: int = 100_000, limit: int | None = None
+) -> Iterator[pl.DataFrame]:
+    """Read DSE relation rows from a CEX file in dataframes of at most `batch_size` rows.
+
+    The file is read twice in chunks of `batch_size` lines, tokenized by one
+    `CexScanner` per pass: once to find the DSE collections declared in
+    `datamodels` blocks, and once to collect their relation rows. Only one
+    chunk of lines and one batch of rows are held in memory at a time. If
+    `limit` is given, reading stops after that many rows.
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size must be a positive integer.")
+    dseurns = pl.concat(
+        [_dse_collections(tokens) for tokens in _scan_chunks(cexfile, batch_size)]
+    ).implode()
+
+    count = 0
+    pending = None
+    for tokens in _scan_chunks(cexfile, batch_size):
+        if limit is not None and count >= limit:
+            break
+        rows = _relation_rows(tokens).filter(pl.col("relationset").is_in(dseurns))
+        if limit is not None:
+            rows = rows.head(limit - count)
+        count += rows.height
+        pending = rows if pending is None else pl.concat([pending, rows])
+        while pending.height >= batch_size:
+            batch, pending = pending.head(batch_size), pending.slice(batch_size)
+            yield relation_frame(batch.get_column("row"), batch.get_column("lineno"))
+    if pending is not None and pending.height:
+        yield relation_frame(pending.get_column("row"), pending.get_column("lineno"))
+
+
+def _scan_chunks(cexfile: str | Path, lines: int) -> Iterator[pl.DataFrame]:
+    "Tokenize a CEX file with one `CexScanner`, `lines` lines at a time."
+    scanner = CexScanner()
+    with open(cexfile, encoding="utf-8") as f:
+        while chunk := list(itertools.islice(f, lines)):
+            yield scanner.scan(chunk)
@@ -2,110 +2,554 @@
 #from copy import replace
 import polars as pl
 import itertools
-from cite_exchange import CexBlock
+import json
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
 
+from .cache import SelectorCache, cached
+from .cex import dse_relations, dse_urns, iter_dse_batches, parse_cex, read_dse_relations
+from .images import ptinrect, rectsintersect, strip_roi
+from .graph import DSEGraph
+from .index import ColumnIndex
+from .instrument import instrumented
+from .spatial import SpatialIndex, points_in_rois, roi_coverage, roi_overlaps
+from .texts import CitationIndex, citation_key, ctsurn_contains
 from .urnutils import passagecomponent_re
 
+DSE_COLUMNS = ["passage", "image", "surface"]
+INDEXED_COLUMNS = ["passage", "surface", "wholeimage"]
+SNAPSHOT_FORMATS = {"ipc": ".arrow", "parquet": ".parquet"}
+# URN columns and their components repeat across records; `passage` and
+# `image` (which carries the ROI) are nearly unique per record and stay strings.
+CATEGORICAL_COLUMNS = [
+    "surface", "wholeimage", "group", "work", "version",
+    "surfacenamespace", "surfacecollection", "surfaceversion", "surfaceobject",
+    "imagenamespace", "imagecollection", "imageversion", "imageobject",
+]
+ROI_ERROR = "Invalid ROI in image value: ROI must have four comma-separated numeric values (x,y,w,h)."
+
+
 class DSE:
-    def __init__(self, data):
-        "Enforce DSE schema for dataframe."
+    @instrumented
+    def __init__(self, data, indexed: bool = False, categorical: bool = False):
+        """Enforce DSE schema for dataframe.
+
+        If `indexed` is True, selectors look rows up in sorted indexes on the
+        `passage`, `surface` and `wholeimage` columns instead of scanning the
+        whole frame. Each index is built the first time a selector needs it,
+        or all at once with `build_indexes`.
+
+        If `categorical` is True, the URN columns that repeat across records
+        and their component columns are stored as dictionary-encoded
+        `pl.Categorical` columns (see `encode_columns`).
+
+        ROI values are validated at construction. Other derived columns are
+        computed the first time they are needed (see `df`).
+        """
         base_df = pl.DataFrame(data, schema={
             "passage": pl.String,
             "image": pl.String,
             "surface": pl.String
         })
+        if categorical:
+            base_df = encode_columns(base_df)
+
+        self._setup(base_df, indexed, categorical)
+        check_rois(self._frame("x"))
+
+    def _setup(self, frame: pl.DataFrame | pl.LazyFrame, indexed: bool, categorical: bool):
+        self._df = frame
+        self._pending = pending_groups(frame)
+        self.indexed = indexed
+        self.categorical = categorical
+        self._indexes = {}
+        self._spatial = None
+        self._graph = None
+        self._citations = None
+        self._cache = None
+
+    @classmethod
+    def _from_frame(cls, df: pl.DataFrame | pl.LazyFrame, indexed: bool = False, categorical: bool = False):
+        """Wrap a frame as it is, without validating or encoding it; derived columns it lacks are computed when first needed.
+
+        With `categorical` True, only derived columns computed later are encoded.
+        """
+        dse = cls.__new__(cls)
+        dse._setup(df, indexed, categorical)
+        return dse
+
+    @classmethod
+    @instrumented
+    def trusted(cls, data, indexed: bool = False, categorical: bool = False):
+        """Create a DSE from trusted data without validating it.
+
+        `data` must have `passage`, `image` and `surface` columns, and may
+        already have some or all of the derived columns, as a frame saved from
+        another DSE does. Derived columns it lacks, including the `x`, `y`, `w`
+        and `h` ROI geometry, are only computed when a selector or `df` first
+        needs them.
+        """
+        frame = data if isinstance(data, (pl.DataFrame, pl.LazyFrame)) else pl.DataFrame(data)
+        if categorical and isinstance(frame, pl.DataFrame):
+            frame = encode_columns(frame)
+        return cls._from_frame(frame, indexed=indexed, categorical=categorical)
+
+    @property
+    def df(self) -> pl.DataFrame | pl.LazyFrame:
+        "The DSE records with all derived columns, computing any that have not been needed yet."
+        return self._frame(*itertools.chain.from_iterable(DERIVED_COLUMNS.values()))
+
+    @df.setter
+    def df(self, frame: pl.DataFrame | pl.LazyFrame):
+        self._df = frame
+        self._pending = pending_groups(frame)
+        self._indexes = {}
+        self._spatial = None
+        self._graph = None
+        self._citations = None
+        self._changed()
+
+    def _changed(self):
+        """Clear any cached selector results after the records change.
+
+        The spatial and citation indexes and the graph are dropped, to be
+        rebuilt on next use, once their pending changes make that cheaper.
+        """
+        if self._spatial is not None and self._spatial.stale():
+            self._spatial = None
+        if self._graph is not None and self._graph.stale():
+            self._graph = None
+        if self._citations is not None and self._citations.stale():
+            self._citations = None
+        if self._cache is not None:
+            self._cache.clear()
 
-        parts = pl.col("image").str.split_exact("@", 1)
-        passage_parts = pl.col("passage").str.split_exact(":", 4)
-        passage_work_parts = passage_parts.struct.field("field_3").str.split_exact(".", 2)
-        roi_parts = pl.col("roi").str.split_exact(",", 3)
+    def _frame(self, *columns: str) -> pl.DataFrame | pl.LazyFrame:
+        "Return the frame, first computing the derived column groups that hold `columns`."
+        groups = {COLUMN_GROUPS[column] for column in columns if column in COLUMN_GROUPS}
+        groups |= {DERIVED_DEPENDENCIES[group] for group in groups if group in DERIVED_DEPENDENCIES}
+        todo = [group for group in self._pending if group in groups]
+        if todo:
+            try:
+                frame = derive_columns(self._df, todo)
+            except pl.exceptions.PolarsError as exc:
+                raise ValueError(ROI_ERROR) from exc
+            if self.categorical and isinstance(frame, pl.DataFrame):
+                frame = encode_columns(frame, [column for group in todo for column in DERIVED_COLUMNS[group]])
+            self._df = order_columns(frame)
+            self._pending = [group for group in self._pending if group not in todo]
+        return self._df
+
+    @classmethod
+    @instrumented
+    def lazy(cls, data: pl.LazyFrame | pl.DataFrame):
+        """Create a DSE whose `df` is a polars LazyFrame.
+
+        Derived columns are added as lazy expressions, and every selector returns
+        a LazyFrame, so nothing is read or computed until the caller collects a
+        result (for example with `collect(engine="streaming")`). Invalid ROI
+        values are only reported when a query touching `x`, `y`, `w` or `h` is
+        collected.
+
+        Other columns, such as the derived columns of a saved snapshot or
+        `edition` and `source`, are kept; only derived columns that are missing
+        are computed. A frame with `pl.Categorical` URN columns makes a
+        categorical DSE.
+        """
+        frame = data.lazy()
+        schema = frame.collect_schema()
+        encoded = [column for column in CATEGORICAL_COLUMNS if isinstance(schema.get(column), pl.Categorical)]
+        frame = frame.with_columns(
+            pl.col(column).cast(pl.String)
+            for column in DSE_COLUMNS
+            if column not in encoded and schema.get(column) != pl.String
+        )
+        return cls._from_frame(order_columns(frame), categorical=bool(encoded))
+
+    @classmethod
+    @instrumented
+    def scan(cls, source: str | Path, separator: str = "|"):
+        "Create a lazy DSE by scanning a Parquet, Arrow IPC or delimited text file."
+        suffix = Path(source).suffix.lower()
+        if suffix == ".parquet":
+            frame = pl.scan_parquet(source)
+        elif suffix in (".arrow", ".ipc", ".feather"):
+            frame = pl.scan_ipc(source)
+        else:
+            frame = pl.scan_csv(source, separator=separator)
+        return cls.lazy(frame)
+
+    @property
+    def is_lazy(self) -> bool:
+        "True if this DSE holds a LazyFrame."
+        return isinstance(self._df, pl.LazyFrame)
+
+    @instrumented
+    def collect(self, **kwargs):
+        """Collect a lazy DSE into an eager DSE, validating ROI values; keyword arguments are passed to `LazyFrame.collect`.
+
+        The eager DSE keeps the `indexed` and `categorical` settings, and caches
+        its results in a cache of the same size if this DSE has one.
+        """
+        if not self.is_lazy:
+            return self
         try:
-            self.df = base_df.with_columns(
-                parts.struct.field("field_0").alias("wholeimage"),
-                parts.struct.field("field_1").alias("roi"),
-                passage_parts.struct.field("field_4").alias("passageref"),
-                passage_work_parts.struct.field("field_0").alias("group"),
-                passage_work_parts.struct.field("field_1").alias("work"),
-                passage_work_parts.struct.field("field_2").alias("version"),
-            ).with_columns(
-                pl.when(pl.col("roi").is_not_null())
-                .then(roi_parts.struct.field("field_0").cast(pl.Float64, strict=True))
-                .otherwise(None)
-                .alias("x"),
-                pl.when(pl.col("roi").is_not_null())
-                .then(roi_parts.struct.field("field_1").cast(pl.Float64, strict=True))
-                .otherwise(None)
-                .alias("y"),
-                pl.when(pl.col("roi").is_not_null())
-                .then(roi_parts.struct.field("field_2").cast(pl.Float64, strict=True))
-                .otherwise(None)
-                .alias("w"),
-                pl.when(pl.col("roi").is_not_null())
-                .then(roi_parts.struct.field("field_3").cast(pl.Float64, strict=True))
-                .otherwise(None)
-                .alias("h")
-            )
+            df = self.df.collect(**kwargs)
         except pl.exceptions.PolarsError as exc:
-            raise ValueError(
-                "Invalid ROI in image value: ROI must have four comma-separated numeric values (x,y,w,h)."
-            ) from exc
-
-        invalid_roi_rows = self.df.filter(
-            pl.col("roi").is_not_null()
-            & (
-                pl.col("x").is_null()
-                | pl.col("y").is_null()
-                | pl.col("w").is_null()
-                | pl.col("h").is_null()
+            raise ValueError(ROI_ERROR) from exc
+        check_rois(df)
+        if self.categorical:
+            df = encode_columns(df)
+        collected = DSE._from_frame(df, indexed=self.indexed, categorical=self.categorical)
+        if self._cache is not None:
+            collected.cache(self._cache.maxsize)
+        return collected
+
+    # Incremental updates:
+    @instrumented
+    def extend(self, rows):
+        """Append new DSE records to this DSE.
+
+        `rows` is anything the `DSE` constructor accepts, and may also hold values
+        for extra columns of this DSE such as `source`. Only the new rows are
+        derived and validated, and built indexes and the graph are extended with them.
+        """
+        if self.is_lazy:
+            raise ValueError("A lazy DSE cannot be extended; collect it first.")
+        base = rows if isinstance(rows, pl.DataFrame) else pl.DataFrame(rows)
+        added = DSE(base.select(DSE_COLUMNS))
+        current = self._df
+        offset = current.height
+        frame = added._frame(*(column for column in current.columns if column in COLUMN_GROUPS))
+        frame = frame.with_columns(
+            base.get_column(column) if column in base.columns else pl.lit(None, dtype=current.schema[column]).alias(column)
+            for column in current.columns
+            if column not in frame.columns
+        ).select(current.columns)
+
+        # Categorical columns take new values without re-encoding the existing
+        # rows; only an Enum column, such as `edition`, needs a wider dtype.
+        dtypes = {}
+        for column, dtype in current.schema.items():
+            if isinstance(dtype, pl.Enum):
+                known = dtype.categories
+                new = frame.get_column(column).drop_nulls().unique(maintain_order=True)
+                new = new.filter(~new.is_in(known.implode()))
+                if new.len() > 0:
+                    dtype = pl.Enum(pl.concat([known, new]))
+                    current = current.with_columns(pl.col(column).cast(dtype))
+            dtypes[column] = dtype
+        self._df = pl.concat([current, frame.cast(dtypes)])
+
+        for index in self._indexes.values():
+            index.extend(frame, offset)
+        for index in (self._spatial, self._citations):
+            if index is not None:
+                index.extend(frame, offset)
+        if self._graph is not None:
+            self._graph.extend(frame)
+        self._changed()
+        return self
+
+    @instrumented
+    def remove(self, predicate: pl.Expr):
+        """Remove the records for which the polars expression `predicate` is true.
+
+        Built indexes and the graph are updated in place rather than rebuilt.
+        """
+        if self.is_lazy:
+            raise ValueError("Records cannot be removed from a lazy DSE; collect it first.")
+        frame = self._frame(*predicate.meta.root_names())
+        mask = frame.select(predicate.fill_null(False)).to_series()
+        positions = mask.arg_true()
+        if positions.len() == 0:
+            return self
+        if self._graph is not None:
+            self._graph.remove(frame.filter(mask))
+        self._df = frame.filter(~mask)
+        for index in (*self._indexes.values(), self._spatial, self._citations):
+            if index is not None:
+                index.remove(positions)
+        self._changed()
+        return self
+
+    # Snapshots:
+    @instrumented
+    def save(self, path: str | Path, format: str = "ipc"):
+        """Save the derived frame and any built indexes to the directory `path`.
+
+        `format` is "ipc" (Arrow IPC, which `load` can memory-map) or "parquet".
+        A lazy DSE is streamed to disk without being collected.
+        """
+        if format not in SNAPSHOT_FORMATS:
+            raise ValueError(f"Unknown snapshot format {format!r}: expected one of {', '.join(SNAPSHOT_FORMATS)}.")
+        directory = Path(path)
+        directory.mkdir(parents=True, exist_ok=True)
+        framefile = directory / f"frame{SNAPSHOT_FORMATS[format]}"
+        if self.is_lazy:
+            if format == "ipc":
+                self.df.sink_ipc(framefile)
+            else:
+                self.df.sink_parquet(framefile)
+        elif format == "ipc":
+            self.df.write_ipc(framefile)
+        else:
+            self.df.write_parquet(framefile)
+
+        indexes = [] if self.is_lazy else list(self._indexes)
+        for column in indexes:
+            keys, positions = self._indexes[column].to_frames()
+            keys.write_ipc(directory / f"index-{column}.arrow")
+            positions.write_ipc(directory / f"index-{column}-rows.arrow")
+        manifest = {"format": format, "indexed": self.indexed, "categorical": self.categorical, "indexes": indexes}
+        (directory / "dse.json").write_text(json.dumps(manifest), encoding="utf-8")
+
+    @classmethod
+    @instrumented
+    def load(cls, path: str | Path, memory_map: bool = True):
+        """Load a DSE saved with `save` without re-deriving or re-validating its columns.
+
+        With `memory_map` True, Arrow IPC files are memory-mapped rather than read into memory.
+        """
+        directory = Path(path)
+        manifest = json.loads((directory / "dse.json").read_text(encoding="utf-8"))
+        framefile = directory / f"frame{SNAPSHOT_FORMATS[manifest['format']]}"
+        if manifest["format"] == "ipc":
+            df = pl.read_ipc(framefile, memory_map=memory_map)
+        else:
+            df = pl.read_parquet(framefile)
+
+        dse = cls._from_frame(df, indexed=manifest["indexed"], categorical=manifest.get("categorical", False))
+        for column in manifest["indexes"]:
+            dse._indexes[column] = ColumnIndex.from_frames(
+                pl.read_ipc(directory / f"index-{column}.arrow", memory_map=memory_map),
+                pl.read_ipc(directory / f"index-{column}-rows.arrow", memory_map=memory_map),
             )
-        )
-        if invalid_roi_rows.height > 0:
-            raise ValueError(
-                "Invalid ROI in image value: ROI must have four comma-separated numeric values (x,y,w,h)."
+        return dse
+
+    # Column indexes:
+    def index(self, column: str) -> ColumnIndex:
+        "Return the sorted index for `column`, building it on first use."
+        if self.is_lazy:
+            raise ValueError("Indexes are not available for a lazy DSE; collect it first.")
+        if column not in self._indexes:
+            self._indexes[column] = ColumnIndex.build(self._frame(column), column)
+        return self._indexes[column]
+
+    @instrumented
+    def build_indexes(self):
+        "Build indexes for the `passage`, `surface` and `wholeimage` columns now rather than on first use."
+        self.indexed = True
+        for column in INDEXED_COLUMNS:
+            self.index(column)
+        return self
+
+    # Selector cache:
+    def cache(self, maxsize: int = 128):
+        """Cache the results of inventories and selectors, keeping the `maxsize` most recently used.
+
+        Results are keyed by method and arguments, and the cache is cleared
+        whenever the records change through `df`, `extend` or `remove`.
+        Returns self.
+        """
+        self._cache = SelectorCache(maxsize)
+        return self
+
+    def cacheinfo(self) -> dict | None:
+        "Return the cache's hit and miss counts, size and `maxsize`, or None if results are not cached."
+        return None if self._cache is None else self._cache.info()
+
+    # Spatial index:
+    @instrumented
+    def spatialindex(self) -> SpatialIndex:
+        "Return the grid index of ROI rectangles, building it on first use."
+        if self.is_lazy:
+            raise ValueError("Indexes are not available for a lazy DSE; collect it first.")
+        if self._spatial is None:
+            self._spatial = SpatialIndex.build(self._frame("wholeimage", "x"))
+        return self._spatial
+
+    # Citation index:
+    @instrumented
+    def citationindex(self) -> CitationIndex:
+        "Return the index of passages in citation order, building it on first use."
+        if self.is_lazy:
+            raise ValueError("Indexes are not available for a lazy DSE; collect it first.")
+        if self._citations is None:
+            self._citations = CitationIndex.build(self._frame("passageref"))
+        return self._citations
+
+    def _citationrows(self, urn: str, *columns: str, edition=None):
+        """Select the rows whose passage a CTS URN contains, in citation order.
+
+        An eager DSE walks its citation index; a lazy DSE filters with
+        `ctsurn_contains` and sorts by citation key.
+        """
+        frame = self._frame("passageref", *columns)
+        if self.is_lazy:
+            rows = frame.filter(ctsurn_contains(pl.col("passage").cast(pl.String), urn)).sort(
+                pl.col("group", "work").cast(pl.String),
+                citation_key(pl.col("passageref").cast(pl.String)),
+                pl.col("version").cast(pl.String),
+                nulls_last=True,
+                maintain_order=True,
             )
+        else:
+            rows = frame[self.citationindex().rows(urn)]
+        return self._foredition(rows, edition)
+
+    # Graph of linked URNs:
+    @instrumented
+    def graph(self) -> DSEGraph:
+        "Return the graph of passages, surfaces and images linked by this DSE's records, building it on first use."
+        if self.is_lazy:
+            raise ValueError("The graph is not available for a lazy DSE; collect it first.")
+        if self._graph is None:
+            self._graph = DSEGraph.build(self._frame("wholeimage"))
+        return self._graph
+
+    def _rows(self, column: str, value: str, *columns: str, edition=None):
+        """Select rows where `column` equals `value`, using the column's index if this DSE is indexed.
+
+        Derived columns named in `columns` are computed first if needed. If
+        `edition` is given, only rows of that edition (or list of editions) are kept.
+        """
+        frame = self._frame(column, *columns)
+        if self.indexed and not self.is_lazy:
+            rows = frame[self.index(column).rows(value)]
+        else:
+            rows = frame.filter(pl.col(column) == value)
+        return self._foredition(rows, edition)
+
+    def _foredition(self, frame, edition):
+        "Keep the rows of `frame` belonging to `edition`, a single edition or a list of editions; None keeps all rows."
+        if edition is None:
+            return frame
+        check_editions(frame)
+        editions = [edition] if isinstance(edition, str) else list(edition)
+        return frame.filter(pl.col("edition").cast(pl.String).is_in(editions))
+
+    def _rowsfor(self, column: str, values, key: str, *outputs, normalize=None, edition=None):
+        """Select `outputs` for every row where `column` matches one of `values`, in a single join.
+
+        Each result row is tagged with the query value it matched in a `key` column.
+        Results follow the order of `values`, then the order of rows in the DSE.
+        """
+        keys = pl.DataFrame({key: list(values)}, schema={key: pl.String}).with_row_index("_query")
+        join_key = pl.col(key) if normalize is None else normalize(pl.col(key))
+        needed = [
+            name
+            for output in outputs
+            for name in ([output] if isinstance(output, str) else output.meta.root_names())
+        ]
+        frame = self._frame(column, *needed)
+        dtype = frame.collect_schema()[column]
+        keys = keys.with_columns(join_key.cast(dtype, strict=False).alias("_key"))
+        rows = self._foredition(frame.with_row_index("_row"), edition).select(
+            "_row", pl.col(column).alias("_key"), *outputs
+        )
+        if self.is_lazy:
+            keys = keys.lazy()
+        return (
+            keys.join(rows, on="_key", how="inner")
+            .sort("_query", "_row")
+            .drop("_query", "_row", "_key")
+        )
 
     @classmethod
-    def from_cex_file(cls, cexfile: str):
+    @instrumented
+    def from_cex_file(cls, cexfile: str, **kwargs):
         with open(cexfile, encoding="utf-8") as f:
             cex_text = f.read()
-        return cls.from_cex_text(cex_text)
+        return cls.from_cex_text(cex_text, **kwargs)
 
     @staticmethod
     def get_dse_urns(cex_text: str):
         "Extract DSE URNs from CEX data."
-        modelurn = "urn:cite2:cite:datamodels.v1:dsemodel"
-        modelblocks = CexBlock.from_text(cex_text, label = "datamodels")
-        nested = [dm.data for dm in modelblocks]
-        flattened = list(itertools.chain.from_iterable(nested) )
-        dsecollections = [row for row in flattened if modelurn in row]
-        dseurns = [row.split("|")[0] for row in dsecollections]
-        return dseurns
-    
+        return dse_urns(cex_text.split("\n"))
+
+    @classmethod
+    @instrumented
+    def from_cex_text(cls, cex_text: str, **kwargs):
+        "Create DSE from CEX data in a single pass over the text; keyword arguments are passed to the `DSE` constructor."
+        datamodels, relations, _ = parse_cex(cex_text.split("\n"))
+        return cls(dse_relations(datamodels, relations), **kwargs)
+
+    @classmethod
+    @instrumented
+    def from_cex_files(cls, cexfiles, workers: int | None = None, processes: bool = False, **kwargs):
+        """Create one DSE from many CEX files parsed in parallel.
+
+        Files are parsed in a pool of `workers` threads, or processes if
+        `processes` is True. `read_dse_relations` finds a file's blocks and
+        rows with polars expressions, which release the GIL, so threads parse
+        files in parallel; only reading each file into one string holds it.
+        Processes avoid the GIL entirely, but each starts an interpreter and
+        pickles its frame back. The partial frames are concatenated in the order of
+        `cexfiles` and derived and validated once, and each row is tagged with
+        the path of the file it came from in a `source` column. Other keyword
+        arguments are passed to the `DSE` constructor.
+        """
+        cexfiles = [str(cexfile) for cexfile in cexfiles]
+        if processes:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+        else:
+            executor = ThreadPoolExecutor(max_workers=workers)
+        with executor:
+            frames = list(executor.map(read_dse_relations, cexfiles))
+
+        tagged = [
+            frame.with_columns(pl.lit(cexfile, dtype=pl.String).alias("source"))
+            for cexfile, frame in zip(cexfiles, frames)
+        ]
+        if tagged:
+            combined = pl.concat(tagged)
+        else:
+            combined = pl.DataFrame(schema={**dict.fromkeys(DSE_COLUMNS, pl.String), "source": pl.String})
+        dse = cls(combined.select(DSE_COLUMNS), **kwargs)
+        dse._df = dse._df.with_columns(combined.get_column("source"))
+        return dse
+
+    @classmethod
+    @instrumented
+    def combine(cls, editions: dict, indexed: bool = False, categorical: bool = True):
+        """Combine the DSEs of several editions into one DSE with an `edition` column.
+
+        `editions` maps edition names to `DSE` objects. With `categorical` True,
+        URN columns are encoded with dictionaries shared by all editions, and
+        `edition` is a `pl.Enum` of the edition names in the order given.
+        """
+        frames = []
+        for name, dse in editions.items():
+            df = dse.collect().df
+            frames.append(
+                df.cast({column: pl.String for column, dtype in df.schema.items() if isinstance(dtype, pl.Enum)})
+                .with_columns(pl.lit(name, dtype=pl.String).alias("edition"))
+            )
+        if frames:
+            combined = pl.concat(frames, how="diagonal_relaxed")
+        else:
+            combined = DSE({"passage": [], "image": [], "surface": []}).df.with_columns(
+                pl.lit(None, dtype=pl.String).alias("edition")
+            )
+        if categorical:
+            combined = encode_columns(combined).with_columns(pl.col("edition").cast(pl.Enum(list(editions))))
+        return cls._from_frame(order_columns(combined), indexed=indexed, categorical=categorical)
 
     @classmethod
-    def from_cex_text(cls, cex_text: str):
-        "Create DSE from CEX data."
-        dseurns = cls.get_dse_urns(cex_text)
-
-        allrelationblocks = CexBlock.from_text(cex_text, label = "citerelationset")
-        dseblocks = [blk.data[3:] for blk in allrelationblocks if blk.data[0].replace('urn|','') in dseurns]
-        flattened = list(itertools.chain.from_iterable(dseblocks))
-        rows = [row for row in flattened if row.strip()]
-
-        if not rows:
-            return cls({"passage": [], "image": [], "surface": []})
-
-        parsed_rows = []
-        for row in rows:
-            columns = row.split("|")
-            if len(columns) != 3:
-                raise ValueError(
-                    "Invalid DSE relation row in CEX: expected 3 pipe-delimited fields (passage|image|surface)."
-                )
-            parsed_rows.append(columns)
-
-        dse_df = pl.DataFrame(parsed_rows, schema=["passage", "image", "surface"], orient="row")
-        return cls(dse_df)
+    @instrumented
+    def from_cex_stream(cls, cexfile: str | Path, batch_size: int = 100_000, limit: int | None = None, **kwargs):
+        """Create DSE from a CEX file read line by line in batches of `batch_size` relation rows.
+
+        Unlike `from_cex_file`, the file is never held in memory as a whole.
+        If `limit` is given, only the first `limit` DSE relation rows are read.
+        Other keyword arguments are passed to the `DSE` constructor.
+        """
+        frames = list(iter_dse_batches(cexfile, batch_size=batch_size, limit=limit))
+        if not frames:
+            return cls({"passage": [], "image": [], "surface": []}, **kwargs)
+        return cls(pl.concat(frames), **kwargs)
     
 
 
@@ -113,18 +557,24 @@ class DSE:
 
 
     # Inventory functions:
-    def surfaces(self):
+    @instrumented
+    @cached
+    def surfaces(self, edition=None):
         "Find unique list of surface references."
-        return self.df.select("surface").unique(maintain_order=True)
+        return self._foredition(self._frame(), edition).select("surface").unique(maintain_order=True)
 
-    def images(self):
+    @instrumented
+    @cached
+    def images(self, edition=None):
         "Find unique list of image references after dropping ROI values)."
-        wholeimages = self.df.select(pl.col("wholeimage").alias("image"))
+        wholeimages = self._foredition(self._frame("wholeimage"), edition).select(pl.col("wholeimage").alias("image"))
         return wholeimages.unique(maintain_order=True)
     
-    def texts(self):
+    @instrumented
+    @cached
+    def texts(self, edition=None):
         "Find unique list of passage references after dropping subrefs and matching to standard format."
-        texturns = self.df.with_columns(
+        texturns = self._foredition(self._frame(), edition).with_columns(
             droppassage_expr().alias("passage")
         ).select("passage")
         return texturns.unique(maintain_order=True)
@@ -138,64 +588,428 @@ class DSE:
 
     #S for I
     #S for P
-    def surfacesforimage(self, image):
+    @instrumented
+    @cached
+    def surfacesforimage(self, image, edition=None):
         "Find unique list of surface references for a given image."
         normalized_image = image.split("@", 1)[0]
-        surfaces = self.df.filter(pl.col("wholeimage") == normalized_image).select("surface")
+        surfaces = self._rows("wholeimage", normalized_image, edition=edition).select("surface")
         return surfaces.unique(maintain_order=True)
 
-    def surfacesforpassage(self, passage):
+    @instrumented
+    @cached
+    def surfacesforpassage(self, passage, edition=None):
         "Find surface references for a given passage."
-        surfaces = self.df.filter(pl.col("passage") == passage).select("surface")
+        surfaces = self._rows("passage", passage, edition=edition).select("surface")
         return surfaces    
 
 
+    @instrumented
+    @cached
+    def passagesforcitation(self, urn, edition=None):
+        "Find the unique passage references a CTS URN contains, such as a chapter or a whole work, in citation order."
+        passages = self._citationrows(urn, edition=edition).select("passage")
+        return passages.unique(maintain_order=True)
+
+    @instrumented
+    @cached
+    def surfacesforcitation(self, urn, edition=None):
+        "Find the unique surface references of the passages a CTS URN contains, in citation order."
+        surfaces = self._citationrows(urn, edition=edition).select("surface")
+        return surfaces.unique(maintain_order=True)
+
     #I for S
     #I for P  
-    def imagesforpassage(self, passage):
+    @instrumented
+    @cached
+    def imagesforpassage(self, passage, edition=None):
         "Find image references for a given passage."
-        images = self.df.filter(pl.col("passage") == passage).select("image")
+        images = self._rows("passage", passage, edition=edition).select("image")
         return images
     
-    def imagesforsurface(self, surface):
+    @instrumented
+    @cached
+    def imagesforsurface(self, surface, edition=None):
         "Find image references for a given surface."
-        images = self.df.filter(pl.col("surface") == surface).select("image")
+        images = self._rows("surface", surface, edition=edition).select("image")
         return images
     
     # Whole I for S
     # Whole I for P
-    def wholeimagesforsurface(self, surface):
+    @instrumented
+    @cached
+    def wholeimagesforsurface(self, surface, edition=None):
         "Find unique list of whole image references for a given surface."
-        wholeimages = self.df.filter(pl.col("surface") == surface).select("wholeimage")
+        wholeimages = self._rows("surface", surface, "wholeimage", edition=edition).select("wholeimage")
         return wholeimages.unique(maintain_order=True)
-    def wholeimagesforpassage(self, passage):
+    @instrumented
+    @cached
+    def wholeimagesforpassage(self, passage, edition=None):
         "Find unique list of whole image references for a given passage."
-        wholeimages = self.df.filter(pl.col("passage") == passage).select("wholeimage")
+        wholeimages = self._rows("passage", passage, "wholeimage", edition=edition).select("wholeimage")
         return wholeimages.unique(maintain_order=True)
     
-    def rectsforsurface(self, surface):
+    @instrumented
+    @cached
+    def imagesforcitation(self, urn, edition=None):
+        "Find the passage and image references of the passages a CTS URN contains, in citation order."
+        return self._citationrows(urn, edition=edition).select("passage", "image")
+
+    @instrumented
+    @cached
+    def wholeimagesforcitation(self, urn, edition=None):
+        "Find the unique whole image references of the passages a CTS URN contains, in citation order."
+        wholeimages = self._citationrows(urn, "wholeimage", edition=edition).select("wholeimage")
+        return wholeimages.unique(maintain_order=True)
+
+    @instrumented
+    @cached
+    def rectsforsurface(self, surface, edition=None):
         "Find unique list of rectangles for a given surface."
-        rects = self.df.filter(pl.col("surface") == surface).select(
+        rects = self._rows("surface", surface, "x", "y", "w", "h", edition=edition).select(
             pl.struct(["x", "y", "w", "h"]).alias("rect")
         )
         return rects.unique(maintain_order=True)
     
     #P for S
     #P for I
-    def passagesforsurface(self, surface):
+    @instrumented
+    @cached
+    def passagesforsurface(self, surface, edition=None):
         "Find unique list of passage references for a given surface."
-        passages = self.df.filter(pl.col("surface") == surface).with_columns(
+        passages = self._rows("surface", surface, edition=edition).with_columns(
             pl.col("passage")).select("passage")
         return passages.unique(maintain_order=True)
     
-    def passagesforimage(self, image):
+    @instrumented
+    @cached
+    def passagesforimage(self, image, edition=None):
         "Find unique list of passage references for a given image."
-        passages = self.df.filter(pl.col("wholeimage") == image).select("passage")
+        passages = self._rows("wholeimage", image, edition=edition).select("passage")
         return passages
 
+    #
+    # Batch selection functions: one join for a list of query values,
+    # tagged with the query value in the first column.
+    #
+    @instrumented
+    @cached
+    def surfacesforimages(self, images, edition=None):
+        "Find unique surface references for each of a list of images."
+        return self._rowsfor(
+            "wholeimage", images, "image", "surface", normalize=strip_roi, edition=edition
+        ).unique(maintain_order=True)
+
+    @instrumented
+    @cached
+    def surfacesforpassages(self, passages, edition=None):
+        "Find surface references for each of a list of passages."
+        return self._rowsfor("passage", passages, "passage", "surface", edition=edition)
+
+    @instrumented
+    @cached
+    def imagesforpassages(self, passages, edition=None):
+        "Find image references for each of a list of passages."
+        return self._rowsfor("passage", passages, "passage", "image", edition=edition)
+
+    @instrumented
+    @cached
+    def imagesforsurfaces(self, surfaces, edition=None):
+        "Find image references for each of a list of surfaces."
+        return self._rowsfor("surface", surfaces, "surface", "image", edition=edition)
+
+    @instrumented
+    @cached
+    def wholeimagesforsurfaces(self, surfaces, edition=None):
+        "Find unique whole image references for each of a list of surfaces."
+        return self._rowsfor("surface", surfaces, "surface", "wholeimage", edition=edition).unique(maintain_order=True)
+
+    @instrumented
+    @cached
+    def wholeimagesforpassages(self, passages, edition=None):
+        "Find unique whole image references for each of a list of passages."
+        return self._rowsfor("passage", passages, "passage", "wholeimage", edition=edition).unique(maintain_order=True)
+
+    @instrumented
+    @cached
+    def rectsforsurfaces(self, surfaces, edition=None):
+        "Find unique rectangles for each of a list of surfaces."
+        return self._rowsfor(
+            "surface", surfaces, "surface", pl.struct(["x", "y", "w", "h"]).alias("rect"), edition=edition
+        ).unique(maintain_order=True)
+
+    @instrumented
+    @cached
+    def passagesforsurfaces(self, surfaces, edition=None):
+        "Find unique passage references for each of a list of surfaces."
+        return self._rowsfor("surface", surfaces, "surface", "passage", edition=edition).unique(maintain_order=True)
+
+    @instrumented
+    @cached
+    def passagesforimages(self, images, edition=None):
+        "Find passage references for each of a list of whole images."
+        return self._rowsfor("wholeimage", images, "image", "passage", edition=edition)
+
+    #
+    # Spatial queries:
+    #
+    @instrumented
+    @cached
+    def roisforpoint(self, image, x, y, edition=None):
+        """Find the records on `image` whose ROI contains the point (x,y).
+
+        Returns the same rows as filtering the frame on `wholeimage` and
+        `ptinrect(x, y)`, but an eager DSE only tests the rows listed in the
+        cells of its spatial index that hold the point.
+        """
+        normalized_image = image.split("@", 1)[0]
+        frame = self._frame("wholeimage", "x")
+        if self.is_lazy:
+            rows = frame.filter((pl.col("wholeimage") == normalized_image) & ptinrect(x, y))
+        else:
+            rows = frame[self.spatialindex().pointcandidates(normalized_image, x, y)].filter(ptinrect(x, y))
+        return self._foredition(rows, edition)
+
+    @instrumented
+    @cached
+    def roisforrect(self, image, x, y, w, h, edition=None):
+        """Find the records on `image` whose ROI intersects the rectangle (x,y,w,h), such as a viewport.
+
+        Returns the same rows as filtering the frame on `wholeimage` and
+        `rectsintersect(x, y, w, h)`, using the spatial index of an eager DSE.
+        """
+        normalized_image = image.split("@", 1)[0]
+        frame = self._frame("wholeimage", "x")
+        if self.is_lazy:
+            rows = frame.filter((pl.col("wholeimage") == normalized_image) & rectsintersect(x, y, w, h))
+        else:
+            candidates = self.spatialindex().rectcandidates(normalized_image, x, y, w, h)
+            rows = frame[candidates].filter(rectsintersect(x, y, w, h))
+        return self._foredition(rows, edition)
+
+    @instrumented
+    def roisforpoints(self, points, edition=None):
+        """Match every point of a frame with `image`, `px` and `py` columns to the records whose ROI contains it.
+
+        Returns the columns of `points` followed by the matching records'
+        `passage`, `surface` and `roi`, in the order of `points` and then of the
+        DSE. Points are joined to ROIs on image and grid cell (see
+        `points_in_rois`), so the work grows with the number of points and
+        ROIs rather than their product.
+        """
+        if not isinstance(points, (pl.DataFrame, pl.LazyFrame)):
+            points = pl.DataFrame(points)
+        return points_in_rois(points, self._foredition(self._frame("wholeimage", "x"), edition))
+
+    @instrumented
+    @cached
+    def roioverlaps(self, other=None, edition=None, otheredition=None):
+        """Find pairs of records whose ROIs on the same image overlap, with their intersection area and IoU.
+
+        With no `other` DSE or `otheredition`, overlapping ROIs within this DSE
+        (or `edition` of it) are paired, as a check for duplicate or
+        overlapping regions. Otherwise records of this DSE are paired with the
+        records of `other` (or of `otheredition` of this DSE) whose ROIs they
+        overlap, for example to align passages of two editions indexed on the
+        same images. See `roi_overlaps`.
+        """
+        left = self._foredition(self._frame("wholeimage", "x"), edition)
+        if other is None and otheredition is None:
+            return roi_overlaps(left)
+        other = self if other is None else other
+        right = other._foredition(other._frame("wholeimage", "x"), otheredition)
+        return roi_overlaps(left, right)
+
+    @instrumented
+    @cached
+    def roicoverage(self, edition=None):
+        "Count the ROIs on each image, with their total area and the area of their union (see `roi_coverage`)."
+        return roi_coverage(self._foredition(self._frame("wholeimage", "x"), edition))
+
+    #
+    # Cross-edition functions for DSEs built with `combine`:
+    #
+    @instrumented
+    @cached
+    def editions(self):
+        "Find unique list of editions."
+        frame = self._frame()
+        check_editions(frame)
+        return frame.select("edition").unique(maintain_order=True)
+
+    @instrumented
+    @cached
+    def editionsforimage(self, image):
+        "Find unique list of editions indexing a given image."
+        normalized_image = image.split("@", 1)[0]
+        frame = self._rows("wholeimage", normalized_image)
+        check_editions(frame)
+        return frame.select("edition").unique(maintain_order=True)
+
+    @instrumented
+    @cached
+    def editionsforpassage(self, passage):
+        "Find unique list of editions indexing a given passage."
+        frame = self._rows("passage", passage)
+        check_editions(frame)
+        return frame.select("edition").unique(maintain_order=True)
+
+    @instrumented
+    @cached
+    def editionsforsurface(self, surface):
+        "Find unique list of editions indexing a given surface."
+        frame = self._rows("surface", surface)
+        check_editions(frame)
+        return frame.select("edition").unique(maintain_order=True)
+
+    @instrumented
+    @cached
+    def editionsforimages(self, images):
+        "Find unique editions indexing each of a list of images."
+        check_editions(self._frame())
+        return self._rowsfor(
+            "wholeimage", images, "image", "edition", normalize=strip_roi
+        ).unique(maintain_order=True)
+
+
+def check_editions(frame: pl.DataFrame | pl.LazyFrame) -> None:
+    "Raise a ValueError if a frame has no `edition` column."
+    if "edition" not in frame.collect_schema().names():
+        raise ValueError("This DSE has no edition column; use DSE.combine to build a multi-edition DSE.")
+
 
 def droppassage_expr():
     """Returns a Polars expression to drop passage components from `passage`."""
-    return pl.col("passage").str.replace(passagecomponent_re, ":")
+    return pl.col("passage").cast(pl.String).str.replace(passagecomponent_re, ":")
+
+
+def cite2_columns(column: str, prefix: str) -> list[pl.Expr]:
+    "Expressions splitting a CITE2 URN column into namespace, collection, version and object columns named with `prefix`."
+    urn_parts = pl.col(column).cast(pl.String).str.split_exact(":", 4)
+    collection_parts = urn_parts.struct.field("field_3").str.split_exact(".", 1)
+    return [
+        urn_parts.struct.field("field_2").alias(f"{prefix}namespace"),
+        collection_parts.struct.field("field_0").alias(f"{prefix}collection"),
+        collection_parts.struct.field("field_1").alias(f"{prefix}version"),
+        urn_parts.struct.field("field_4").alias(f"{prefix}object"),
+    ]
+
+
+def image_columns() -> list[pl.Expr]:
+    "Expressions splitting `image` into `wholeimage` and `roi` columns."
+    parts = pl.col("image").cast(pl.String).str.split_exact("@", 1)
+    return [
+        parts.struct.field("field_0").alias("wholeimage"),
+        parts.struct.field("field_1").alias("roi"),
+    ]
+
+
+def passage_columns() -> list[pl.Expr]:
+    "Expressions splitting the CTS URN in `passage` into `passageref`, `group`, `work` and `version` columns."
+    passage_parts = pl.col("passage").cast(pl.String).str.split_exact(":", 4)
+    passage_work_parts = passage_parts.struct.field("field_3").str.split_exact(".", 2)
+    return [
+        passage_parts.struct.field("field_4").alias("passageref"),
+        passage_work_parts.struct.field("field_0").alias("group"),
+        passage_work_parts.struct.field("field_1").alias("work"),
+        passage_work_parts.struct.field("field_2").alias("version"),
+    ]
 
 
+def roi_columns() -> list[pl.Expr]:
+    "Expressions parsing `roi` into numeric `x`, `y`, `w` and `h` columns."
+    roi_parts = pl.col("roi").str.split_exact(",", 3)
+    return [
+        pl.when(pl.col("roi").is_not_null())
+        .then(roi_parts.struct.field(f"field_{i}").cast(pl.Float64, strict=True))
+        .otherwise(None)
+        .alias(name)
+        for i, name in enumerate(["x", "y", "w", "h"])
+    ]
+
+
+def urn_component_columns() -> list[pl.Expr]:
+    "Expressions splitting the CITE2 URNs in `surface` and `wholeimage` into component columns."
+    return [*cite2_columns("surface", "surface"), *cite2_columns("wholeimage", "image")]
+
+
+# Derived columns are computed in groups, in this order.
+DERIVED_COLUMNS = {
+    "image": ["wholeimage", "roi"],
+    "passage": ["passageref", "group", "work", "version"],
+    "roi": ["x", "y", "w", "h"],
+    "cite2": [
+        "surfacenamespace", "surfacecollection", "surfaceversion", "surfaceobject",
+        "imagenamespace", "imagecollection", "imageversion", "imageobject",
+    ],
+}
+DERIVED_EXPRESSIONS = {
+    "image": image_columns,
+    "passage": passage_columns,
+    "roi": roi_columns,
+    "cite2": urn_component_columns,
+}
+DERIVED_DEPENDENCIES = {"roi": "image", "cite2": "image"}
+COLUMN_GROUPS = {column: group for group, columns in DERIVED_COLUMNS.items() for column in columns}
+
+
+@instrumented
+def derive_columns(frame: pl.DataFrame | pl.LazyFrame, groups=None) -> pl.DataFrame | pl.LazyFrame:
+    """Add image, ROI, CTS URN component and CITE2 URN component columns derived from the `passage`, `image` and `surface` columns.
+
+    `groups` limits the result to some of the keys of `DERIVED_COLUMNS`; a
+    group's dependencies must already be present or come earlier in `groups`.
+    """
+    for group in DERIVED_COLUMNS if groups is None else groups:
+        frame = frame.with_columns(DERIVED_EXPRESSIONS[group]())
+    return frame
+
+
+def pending_groups(frame: pl.DataFrame | pl.LazyFrame) -> list[str]:
+    "Find the groups of derived columns that are missing from a frame."
+    names = set(frame.collect_schema().names())
+    return [group for group, columns in DERIVED_COLUMNS.items() if not names.issuperset(columns)]
+
+
+def order_columns(frame: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    "Put a frame's columns in the standard order: DSE columns, derived columns, then any others."
+    names = frame.collect_schema().names()
+    derived = [column for column in COLUMN_GROUPS if column in names]
+    others = [column for column in names if column not in DSE_COLUMNS and column not in COLUMN_GROUPS]
+    return frame.select(*DSE_COLUMNS, *derived, *others)
+
+
+@instrumented
+def encode_columns(df: pl.DataFrame, columns=None) -> pl.DataFrame:
+    """Store URN and URN component columns as `pl.Categorical` columns.
+
+    These columns are kept as integer codes into a dictionary that grows as
+    values are added, so equality filters and joins on them compare integers
+    rather than strings, and appending records never re-encodes the
+    existing rows. `columns` limits encoding
+    to some of the columns in `CATEGORICAL_COLUMNS`. Columns that are
+    already encoded are left as they are.
+    """
+    return df.with_columns(
+        pl.col(column).cast(pl.Categorical)
+        for column, dtype in df.schema.items()
+        if column in CATEGORICAL_COLUMNS
+        and (columns is None or column in columns)
+        and not isinstance(dtype, (pl.Enum, pl.Categorical))
+    )
+
+
+@instrumented
+def check_rois(df: pl.DataFrame) -> None:
+    "Raise a ValueError if any row has an ROI without four numeric values."
+    invalid_roi_rows = df.filter(
+        pl.col("roi").is_not_null()
+        & (
+            pl.col("x").is_null()
+            | pl.col("y").is_null()
+            | pl.col("w").is_null()
+            | pl.col("h").is_null()
+        )
+    )
+    if invalid_roi_rows.height > 0:
+        raise ValueError(ROI_ERROR)
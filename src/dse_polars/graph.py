@@ -0,0 +1,335 @@
+import polars as pl
+
+from .index import ColumnIndex, compaction_due
+
+# Node kinds and the DSE columns holding their URNs.
+NODE_COLUMNS = {"passage": "passage", "surface": "surface", "image": "wholeimage"}
+EDGE_COLUMNS = [("passage", "surface"), ("passage", "wholeimage"), ("surface", "wholeimage")]
+
+
+class DSEGraph:
+    """Graph of the passages, surfaces and images of a DSE, linked when they appear in the same record.
+
+    URNs are interned to dense integer node IDs (passages first, then
+    surfaces, then images, each in order of first appearance), and each
+    node's neighbors are stored in compressed sparse row (CSR) form: the
+    neighbors of node `i` are `indices[indptr[i]:indptr[i + 1]]`, in order of
+    ID. Queries take and return URNs.
+
+    `weights` counts the records linking each pair of nodes, and `records`
+    the records holding each node. `extend` and `remove` keep changes to both
+    apart and apply them at query time: nodes first seen in `extend` take the
+    next IDs, and nodes and links left in no record are skipped, until
+    `stale` says the graph is worth rebuilding.
+    """
+
+    def __init__(self, nodes: pl.DataFrame, indptr: pl.Series, indices: pl.Series, weights: pl.Series, records: pl.Series):
+        self.nodes = nodes
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.records = records
+        self._lookup = None
+        self._newnodes = nodes.clear()
+        self._edgechanges = pl.DataFrame(schema={"src": pl.UInt32, "dst": pl.UInt32, "change": pl.Int64})
+        self._recordchanges = pl.DataFrame(schema={"id": pl.UInt32, "change": pl.Int64})
+
+    @classmethod
+    def build(cls, df: pl.DataFrame):
+        "Build the graph of a dataframe with `passage`, `surface` and `wholeimage` columns."
+        nodes = (
+            _node_values(df)
+            .group_by("urn", "kind", maintain_order=True)
+            .len()
+            .with_row_index("id")
+        )
+        kinds = {column: kind for kind, column in NODE_COLUMNS.items()}
+        ids = {
+            kind: nodes.filter(pl.col("kind") == kind).select("urn", "id")
+            for kind in NODE_COLUMNS
+        }
+        links = []
+        for source, target in EDGE_COLUMNS:
+            pairs = (
+                df.select(pl.col(source).cast(pl.String).alias("_source"), pl.col(target).cast(pl.String).alias("_target"))
+                .drop_nulls()
+                .group_by("_source", "_target")
+                .len()
+                .join(ids[kinds[source]].rename({"id": "src"}), left_on="_source", right_on="urn")
+                .join(ids[kinds[target]].rename({"id": "dst"}), left_on="_target", right_on="urn")
+                .select("src", "dst", "len")
+            )
+            links.extend([pairs, pairs.select(pl.col("dst").alias("src"), pl.col("src").alias("dst"), "len")])
+        edges = pl.concat(links).sort("src", "dst")
+
+        degrees = (
+            nodes.select("id")
+            .join(edges.group_by("src").len(), left_on="id", right_on="src", how="left", maintain_order="left")
+            .get_column("len")
+            .fill_null(0)
+        )
+        indptr = pl.concat([pl.Series([0], dtype=pl.UInt32), degrees.cum_sum().cast(pl.UInt32)])
+        return cls(
+            nodes.select("id", "urn", "kind"),
+            indptr,
+            edges.get_column("dst"),
+            edges.get_column("len").alias("weight"),
+            nodes.get_column("len").alias("records"),
+        )
+
+    def __len__(self) -> int:
+        return int((self._records() > 0).sum())
+
+    def _allnodes(self) -> pl.DataFrame:
+        "The `id`, `urn` and `kind` of every node, including those added by `extend`."
+        if self._newnodes.height == 0:
+            return self.nodes
+        return pl.concat([self.nodes, self._newnodes], rechunk=False)
+
+    def _records(self) -> pl.Series:
+        "Number of records holding each node, by ID, with pending changes applied."
+        records = pl.concat([self.records.cast(pl.Int64), pl.zeros(self._newnodes.height, pl.Int64, eager=True)])
+        if self._recordchanges.height == 0:
+            return records
+        ids = self._recordchanges.get_column("id")
+        return records.scatter(ids, records.gather(ids) + self._recordchanges.get_column("change"))
+
+    def _alive(self, ids: pl.Series) -> pl.Series:
+        "Keep the node `ids` that some record still holds."
+        if self._recordchanges.height == 0:
+            return ids
+        built = self.records.len()
+        changed = self._recordchanges.filter(pl.col("id").is_in(ids.implode()))
+        if built:
+            base = self.records.gather(changed.get_column("id").clip(upper_bound=built - 1)).cast(pl.Int64)
+        else:
+            base = pl.zeros(changed.height, pl.Int64, eager=True)
+        # Nodes added since the graph was built start from no records.
+        records = pl.col("change") + pl.when(pl.col("id") < built).then(base).otherwise(0)
+        dead = changed.filter(records <= 0).get_column("id")
+        return ids.filter(~ids.is_in(dead.implode()))
+
+    def _lookupindex(self) -> ColumnIndex:
+        "Index of node IDs by kind and URN, built on first use."
+        if self._lookup is None:
+            self._lookup = ColumnIndex.build(self._allnodes().select(_node_key()), "node")
+        return self._lookup
+
+    def ids(self, urns, kind: str | None = None) -> pl.Series:
+        "Node IDs of a list of URNs, optionally only those of nodes of one `kind`; unknown URNs are skipped."
+        kinds = list(NODE_COLUMNS) if kind is None else [kind]
+        urns = list(urns)
+        keys = [f"{name}|{urn}" for name in kinds for urn in urns]
+        ids = self._lookupindex().rowsfor(keys).get_column("row").alias("id")
+        return self._alive(ids.unique().sort())
+
+    def urns(self, ids: pl.Series) -> pl.DataFrame:
+        "Map node IDs back to a dataframe of `urn` and `kind` values."
+        return self._allnodes().select("urn", "kind")[ids]
+
+    def _neighborids(self, ids: pl.Series) -> pl.Series:
+        "IDs of all neighbors of the nodes `ids`, with repeats."
+        built = ids.filter(ids < self.indptr.len() - 1)
+        runs = pl.DataFrame({"src": built, "start": self.indptr.gather(built), "stop": self.indptr.gather(built + 1)})
+        positions = (
+            runs.select("src", pl.int_ranges("start", "stop", dtype=pl.UInt32).alias("position"))
+            .explode("position")
+            .drop_nulls()
+        )
+        if self._edgechanges.height == 0:
+            return self.indices.gather(positions.get_column("position"))
+        position = positions.get_column("position")
+        edges = pl.concat(
+            [
+                positions.select(
+                    "src",
+                    self.indices.gather(position).alias("dst"),
+                    self.weights.gather(position).cast(pl.Int64).alias("change"),
+                ),
+                self._edgechanges.filter(pl.col("src").is_in(ids.implode())),
+            ]
+        )
+        return (
+            edges.group_by("src", "dst")
+            .agg(pl.col("change").sum())
+            .filter(pl.col("change") > 0)
+            .get_column("dst")
+        )
+
+    def _edges(self) -> pl.DataFrame:
+        "Every directed edge of the graph as `src` and `dst` node IDs, with pending changes applied."
+        built = pl.Series("src", range(self.indptr.len() - 1), dtype=pl.UInt32)
+        edges = pl.DataFrame(
+            {
+                "src": built.repeat_by(self.indptr.diff().drop_nulls()).explode().drop_nulls(),
+                "dst": self.indices,
+                "change": self.weights.cast(pl.Int64),
+            }
+        )
+        if self._edgechanges.height:
+            edges = (
+                pl.concat([edges, self._edgechanges])
+                .group_by("src", "dst")
+                .agg(pl.col("change").sum())
+                .filter(pl.col("change") > 0)
+            )
+        return edges.select("src", "dst")
+
+    def neighbors(self, urns, kind: str | None = None) -> pl.DataFrame:
+        "Find the nodes linked to any of a list of URNs, optionally only those of one `kind`, in order of node ID."
+        found = self._allnodes()[self._neighborids(self.ids(urns)).unique().sort()]
+        if kind is not None:
+            found = found.filter(pl.col("kind") == kind)
+        return found.select("urn", "kind")
+
+    def expand(self, urns, hops: int = 1, kind: str | None = None) -> pl.DataFrame:
+        """Find the nodes reachable from a list of URNs in at most `hops` steps.
+
+        Returns `urn`, `kind` and the number of `hops` to reach each node, with
+        the starting nodes at 0 hops, ordered by hops and then node ID. If
+        `kind` is given, only nodes of that kind are returned. Each step expands
+        the whole frontier at once.
+        """
+        frontier = self.ids(urns)
+        visited = frontier
+        levels = [pl.DataFrame({"id": frontier, "hops": pl.Series([0] * frontier.len(), dtype=pl.UInt32)})]
+        for hop in range(1, hops + 1):
+            if frontier.len() == 0:
+                break
+            reached = self._neighborids(frontier).unique()
+            frontier = reached.filter(~reached.is_in(visited.implode())).sort()
+            visited = pl.concat([visited, frontier])
+            levels.append(pl.DataFrame({"id": frontier, "hops": pl.Series([hop] * frontier.len(), dtype=pl.UInt32)}))
+        found = pl.concat(levels).sort("hops", "id")
+        found = pl.concat([found, self.urns(found.get_column("id"))], how="horizontal")
+        if kind is not None:
+            found = found.filter(pl.col("kind") == kind)
+        return found.select("urn", "kind", "hops")
+
+    def componentids(self) -> pl.Series:
+        """Label every node with the number of its connected component.
+
+        Labels are found by propagating the smallest node ID along all edges
+        at once, with pointer jumping, until no label changes. Components are
+        numbered from 0 in order of their smallest node ID. Nodes no record
+        holds any longer are labelled null.
+        """
+        ids = pl.Series("id", range(self._allnodes().height), dtype=pl.UInt32)
+        edges = self._edges()
+        # Each node is its own neighbor, so that every node gets a label in every round.
+        sources = pl.concat([edges.get_column("src"), ids])
+        targets = pl.concat([edges.get_column("dst"), ids])
+        labels = ids
+        while True:
+            updated = (
+                pl.DataFrame({"id": sources, "label": labels.gather(targets)})
+                .group_by("id")
+                .agg(pl.col("label").min())
+                .sort("id")
+                .get_column("label")
+            )
+            updated = updated.gather(updated)
+            if updated.equals(labels):
+                break
+            labels = updated
+        if self._recordchanges.height:
+            labels = pl.select(pl.when(self._records() > 0).then(labels)).to_series()
+        return (labels.rank("dense").cast(pl.UInt32) - 1).alias("id")
+
+    def components(self) -> pl.DataFrame:
+        "Return every node's `urn` and `kind` with the number of its connected `component`."
+        return (
+            self._allnodes()
+            .select("urn", "kind", self.componentids().alias("component"))
+            .drop_nulls("component")
+        )
+
+    def component(self, urn: str) -> pl.DataFrame:
+        "Find the `urn` and `kind` of every node connected to a URN, in order of node ID."
+        ids = self.ids([urn])
+        if ids.len() == 0:
+            return self.nodes.clear().select("urn", "kind")
+        components = self.componentids()
+        return self._allnodes().filter(components == components[ids[0]]).select("urn", "kind")
+
+    # Incremental updates:
+    def pending(self) -> int:
+        "Number of node and link changes not yet built into the CSR arrays."
+        return self._newnodes.height + self._edgechanges.height + self._recordchanges.height
+
+    def stale(self) -> bool:
+        "True once enough records have been added or removed that the graph is worth rebuilding."
+        return compaction_due(self.pending(), self.indices.len())
+
+    def extend(self, df: pl.DataFrame):
+        "Add the nodes and links of the records in `df`, a dataframe with `passage`, `surface` and `wholeimage` columns."
+        self._apply(df, 1)
+
+    def remove(self, df: pl.DataFrame):
+        "Take away the links of the records in `df`, which must all be in the graph."
+        self._apply(df, -1)
+
+    def _apply(self, df: pl.DataFrame, sign: int):
+        "Count the records of `df` towards each node and link, `sign` times."
+        nodes = (
+            _node_values(df)
+            .group_by("urn", "kind", maintain_order=True)
+            .len()
+            .with_columns(_node_key())
+        )
+        found = self._lookupindex().rowsfor(nodes.get_column("node")).rename({"value": "node", "row": "id"})
+        nodes = nodes.join(found, on="node", how="left", maintain_order="left")
+        unknown = pl.col("id").is_null()
+        if nodes.select(unknown.any()).item():
+            # New nodes take the next IDs, passages first, then surfaces, then images.
+            start = self._allnodes().height
+            nodes = nodes.with_columns(
+                pl.when(unknown).then(start + unknown.cum_sum() - 1).otherwise(pl.col("id")).cast(pl.UInt32).alias("id")
+            )
+            added = nodes.filter(pl.col("id") >= start)
+            self._newnodes = pl.concat([self._newnodes, added.select("id", "urn", "kind")])
+            self._lookupindex().extend(added.select("node"), start)
+        self._recordchanges = _add_changes(
+            self._recordchanges, nodes.select("id", (pl.col("len").cast(pl.Int64) * sign).alias("change")), ["id"]
+        )
+
+        kinds = {column: kind for kind, column in NODE_COLUMNS.items()}
+        links = []
+        for source, target in EDGE_COLUMNS:
+            pairs = (
+                df.select(pl.col(source).cast(pl.String).alias("_source"), pl.col(target).cast(pl.String).alias("_target"))
+                .drop_nulls()
+                .group_by("_source", "_target")
+                .len()
+                .join(_kind_ids(nodes, kinds[source]).rename({"id": "src"}), left_on="_source", right_on="urn")
+                .join(_kind_ids(nodes, kinds[target]).rename({"id": "dst"}), left_on="_target", right_on="urn")
+                .select("src", "dst", (pl.col("len").cast(pl.Int64) * sign).alias("change"))
+            )
+            links.extend([pairs, pairs.select(pl.col("dst").alias("src"), pl.col("src").alias("dst"), "change")])
+        self._edgechanges = _add_changes(self._edgechanges, pl.concat(links), ["src", "dst"])
+
+
+def _node_values(df: pl.DataFrame) -> pl.DataFrame:
+    "The `urn` and `kind` of every node value of a dataframe, passages first, then surfaces, then images."
+    return pl.concat(
+        [
+            df.select(pl.col(column).cast(pl.String).alias("urn"), pl.lit(kind).alias("kind"))
+            for kind, column in NODE_COLUMNS.items()
+        ]
+    ).drop_nulls()
+
+
+def _node_key() -> pl.Expr:
+    "Polars expression for the key a node is looked up by, its kind and URN."
+    return pl.concat_str("kind", "urn", separator="|").alias("node")
+
+
+def _kind_ids(nodes: pl.DataFrame, kind: str) -> pl.DataFrame:
+    "The `urn` and `id` of the nodes of one `kind`."
+    return nodes.filter(pl.col("kind") == kind).select("urn", "id")
+
+
+def _add_changes(changes: pl.DataFrame, more: pl.DataFrame, on: list[str]) -> pl.DataFrame:
+    "Sum two frames of `change` counts keyed by the columns `on`."
+    # Changes that cancel out are kept: a node added and removed again is in no record.
+    return pl.concat([changes, more.cast(changes.schema)]).group_by(on, maintain_order=True).agg(pl.col("change").sum())
@@ -1,5 +1,6 @@
 from dataclasses import dataclass
 import polars as pl
+from .instrument import instrumented
 
 @dataclass
 class CitableIIIFService:
@@ -49,6 +50,7 @@ class CitableIIIFService:
 
 
 
+@instrumented
 def rois(df: pl.DataFrame):
     "Return a python list of all ROIs in the dataframe, as strings."
     return df.select("roi").filter(pl.col("roi").is_not_null()).to_series().to_list()
@@ -74,4 +76,14 @@ def ptinrect(x: float |  pl.Expr, y: float | pl.Expr) -> pl.Expr:
         & (x_expr <= (pl.col("x") + pl.col("w")))
         & (y_expr >= pl.col("y"))
         & (y_expr <= (pl.col("y") + pl.col("h")))
-    ).fill_null(False)
\ No newline at end of file
+    ).fill_null(False)
+
+def rectsintersect(x: float | pl.Expr, y: float | pl.Expr, w: float | pl.Expr, h: float | pl.Expr) -> pl.Expr:
+    "Polars expression to check if a rectangle (x,y,w,h) intersects a rectangle defined by columns x,y,w,h; bounds are inclusive and null rectangle values evaluate to False."
+    x_expr, y_expr, w_expr, h_expr = (value if isinstance(value, pl.Expr) else pl.lit(value) for value in (x, y, w, h))
+    return (
+        (x_expr <= (pl.col("x") + pl.col("w")))
+        & ((x_expr + w_expr) >= pl.col("x"))
+        & (y_expr <= (pl.col("y") + pl.col("h")))
+        & ((y_expr + h_expr) >= pl.col("y"))
+    ).fill_null(False)
@@ -0,0 +1,240 @@
+import polars as pl
+
+# Appended rows and tombstones are merged into the main index once there are
+# more than this many of them, or more than this fraction of its rows.
+COMPACT_MIN_ROWS = 4096
+COMPACT_FRACTION = 0.05
+
+
+def compaction_due(pending: int, size: int) -> bool:
+    "True once `pending` appended and removed rows are worth merging into an index of `size` entries."
+    return pending > max(COMPACT_MIN_ROWS, COMPACT_FRACTION * size)
+
+
+def row_ids(removed: pl.Series, positions: pl.Series) -> pl.Series:
+    "Map sorted row `positions` to row ids, which also count the sorted `removed` ids before them."
+    positions = positions.cast(removed.dtype)
+    # The live rows before each removed id tell how many removed ids precede a row's id.
+    live = removed - pl.int_range(removed.len(), dtype=removed.dtype, eager=True)
+    return (positions + live.search_sorted(positions, side="right")).cast(removed.dtype)
+
+
+def live_mask(removed: pl.Series, ids: pl.Series) -> pl.Series:
+    "True for each of `ids` that is not in the sorted `removed` ids."
+    if removed.len() == 0:
+        return pl.repeat(True, ids.len(), eager=True)
+    at = removed.search_sorted(ids, side="left")
+    return removed.gather(at.clip(upper_bound=removed.len() - 1)) != ids
+
+
+def live_rows(removed: pl.Series, ids: pl.Series) -> pl.Series:
+    "Drop the sorted `removed` ids from `ids` and map the rest to row positions, keeping their order."
+    if removed.len() == 0 or ids.len() == 0:
+        return ids
+    rows = (ids - removed.search_sorted(ids, side="left")).cast(ids.dtype)
+    return rows.filter(live_mask(removed, ids))
+
+
+class ColumnIndex:
+    """Index mapping each value of a dataframe column to the positions of the rows holding it.
+
+    The index is stored in compressed sparse row (CSR) form, as flat columns:
+    the distinct values in sorted order (`keys`), and the row positions
+    sorted by value and then position (`positions`). The positions of the
+    rows holding `keys[i]` are `positions[indptr[i]:indptr[i + 1]]`, so a
+    lookup is a binary search and a slice, and returns rows in the same order
+    as filtering the frame on the value.
+
+    `extend` and `remove` do not touch these columns. Appended rows go to a
+    small index of their own, and removed rows are kept as sorted tombstones,
+    both merged in at lookup. Positions in the columns are row ids that count
+    removed rows, so they stay valid until `compact` merges everything back
+    into the main index, which happens once the pending changes pass
+    `COMPACT_MIN_ROWS` rows or `COMPACT_FRACTION` of the index.
+    """
+
+    def __init__(self, column: str, keys: pl.Series, indptr: pl.Series, positions: pl.Series):
+        self.column = column
+        self.keys = keys
+        self.indptr = indptr
+        self.positions = positions
+        self._added = None
+        self._removed = positions.clear()
+
+    @property
+    def dtype(self) -> pl.DataType:
+        return self.positions.dtype
+
+    @classmethod
+    def build(cls, df: pl.DataFrame, column: str):
+        "Build an index over one column of a dataframe."
+        pairs = (
+            df.select(pl.col(column).cast(pl.String).alias("key"))
+            .with_row_index("row")
+            .drop_nulls("key")
+            .sort("key", maintain_order=True)
+        )
+        runs = pairs.get_column("key").rle()
+        return cls._from_runs(column, runs.struct.field("value"), runs.struct.field("len"), pairs.get_column("row"))
+
+    @classmethod
+    def _from_runs(cls, column: str, keys: pl.Series, counts: pl.Series, positions: pl.Series):
+        "Create an index from its sorted keys, the number of rows holding each and the positions in key order."
+        indptr = pl.concat([pl.Series([0], dtype=positions.dtype), counts.cum_sum().cast(positions.dtype)])
+        return cls(column, keys.alias(column), indptr.alias("indptr"), positions.alias("row"))
+
+    def __len__(self) -> int:
+        return self.compact().keys.len()
+
+    def _find(self, value: str) -> int | None:
+        "Position of `value` in the sorted keys, or None if no row holds it."
+        i = self.keys.search_sorted(value, side="left")
+        if i < self.keys.len() and self.keys[i] == value:
+            return i
+        return None
+
+    def __contains__(self, value: str) -> bool:
+        return self.rows(value).len() > 0
+
+    def _ids(self, value: str) -> pl.Series:
+        "Row ids holding `value` in the main index, in order."
+        i = self._find(value)
+        if i is None:
+            return self.positions.clear()
+        start, stop = self.indptr[i], self.indptr[i + 1]
+        return self.positions.slice(start, stop - start)
+
+    def rows(self, value: str) -> pl.Series:
+        "Positions of the rows whose indexed column equals `value`, in row order."
+        ids = self._ids(value)
+        if self._added is not None:
+            # Appended rows all follow the rows of the main index.
+            ids = pl.concat([ids, self._added._ids(value)])
+        return live_rows(self._removed, ids)
+
+    def _idsfor(self, values: pl.Series) -> pl.DataFrame:
+        "The `_query` number, `value` and row `id` of each row of the main index holding one of `values`."
+        found = pl.DataFrame({"value": values}).with_row_index("_query")
+        if self.keys.len() == 0:
+            return found.clear().with_columns(pl.lit(None, dtype=self.dtype).alias("id"))
+        at = self.keys.search_sorted(values, side="left").clip(upper_bound=self.keys.len() - 1)
+        found = found.with_columns(
+            start=self.indptr.gather(at), stop=self.indptr.gather(at + 1), hit=self.keys.gather(at) == values
+        )
+        found = found.filter("hit").select("_query", "value", pl.int_ranges("start", "stop").alias("id")).explode("id")
+        return found.with_columns(self.positions.gather(found.get_column("id")).alias("id"))
+
+    def rowsfor(self, values) -> pl.DataFrame:
+        "Positions of the rows holding each of a list of `values`, as `value` and `row` columns in the order of `values`, then rows."
+        values = pl.Series("value", list(values), dtype=pl.String)
+        found = self._idsfor(values)
+        if self._added is not None:
+            found = pl.concat([found, self._added._idsfor(values)]).sort("_query", "id")
+        ids = found.get_column("id")
+        return found.filter(live_mask(self._removed, ids)).select(
+            "value", live_rows(self._removed, ids).alias("row")
+        )
+
+    def counts(self) -> pl.Series:
+        "Number of rows holding each of the sorted keys."
+        self.compact()
+        return self.indptr.slice(1) - self.indptr.head(-1)
+
+    def to_frames(self) -> tuple[pl.DataFrame, pl.DataFrame]:
+        """Return the index as two flat frames: the sorted keys with the `stop` offset of each run, and the positions.
+
+        Written as Arrow IPC, both can be memory-mapped back by `from_frames`
+        and searched in place.
+        """
+        self.compact()
+        return pl.DataFrame([self.keys, self.indptr.slice(1).alias("stop")]), self.positions.to_frame()
+
+    @classmethod
+    def from_frames(cls, keys: pl.DataFrame, positions: pl.DataFrame):
+        "Rebuild an index from the frames created by `to_frames`, without copying their columns."
+        stops = keys.get_column("stop")
+        indptr = pl.concat([pl.Series("indptr", [0], dtype=stops.dtype), stops.alias("indptr")], rechunk=False)
+        return cls(keys.columns[0], keys.to_series(0), indptr, positions.get_column("row"))
+
+    def _runs(self) -> pl.DataFrame:
+        "Return the sorted keys with the start and stop of their runs of positions."
+        return pl.DataFrame(
+            {"key": self.keys, "start": self.indptr.head(-1), "stop": self.indptr.slice(1)},
+            schema={"key": pl.String, "start": pl.Int64, "stop": pl.Int64},
+        )
+
+    def pending(self) -> int:
+        "Number of appended and removed rows not yet merged into the main index."
+        added = 0 if self._added is None else self._added.positions.len()
+        return added + self._removed.len()
+
+    def extend(self, df: pl.DataFrame, offset: int):
+        "Add the rows of `df`, which follow `offset` rows already in the index."
+        # Row ids count the removed rows, which all come before the appended ones.
+        added = ColumnIndex.build(df, self.column)
+        added.positions = (added.positions + offset + self._removed.len()).cast(self.dtype)
+        if self._added is None:
+            self._added = added
+        else:
+            self._added._merge(added)
+        self._compact_if_needed()
+
+    def remove(self, positions: pl.Series):
+        "Drop the rows at the sorted row `positions` from the index; the rows that follow them move down."
+        self._removed = pl.concat([self._removed, row_ids(self._removed, positions)]).sort()
+        self._compact_if_needed()
+
+    def _compact_if_needed(self):
+        if compaction_due(self.pending(), self.positions.len()):
+            self.compact()
+
+    def compact(self):
+        "Merge appended and removed rows into the main index now; returns self."
+        if self._added is not None:
+            self._merge(self._added)
+            self._added = None
+        if self._removed.len() > 0:
+            self._drop(self._removed)
+            self._removed = self.positions.clear()
+        return self
+
+    def _merge(self, added):
+        "Merge the index `added`, whose row ids all follow the ids of this index, into the main index."
+        at = self.keys.search_sorted(added.keys, side="left").cast(pl.Int64)
+        known = self.keys.gather(at.clip(upper_bound=self.keys.len() - 1)) == added.keys if self.keys.len() else at < 0
+        # Keys new to the index shift the existing keys sorting after them.
+        fresh = added.keys.filter(~known)
+        runs = pl.concat(
+            [
+                self._runs().with_columns(
+                    target=pl.int_range(pl.len()) + fresh.search_sorted(self.keys, side="left"),
+                ),
+                added._runs().with_columns(
+                    pl.col("start", "stop") + self.positions.len(),
+                    target=at + fresh.search_sorted(added.keys, side="left"),
+                ),
+            ]
+        ).sort("target", "start")
+        # A key's existing rows come before its added rows, which all follow them.
+        positions = pl.concat([self.positions, added.positions.cast(self.dtype)]).gather(
+            runs.select(pl.int_ranges("start", "stop")).to_series().explode()
+        )
+        merged = runs.group_by("target", maintain_order=True).agg(
+            pl.col("key").first(), (pl.col("stop") - pl.col("start")).sum().alias("len")
+        )
+        self._replace(merged.get_column("key"), merged.get_column("len"), positions)
+
+    def _drop(self, ids: pl.Series):
+        "Drop the sorted row `ids` from the main index and renumber the rows that follow them."
+        removed = self.positions.is_in(ids.implode())
+        # Each run shrinks by the removed entries before its end; rows move down past the removed rows before them.
+        indptr = self.indptr - removed.arg_true().search_sorted(self.indptr, side="left")
+        counts = indptr.slice(1) - indptr.head(-1)
+        kept = self.positions.filter(~removed)
+        kept = (kept - ids.search_sorted(kept, side="left")).cast(self.dtype)
+        self._replace(self.keys.filter(counts > 0), counts.filter(counts > 0), kept)
+
+    def _replace(self, keys: pl.Series, counts: pl.Series, positions: pl.Series):
+        "Replace the contents of the main index in place."
+        index = ColumnIndex._from_runs(self.column, keys, counts, positions)
+        self.keys, self.indptr, self.positions = index.keys, index.indptr, index.positions
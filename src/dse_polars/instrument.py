@@ -0,0 +1,136 @@
+import functools
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+import polars as pl
+
+
+@dataclass
+class Operation:
+    """Measurements of one call of an instrumented function or method.
+
+    `rows_in` counts the rows of the first dataframe, `DSE` or `DSEPassages`
+    argument, and `rows_out` the rows of the result (or of the object an
+    `__init__` method set up). `memory` is the estimated size in bytes of each
+    column of the resulting frame. Values that do not apply are None.
+    """
+
+    name: str
+    seconds: float
+    rows_in: int | None
+    rows_out: int | None
+    memory: dict[str, int] | None
+
+
+_hooks = []
+
+
+def add_hook(hook):
+    "Call `hook` with an `Operation` after every instrumented call."
+    global _hooks
+    _hooks = [*_hooks, hook]
+
+
+def remove_hook(hook):
+    "Stop calling a hook registered with `add_hook`."
+    global _hooks
+    _hooks = [registered for registered in _hooks if registered != hook]
+
+
+def result_frame(value) -> pl.DataFrame | None:
+    "The eager dataframe held by a dataframe, `DSE` or `DSEPassages` value, if any."
+    if isinstance(value, pl.DataFrame):
+        return value
+    attributes = getattr(value, "__dict__", {})
+    frame = attributes.get("_df", attributes.get("df"))
+    return frame if isinstance(frame, pl.DataFrame) else None
+
+
+def count_rows(value) -> int | None:
+    "Number of rows of a frame-holding value, or the length of a list."
+    frame = result_frame(value)
+    if frame is not None:
+        return frame.height
+    if isinstance(value, list):
+        return len(value)
+    return None
+
+
+def instrumented(func):
+    """Decorator reporting the time, rows and memory of each call to registered hooks.
+
+    With no hooks registered, a call costs one extra check of the hook list.
+    """
+    name = func.__qualname__
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _hooks:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+
+        rows_in = next((rows for rows in map(count_rows, args) if rows is not None), None)
+        output = args[0] if result is None and args else result
+        frame = result_frame(output)
+        memory = None if frame is None else {column: frame.get_column(column).estimated_size() for column in frame.columns}
+        operation = Operation(name, seconds, rows_in, count_rows(output), memory)
+        for hook in _hooks:
+            hook(operation)
+        return result
+
+    return wrapper
+
+
+class Recorder:
+    "Hook collecting every `Operation` it is called with."
+
+    def __init__(self):
+        self.operations = []
+
+    def __call__(self, operation: Operation):
+        self.operations.append(operation)
+
+    def frame(self) -> pl.DataFrame:
+        "Return the recorded operations as a dataframe, with each result's total estimated `bytes`."
+        return pl.DataFrame(
+            [
+                {
+                    "name": operation.name,
+                    "seconds": operation.seconds,
+                    "rows_in": operation.rows_in,
+                    "rows_out": operation.rows_out,
+                    "bytes": None if operation.memory is None else sum(operation.memory.values()),
+                }
+                for operation in self.operations
+            ],
+            schema={"name": pl.String, "seconds": pl.Float64, "rows_in": pl.Int64, "rows_out": pl.Int64, "bytes": pl.Int64},
+        )
+
+    def summary(self) -> pl.DataFrame:
+        "Summarize the recorded operations by name: call counts, total and mean seconds and rows in and out, slowest first."
+        return (
+            self.frame()
+            .group_by("name", maintain_order=True)
+            .agg(
+                pl.len().alias("calls"),
+                pl.col("seconds").sum().alias("total_seconds"),
+                pl.col("seconds").mean().alias("mean_seconds"),
+                pl.col("rows_in").sum(),
+                pl.col("rows_out").sum(),
+            )
+            .sort("total_seconds", descending=True, maintain_order=True)
+        )
+
+
+@contextmanager
+def recording():
+    "Record the instrumented calls made inside a `with` block in a `Recorder`."
+    recorder = Recorder()
+    add_hook(recorder)
+    try:
+        yield recorder
+    finally:
+        remove_hook(recorder)
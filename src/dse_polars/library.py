@@ -0,0 +1,42 @@
+from dataclasses import dataclass
+from pathlib import Path
+
+import polars as pl
+
+from .cex import dse_relations, parse_cex
+from .dse import DSE
+from .instrument import instrumented
+from .texts import DSEPassages
+
+
+@dataclass
+class CexLibrary:
+    """The DSE records, passages and datamodel catalog of a CEX library.
+
+    Attributes:
+        dse (DSE): DSE records from relation sets declared with the DSE model.
+        passages (DSEPassages): Passages from `ctsdata` blocks.
+        datamodels (pl.DataFrame): The datamodel catalog, with `collection`, `model`, `label` and `description` columns.
+    """
+    dse: DSE
+    passages: DSEPassages
+    datamodels: pl.DataFrame
+
+    @classmethod
+    @instrumented
+    def from_cex_file(cls, cexfile: str | Path, **kwargs):
+        "Load a CEX library from a file; keyword arguments are passed to the `DSE` constructor."
+        with open(cexfile, encoding="utf-8") as f:
+            cex_text = f.read()
+        return cls.from_cex_text(cex_text, **kwargs)
+
+    @classmethod
+    @instrumented
+    def from_cex_text(cls, cex_text: str, **kwargs):
+        "Load a CEX library, tokenizing the text in a single pass; keyword arguments are passed to the `DSE` constructor."
+        datamodels, relations, ctsdata = parse_cex(cex_text.split("\n"))
+        return cls(
+            dse=DSE(dse_relations(datamodels, relations), **kwargs),
+            passages=DSEPassages(ctsdata),
+            datamodels=datamodels,
+        )
@@ -0,0 +1,419 @@
+import math
+
+import polars as pl
+import polars.selectors as cs
+
+from .images import ptinrect, strip_roi
+from .index import compaction_due, live_rows, row_ids
+from .instrument import instrumented
+
+
+# Rectangles touching more grid cells than this are not listed under each cell.
+MAX_RECT_CELLS = 64
+
+
+class SpatialIndex:
+    """Uniform grid index of ROI rectangles, partitioned by image.
+
+    Each image's plane is divided into square cells of side `cellsize`, and
+    every rectangle is listed under each cell it touches. The index is stored
+    in compressed sparse row (CSR) form: `cells` has one `wholeimage`, `cx`,
+    `cy` row per occupied cell, sorted, and the positions of the rows listed
+    under cell `i` are `positions[indptr[i]:indptr[i + 1]]`, in row order.
+    Looking up a point or a rectangle binary-searches the cells it touches, so
+    candidates are found without scanning the frame; callers then test the
+    candidate rows exactly.
+
+    A rectangle touching more than `MAX_RECT_CELLS` cells, such as a page-sized
+    ROI among line-sized ones, is kept in `large` instead, and is a candidate
+    for every lookup on its image.
+
+    As in `ColumnIndex`, `extend` indexes appended rows separately and
+    `remove` keeps removed rows as tombstones, both applied at lookup until
+    `stale` says the index is worth rebuilding.
+    """
+
+    def __init__(self, cells: pl.DataFrame, indptr: pl.Series, positions: pl.Series, large: pl.DataFrame, cellsize: float):
+        self.cells = cells
+        self.indptr = indptr
+        self.positions = positions
+        self.large = large
+        self.cellsize = cellsize
+        self._rects = None
+        self._added = None
+        self._removed = positions.clear()
+
+    @classmethod
+    def build(cls, df: pl.DataFrame, cellsize: float | None = None):
+        """Build a grid index over the `wholeimage`, `x`, `y`, `w` and `h` columns of a dataframe.
+
+        If `cellsize` is not given, it is the median of the larger side of each
+        rectangle, so that a typical rectangle touches at most four cells.
+        """
+        rects = _rect_rows(df)
+        if cellsize is None:
+            cellsize = default_cellsize(rects)
+        if cellsize <= 0:
+            raise ValueError("cellsize must be a positive number.")
+        return cls._from_rects(rects, cellsize)
+
+    @classmethod
+    def _from_rects(cls, rects: pl.DataFrame, cellsize: float):
+        "Build the index of a frame of rectangles with their `row` positions."
+
+        small = few_cells(cellsize)
+        entries = rect_cells(rects.filter(small), cellsize).sort("wholeimage", "cx", "cy", "row")
+        cells = entries.group_by("wholeimage", "cx", "cy", maintain_order=True).len()
+        dtype = entries.schema["row"]
+        indptr = pl.concat([pl.Series([0], dtype=dtype), cells.get_column("len").cum_sum().cast(dtype)])
+        large = rects.filter(~small).select("wholeimage", "row").sort("wholeimage", "row")
+        return cls(cells.drop("len"), indptr.alias("indptr"), entries.get_column("row"), large, cellsize)
+
+    def __len__(self) -> int:
+        return self.cells.height
+
+    def __contains__(self, image: str) -> bool:
+        return self._imageids(image).len() > 0
+
+    def _imageids(self, image: str) -> pl.Series:
+        "Row ids of every rectangle on `image`, including appended and removed ones."
+        start, count = _bounds(self.cells.get_column("wholeimage"), image)
+        ids = pl.concat([self._cellrows(pl.int_range(start, start + count, dtype=pl.UInt32, eager=True)), self._largerows(image)])
+        if self._added is not None:
+            ids = pl.concat([ids, self._added._imageids(image)])
+        return live_rows(self._removed, ids.unique().sort())
+
+    def _cell(self, value: float) -> int:
+        return math.floor(value / self.cellsize)
+
+    def _largerows(self, image: str) -> pl.Series:
+        "Positions of the rows on `image` whose rectangles are too large to list under each cell."
+        start, count = _bounds(self.large.get_column("wholeimage"), image)
+        return self.large.get_column("row").slice(start, count)
+
+    def _cellrows(self, cells: pl.Series) -> pl.Series:
+        "Positions of the rows listed under the cells numbered `cells`, with repeats."
+        runs = pl.DataFrame({"start": self.indptr.gather(cells), "stop": self.indptr.gather(cells + 1)})
+        return self.positions.gather(runs.select(pl.int_ranges("start", "stop")).to_series().explode().drop_nulls())
+
+    def _imagecells(self, image: str, cx0: int, cx1: int) -> pl.DataFrame:
+        "The occupied cells on `image` in the columns `cx0` to `cx1`, with their number as `cell`."
+        start, count = _bounds(self.cells.get_column("wholeimage"), image)
+        xs = self.cells.get_column("cx").slice(start, count)
+        low, high = xs.search_sorted(cx0, side="left"), xs.search_sorted(cx1, side="right")
+        return self.cells.slice(start + low, high - low).with_row_index("cell", offset=start + low)
+
+    def pointcandidates(self, image: str, x: float, y: float) -> pl.Series:
+        "Positions of the rows on `image` whose rectangles may contain the point (x,y), in row order."
+        cx, cy = self._cell(x), self._cell(y)
+        cells = self._imagecells(image, cx, cx)
+        low, high = cells.get_column("cy").search_sorted(cy, side="left"), cells.get_column("cy").search_sorted(cy, side="right")
+        rows = self._cellrows(cells.get_column("cell").slice(low, high - low))
+        large = self._largerows(image)
+        rows = rows if large.len() == 0 else pl.concat([rows, large]).sort()
+        if self._added is not None:
+            # Appended rows all follow the rows of the main index.
+            rows = pl.concat([rows, self._added.pointcandidates(image, x, y)])
+        return live_rows(self._removed, rows)
+
+    def rectcandidates(self, image: str, x: float, y: float, w: float, h: float) -> pl.Series:
+        "Positions of the rows on `image` whose rectangles may intersect the rectangle (x,y,w,h), in row order."
+        cells = self._imagecells(image, self._cell(x), self._cell(x + w)).filter(
+            pl.col("cy").is_between(self._cell(y), self._cell(y + h))
+        )
+        rows = pl.concat([self._cellrows(cells.get_column("cell")), self._largerows(image)]).unique().sort()
+        if self._added is not None:
+            rows = pl.concat([rows, self._added.rectcandidates(image, x, y, w, h)])
+        return live_rows(self._removed, rows)
+
+    def pending(self) -> int:
+        "Number of appended and removed rows not yet built into the main index."
+        return (0 if self._rects is None else self._rects.height) + self._removed.len()
+
+    def stale(self) -> bool:
+        "True once enough rows have been appended or removed that the index is worth rebuilding."
+        return compaction_due(self.pending(), self.positions.len())
+
+    def extend(self, df: pl.DataFrame, offset: int):
+        "Add the rectangles of the rows of `df`, which follow `offset` rows already in the index."
+        # Row ids count the removed rows, which all come before the appended ones.
+        rects = _rect_rows(df, offset + self._removed.len())
+        self._rects = rects if self._rects is None else pl.concat([self._rects, rects])
+        self._added = SpatialIndex._from_rects(self._rects, self.cellsize)
+
+    def remove(self, positions: pl.Series):
+        "Drop the rows at the sorted row `positions` from the index; the rows that follow them move down."
+        self._removed = pl.concat([self._removed, row_ids(self._removed, positions)]).sort()
+
+
+def _rect_rows(df: pl.DataFrame, offset: int = 0) -> pl.DataFrame:
+    "The `row` position, `wholeimage`, `x`, `y`, `w` and `h` of every rectangle of a dataframe, numbering rows from `offset`."
+    return (
+        df.select(pl.col("wholeimage").cast(pl.String), "x", "y", "w", "h")
+        .with_row_index("row", offset=offset)
+        .drop_nulls()
+    )
+
+
+def _bounds(values: pl.Series, value: str) -> tuple[int, int]:
+    "Start and length of the run of `value` in a sorted series without nulls."
+    start = values.search_sorted(value, side="left")
+    return start, values.search_sorted(value, side="right") - start
+
+
+def default_cellsize(rects: pl.DataFrame | pl.LazyFrame) -> float:
+    "Median of the larger side of the rectangles in a frame with `w` and `h` columns, or 1.0 if there are none."
+    size = rects.lazy().select(pl.max_horizontal("w", "h").median()).collect().item()
+    return size if size is not None and size > 0 else 1.0
+
+
+def cell_expr(value: pl.Expr, cellsize: float) -> pl.Expr:
+    "Polars expression for the number of the grid cell of side `cellsize` holding a coordinate."
+    return (value / cellsize).floor().cast(pl.Int64)
+
+
+def few_cells(cellsize: float) -> pl.Expr:
+    "Polars expression that is true for the rectangles touching at most `MAX_RECT_CELLS` cells of side `cellsize`."
+
+    def span(start: str, size: str) -> pl.Expr:
+        return cell_expr(pl.col(start) + pl.col(size), cellsize) - cell_expr(pl.col(start), cellsize) + 1
+
+    return span("x", "w") * span("y", "h") <= MAX_RECT_CELLS
+
+
+def rect_cells(rects: pl.DataFrame | pl.LazyFrame, cellsize: float) -> pl.DataFrame | pl.LazyFrame:
+    """List the grid cells each rectangle touches.
+
+    `rects` has `row`, `wholeimage`, `x`, `y`, `w` and `h` columns; the result
+    has one `row`, `wholeimage`, `cx`, `cy` row for every cell a rectangle touches.
+    """
+    if cellsize <= 0:
+        raise ValueError("cellsize must be a positive number.")
+
+    def cellrange(start: str, size: str) -> pl.Expr:
+        return pl.int_ranges(
+            cell_expr(pl.col(start), cellsize), cell_expr(pl.col(start) + pl.col(size), cellsize) + 1
+        )
+
+    return (
+        rects.select("row", "wholeimage", cellrange("x", "w").alias("cx"), cellrange("y", "h").alias("cy"))
+        .explode("cx")
+        .explode("cy")
+        .drop_nulls()
+    )
+
+
+@instrumented
+def points_in_rois(
+    points: pl.DataFrame | pl.LazyFrame,
+    rois: pl.DataFrame | pl.LazyFrame,
+    columns: list[str] | tuple[str, ...] = ("passage", "surface", "roi"),
+    cellsize: float | None = None,
+) -> pl.DataFrame | pl.LazyFrame:
+    """Match a frame of points to every ROI rectangle containing them, in a single join.
+
+    `points` has `image`, `px` and `py` columns (an ROI on `image` is ignored);
+    `rois` has `wholeimage`, `x`, `y`, `w` and `h` columns, as a DSE frame does.
+    Points and rectangles are assigned to cells of a uniform grid on each image
+    and joined on image and cell, so no pair of a point and a rectangle on
+    different images or in distant cells is ever compared. As in
+    `SpatialIndex`, rectangles touching more than `MAX_RECT_CELLS` cells are
+    joined on image only. Matches are then tested exactly with `ptinrect`.
+
+    Returns the columns of `points` followed by `columns` from `rois`, in the
+    order of `points` and then of `rois`.
+    """
+    if cellsize is None:
+        cellsize = default_cellsize(rois.drop_nulls(["x", "y", "w", "h"]))
+    columns = list(columns)
+    lazy = isinstance(points, pl.LazyFrame) or isinstance(rois, pl.LazyFrame)
+    rects = (
+        rois.lazy()
+        .select(pl.col("wholeimage").cast(pl.String), "x", "y", "w", "h", *columns)
+        .with_row_index("row")
+    )
+    pointnames = points.collect_schema().names()
+    pointcells = (
+        points.lazy()
+        .with_row_index("_point")
+        .with_columns(
+            strip_roi(pl.col("image").cast(pl.String)).alias("_image"),
+            cell_expr(pl.col("px"), cellsize).alias("_cx"),
+            cell_expr(pl.col("py"), cellsize).alias("_cy"),
+        )
+    )
+    bounded = rects.drop_nulls(["x", "y", "w", "h"])
+    small = few_cells(cellsize)
+    candidates = pl.concat(
+        [
+            pointcells.join(
+                rect_cells(bounded.filter(small), cellsize).select("row", "wholeimage", "cx", "cy"),
+                left_on=["_image", "_cx", "_cy"],
+                right_on=["wholeimage", "cx", "cy"],
+                how="inner",
+            ),
+            pointcells.join(
+                bounded.filter(~small).select("row", "wholeimage"), left_on="_image", right_on="wholeimage", how="inner"
+            ),
+        ]
+    )
+    matches = (
+        candidates.join(rects.drop("wholeimage"), on="row", how="inner")
+        .filter(ptinrect(pl.col("px"), pl.col("py")))
+        .sort("_point", "row")
+        .select(*pointnames, *columns)
+    )
+    return matches if lazy else matches.collect()
+
+
+def _overlap_rects(frame: pl.DataFrame | pl.LazyFrame, columns: list[str], side: int) -> pl.LazyFrame:
+    "Select the rectangles of an ROI frame and the `columns` to report, tagged with their row and `side`."
+    return (
+        frame.lazy()
+        .select(pl.col("wholeimage").cast(pl.String), "x", "y", "w", "h", *columns)
+        .with_columns((cs.enum() | cs.categorical()).cast(pl.String))
+        .with_row_index("_row")
+        .with_columns(pl.lit(side, dtype=pl.UInt8).alias("_side"))
+        .drop_nulls(["wholeimage", "x", "y", "w", "h"])
+    )
+
+
+@instrumented
+def roi_overlaps(
+    left: pl.DataFrame | pl.LazyFrame,
+    right: pl.DataFrame | pl.LazyFrame | None = None,
+    columns: list[str] | tuple[str, ...] = ("passage", "roi"),
+) -> pl.DataFrame | pl.LazyFrame:
+    """Find pairs of ROI rectangles on the same image that overlap with a positive area.
+
+    `left` and `right` have `wholeimage`, `x`, `y`, `w` and `h` columns, as a DSE
+    frame does. If `right` is None, overlapping pairs within `left` are found,
+    each pair once; otherwise each rectangle of `left` is paired with the
+    overlapping rectangles of `right`.
+
+    Rectangles are swept in order of `y` within each image: a rectangle is only
+    compared with the rectangles starting before its bottom edge, found with a
+    binary search, rather than with every rectangle on the image.
+
+    Returns `wholeimage`, `columns` from the left rectangle, the same columns
+    from the right one with a `_right` suffix, and the `intersection` area and
+    intersection over union (`iou`) of the pair.
+    """
+    columns = list(columns)
+    lazy = isinstance(left, pl.LazyFrame) or isinstance(right, pl.LazyFrame)
+    rects = _overlap_rects(left, columns, 0)
+    if right is not None:
+        rects = pl.concat([rects, _overlap_rects(right, columns, 1)])
+    rects = (
+        rects.sort("wholeimage", "y", "_side", "_row")
+        .with_row_index("_id")
+        .with_columns(
+            (
+                pl.col("_id")
+                - pl.int_range(pl.len(), dtype=pl.UInt32).over("wholeimage")
+                + pl.col("y").search_sorted(pl.col("y") + pl.col("h"), side="left").over("wholeimage")
+            ).alias("_end")
+        )
+    )
+    pairs = (
+        rects.select(pl.col("_id").alias("_a"), pl.int_ranges(pl.col("_id") + 1, pl.col("_end")).alias("_b"))
+        .explode("_b")
+        .drop_nulls()
+    )
+    first = rects.select(pl.all().name.suffix("_a"))
+    second = rects.select(pl.all().name.suffix("_b"))
+    pairs = (
+        pairs.join(first, left_on="_a", right_on="_id_a", how="inner")
+        .join(second, left_on="_b", right_on="_id_b", how="inner")
+    )
+    if right is not None:
+        pairs = pairs.filter(pl.col("_side_a") != pl.col("_side_b"))
+    # Put the rectangle from `left`, or the earlier row of a self pair, first.
+    swap = (pl.col("_side_a") > pl.col("_side_b")) | (
+        (pl.col("_side_a") == pl.col("_side_b")) & (pl.col("_row_a") > pl.col("_row_b"))
+    )
+    names = ["_row", "x", "y", "w", "h", *columns]
+    pairs = pairs.select(
+        pl.col("wholeimage_a").alias("wholeimage"),
+        *(pl.when(swap).then(pl.col(f"{name}_b")).otherwise(pl.col(f"{name}_a")).alias(f"{name}_l") for name in names),
+        *(pl.when(swap).then(pl.col(f"{name}_a")).otherwise(pl.col(f"{name}_b")).alias(f"{name}_r") for name in names),
+    )
+    width = pl.min_horizontal(pl.col("x_l") + pl.col("w_l"), pl.col("x_r") + pl.col("w_r")) - pl.max_horizontal("x_l", "x_r")
+    height = pl.min_horizontal(pl.col("y_l") + pl.col("h_l"), pl.col("y_r") + pl.col("h_r")) - pl.max_horizontal("y_l", "y_r")
+    area = width * height
+    union = pl.col("w_l") * pl.col("h_l") + pl.col("w_r") * pl.col("h_r") - pl.col("intersection")
+    result = (
+        pairs.filter((width > 0) & (height > 0))
+        .with_columns(area.alias("intersection"))
+        .with_columns((pl.col("intersection") / union).alias("iou"))
+        .sort("_row_l", "_row_r")
+        .select(
+            "wholeimage",
+            *(pl.col(f"{column}_l").alias(column) for column in columns),
+            *(pl.col(f"{column}_r").alias(f"{column}_right") for column in columns),
+            "intersection",
+            "iou",
+        )
+    )
+    return result if lazy else result.collect()
+
+
+@instrumented
+def roi_coverage(rois: pl.DataFrame | pl.LazyFrame) -> pl.DataFrame | pl.LazyFrame:
+    """Measure how much of each image the ROI rectangles of a frame cover.
+
+    Returns one row per `wholeimage` with the number of `rois`, the sum of
+    their areas (`area`) and the area of their union (`coverage`), so that
+    `area - coverage` is the area counted more than once.
+
+    The union is measured with a sweep over the vertical strips between
+    consecutive rectangle edges on each image: in every strip, the covered
+    length is the union of the `y` intervals of the rectangles spanning it.
+    """
+    lazy = isinstance(rois, pl.LazyFrame)
+    rects = (
+        rois.lazy()
+        .select(pl.col("wholeimage").cast(pl.String), "x", "y", "w", "h")
+        .drop_nulls()
+        .filter((pl.col("w") > 0) & (pl.col("h") > 0))
+    )
+    edges = (
+        pl.concat([rects.select("wholeimage", pl.col("x").alias("edge")), rects.select("wholeimage", (pl.col("x") + pl.col("w")).alias("edge"))])
+        .unique()
+        .sort("wholeimage", "edge")
+        .with_columns(pl.int_range(pl.len(), dtype=pl.Int64).over("wholeimage").alias("strip"))
+        .with_columns((pl.col("edge").shift(-1).over("wholeimage") - pl.col("edge")).alias("stripwidth"))
+    )
+    strips = (
+        rects.join(edges.select("wholeimage", pl.col("edge").alias("x"), pl.col("strip").alias("first")), on=["wholeimage", "x"])
+        .join(
+            edges.select("wholeimage", pl.col("edge").alias("_right"), pl.col("strip").alias("stop")),
+            left_on=["wholeimage", pl.col("x") + pl.col("w")],
+            right_on=["wholeimage", "_right"],
+        )
+        .select("wholeimage", "y", "h", pl.int_ranges("first", "stop").alias("strip"))
+        .explode("strip")
+        .sort("wholeimage", "strip", "y")
+    )
+    covered = (
+        strips.with_columns((pl.col("y") + pl.col("h")).alias("_bottom"))
+        .with_columns(pl.col("_bottom").cum_max().shift(1).over("wholeimage", "strip").alias("_reach"))
+        .with_columns(
+            (pl.col("_bottom") - pl.max_horizontal("y", pl.col("_reach").fill_null(pl.col("y")))).clip(lower_bound=0).alias("_length")
+        )
+        .group_by("wholeimage", "strip")
+        .agg(pl.col("_length").sum())
+        .join(edges.select("wholeimage", "strip", "stripwidth"), on=["wholeimage", "strip"])
+        .group_by("wholeimage")
+        .agg((pl.col("_length") * pl.col("stripwidth")).sum().alias("coverage"))
+    )
+    result = (
+        rois.lazy()
+        .select(pl.col("wholeimage").cast(pl.String), "w", "h")
+        .drop_nulls()
+        .group_by("wholeimage", maintain_order=True)
+        .agg(pl.len().alias("rois"), (pl.col("w") * pl.col("h")).sum().alias("area"))
+        .join(covered, on="wholeimage", how="left", maintain_order="left")
+        .with_columns(pl.col("coverage").fill_null(0.0))
+    )
+    return result if lazy else result.collect()
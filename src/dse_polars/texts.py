@@ -1,7 +1,29 @@
+from pathlib import Path
+from typing import TextIO
+
 import polars as pl
-import re
+
+from .cex import parse_cex
+from .index import compaction_due, live_rows, row_ids
+from .instrument import instrumented
+from .urnutils import passagecomponent_re
+
+# Columns the frame of a DSEPassages is sorted by, nulls last.
+CITATION_ORDER = ["group", "work", "version", "citekey"]
+# Columns the entries of a CitationIndex are sorted by, nulls last.
+INDEX_ORDER = ["group", "work", "citekey", "version", "row"]
+
 
 class DSEPassages:
+    """Passages of CTS texts, with the components of each URN in their own columns.
+
+    The frame is sorted by `group`, `work`, `version` and the natural-order
+    `citekey` of the passage reference, so that the passages of a range, or
+    those before or after a passage, are found by binary search and returned
+    as a contiguous slice.
+    """
+
+    @instrumented
     def __init__(self, data):
         "Enforce DSE schema for dataframe."
         base_df = pl.DataFrame(data, schema={
@@ -17,48 +39,236 @@ class DSEPassages:
             work_parts.struct.field("field_0").alias("group"),
             work_parts.struct.field("field_1").alias("work"),
             work_parts.struct.field("field_2").alias("version"),
+        ).with_columns(
+            citation_key(pl.col("passageref"))
+        ).sort(CITATION_ORDER, nulls_last=True, maintain_order=True)
+
+    @classmethod
+    @instrumented
+    def from_cex_file(cls, cexfile: str):
+        "Create DSEPassages from the `ctsdata` blocks of a CEX file."
+        with open(cexfile, encoding="utf-8") as f:
+            cex_text = f.read()
+        return cls.from_cex_text(cex_text)
+
+    @classmethod
+    @instrumented
+    def from_cex_text(cls, cex_text: str):
+        "Create DSEPassages from the `ctsdata` blocks of CEX data."
+        _, _, ctsdata = parse_cex(cex_text.split("\n"))
+        return cls(ctsdata)
+
+    def _workrows(self, base: str) -> tuple[int, int]:
+        "Positions of the first and past the last row of the work and version of a work-level URN."
+        parts = base.split(":")
+        if len(parts) < 4:
+            return 0, 0
+        workparts = [*parts[3].split(".")[:3], None, None][:3]
+        start, stop = 0, self.df.height
+        for column, value in zip(CITATION_ORDER, workparts):
+            low, high = _equal_bounds(self.df.get_column(column).slice(start, stop - start), value)
+            start, stop = start + low, start + high
+        return start, stop
+
+    def _citekeys(self, start: int, stop: int) -> pl.Series:
+        "Sorted citation keys of the rows from `start` to `stop`, without the nulls at their end."
+        keys = self.df.get_column("citekey").slice(start, stop - start)
+        return keys.head(keys.len() - keys.null_count())
+
+    @instrumented
+    def passagerange(self, urn: str) -> pl.DataFrame:
+        """Return the passages of a range URN, or of a single passage URN, in citation order.
+
+        Matches the rows `retrieve_leafnode_range` finds, with two binary
+        searches instead of a scan of the frame.
+        """
+        if "-" in urn:
+            base, start_passage, end_passage = range_passages(urn)
+        else:
+            base, start_passage = split_urn_parts(urn)
+            end_passage = start_passage
+        start_key, end_key = sorted(
+            pl.select(citation_key(start_passage).alias("start"), citation_key(end_passage).alias("end")).row(0)
         )
+        start, stop = self._workrows(base)
+        keys = self._citekeys(start, stop)
+        low, high = keys.search_sorted(start_key, side="left"), keys.search_sorted(end_key, side="right")
+        rows = self.df.slice(start + low, high - low)
+        if "-" not in urn:
+            return rows.filter(pl.col("urn") == urn)
+        return rows.filter(pl.col("urn").str.replace(passagecomponent_re, "") == base)
+
+    @instrumented
+    def passageranges(self, urns) -> pl.DataFrame:
+        "Return the passages of each of a list of range URNs, tagged with their range, as `retrieve_leafnode_ranges` does."
+        return _leafnode_ranges(self.df, urns, pl.col("citekey"))
+
+    @instrumented
+    def nextpassage(self, urn: str, n: int = 1) -> pl.DataFrame:
+        "Return up to `n` passages following a passage URN in the same version of its work, in citation order."
+        base, passage = split_urn_parts(urn)
+        start, stop = self._workrows(base)
+        keys = self._citekeys(start, stop)
+        position = keys.search_sorted(pl.select(citation_key(passage)).item(), side="right")
+        return self.df.slice(start + position, min(n, keys.len() - position))
+
+    @instrumented
+    def previouspassage(self, urn: str, n: int = 1) -> pl.DataFrame:
+        "Return up to `n` passages preceding a passage URN in the same version of its work, in citation order."
+        base, passage = split_urn_parts(urn)
+        start, stop = self._workrows(base)
+        position = self._citekeys(start, stop).search_sorted(pl.select(citation_key(passage)).item(), side="left")
+        first = max(position - n, 0)
+        return self.df.slice(start + first, position - first)
+
+
+class CitationIndex:
+    """Index of the CTS passages of a DSE in citation order, walked like a trie from work to passage.
+
+    Rows are sorted by `group`, `work`, the natural-order citation key of
+    `passageref`, `version` and row position. Binary searches narrow a query
+    URN to its group and work, then to the citation keys its passage is a
+    prefix of, so that a chapter or a whole work is a contiguous slice; only
+    that slice is checked for namespace and version.
+
+    As in `ColumnIndex`, `extend` indexes appended rows separately and
+    `remove` keeps removed rows as tombstones, both applied at lookup until
+    `stale` says the index is worth rebuilding.
+    """
 
+    def __init__(self, entries: pl.DataFrame):
+        self.entries = entries
+        self._added = None
+        self._removed = entries.get_column("row").clear()
+
+    @classmethod
+    def build(cls, df: pl.DataFrame, offset: int = 0):
+        """Build the index of a dataframe with `passage`, `passageref`, `group`, `work` and `version` columns.
+
+        Rows are numbered from `offset`.
+        """
+        entries = (
+            df.select(
+                pl.col("passage", "passageref", "group", "work", "version").cast(pl.String),
+            )
+            .with_row_index("row", offset=offset)
+            .with_columns(citation_key(pl.col("passageref")))
+            .sort(INDEX_ORDER, nulls_last=True)
+        )
+        return cls(entries)
+
+    def __len__(self) -> int:
+        added = 0 if self._added is None else len(self._added)
+        return self.entries.height + added - self._removed.len()
+
+    def rows(self, urn: str) -> pl.Series:
+        """Positions of the rows whose passage `urn` contains, as `ctsurn_contains` decides, in citation order.
+
+        A URN with an empty passage, such as `urn:cts:compnov:bible.genesis:`,
+        contains every passage of the work; one without a version contains
+        the passages of every version.
+        """
+        entries = self._entries(urn)
+        if self._added is not None:
+            entries = pl.concat([entries, self._added._entries(urn)]).sort(INDEX_ORDER, nulls_last=True)
+        return live_rows(self._removed, entries.get_column("row"))
+
+    def _entries(self, urn: str) -> pl.DataFrame:
+        "The entries of the main index whose passage `urn` contains, in citation order."
+        parts = [*urn.split(":")[:5], None, None, None, None, None][:5]
+        spec, spectype, namespace, workcomponent, passage = parts
+        group, work, version = [*(workcomponent or "").split(".")[:3], None, None, None][:3]
+        if work is None or passage is None:
+            return self.entries.clear()
+
+        start, stop = 0, self.entries.height
+        for column, value in (("group", group), ("work", work)):
+            low, high = _equal_bounds(self.entries.get_column(column).slice(start, stop - start), value)
+            start, stop = start + low, start + high
+        if passage:
+            keys = self.entries.get_column("citekey").slice(start, stop - start)
+            keys = keys.head(keys.len() - keys.null_count())
+            key = pl.select(citation_key(passage)).item()
+            # Keys of the passages under `passage` start with its key, which ends with "\x00".
+            low, high = keys.search_sorted(key, side="left"), keys.search_sorted(key[:-1] + "\x01", side="left")
+            start, stop = start + low, start + high
+
+        conditions = [pl.col("passage").str.starts_with(f"{spec}:{spectype}:{namespace}:")]
+        if version is not None:
+            conditions.append((pl.col("version") == version) | pl.col("version").is_null())
+        if passage:
+            reference = pl.col("passageref")
+            conditions.append(
+                (reference == passage)
+                | (reference.str.starts_with(passage + ".") & (reference.str.len_chars() > len(passage) + 1))
+            )
+        return self.entries.slice(start, stop - start).filter(*conditions)
+
+    def pending(self) -> int:
+        "Number of appended and removed rows not yet built into the main index."
+        return (0 if self._added is None else self._added.entries.height) + self._removed.len()
+
+    def stale(self) -> bool:
+        "True once enough rows have been appended or removed that the index is worth rebuilding."
+        return compaction_due(self.pending(), self.entries.height)
+
+    def extend(self, df: pl.DataFrame, offset: int):
+        "Add the rows of `df`, which follow `offset` rows already in the index."
+        # Row ids count the removed rows, which all come before the appended ones.
+        added = CitationIndex.build(df, offset + self._removed.len())
+        if self._added is not None:
+            added = CitationIndex(pl.concat([self._added.entries, added.entries]).sort(INDEX_ORDER, nulls_last=True))
+        self._added = added
+
+    def remove(self, positions: pl.Series):
+        "Drop the rows at the sorted row `positions` from the index; the rows that follow them move down."
+        self._removed = pl.concat([self._removed, row_ids(self._removed, positions)]).sort()
+
+
+def _equal_bounds(values: pl.Series, value: str | None) -> tuple[int, int]:
+    "Positions of the first and past the last `value` in a series sorted with nulls last; None finds the nulls."
+    nonnull = values.len() - values.null_count()
+    if value is None:
+        return nonnull, values.len()
+    head = values.head(nonnull)
+    return head.search_sorted(value, side="left"), head.search_sorted(value, side="right")
+
+
+def citation_key(passage: pl.Expr | str) -> pl.Expr:
+    """Polars expression for a natural-order sort key of a CTS passage reference.
+
+    Each dot-separated level is split into runs of digits and non-digits.
+    A run of digits is encoded as "0", the two-digit length of its value
+    without leading zeros and that value; other runs as "1" and their text.
+    Each run ends with "\\x01" and each level with "\\x00", so that comparing
+    keys as strings orders references level by level, numbers numerically
+    before text, and a reference before the references it is a prefix of:
+    1 < 1.1 < 1.2 < 1.2a < 1.10 < 2.
+    """
+    expr = passage if isinstance(passage, pl.Expr) else pl.lit(passage)
+    run = pl.element()
+    digits = run.str.strip_chars_start("0")
+    encoded_run = pl.when(run.str.slice(0, 1).is_between(pl.lit("0"), pl.lit("9"))).then(
+        pl.lit("0") + digits.str.len_bytes().cast(pl.String).str.zfill(2) + digits
+    ).otherwise(pl.lit("1") + run) + pl.lit("\x01")
+    encoded_level = run.str.extract_all(r"[0-9]+|[^0-9]+").list.eval(encoded_run).list.join("") + pl.lit("\x00")
+    return expr.str.split(".").list.eval(encoded_level).list.join("").alias("citekey")
 
-def retrieve_leafnode_range(df: pl.DataFrame, urn: str) -> pl.DataFrame:
-    "Return a dataframe containing all rows whose URN falls between the first and last values of a range urn."
-    if "urn" not in df.columns:
-        raise ValueError("DataFrame must include an 'urn' column.")
-
-    if "-" not in urn:
-        return df.filter(pl.col("urn") == urn)
 
-    def split_urn_parts(value: str) -> tuple[str, str]:
-        base, sep, passage = value.rpartition(":")
-        if not sep:
-            raise ValueError(f"Invalid CTS URN: {value}")
-        return base, passage
+def split_urn_parts(value: str) -> tuple[str, str]:
+    "Split a CTS URN into its work-level base and its passage component."
+    base, sep, passage = value.rpartition(":")
+    if not sep:
+        raise ValueError(f"Invalid CTS URN: {value}")
+    return base, passage
 
-    def normalize_range_end(start_passage: str, end_passage: str) -> str:
-        if "." not in start_passage or "." in end_passage:
-            return end_passage
 
-        start_parts = start_passage.split(".")
-        end_parts = end_passage.split(".")
-        if len(end_parts) >= len(start_parts):
-            return end_passage
-
-        borrowed = start_parts[: len(start_parts) - len(end_parts)]
-        return ".".join([*borrowed, *end_parts])
-
-    def token_key(token: str) -> tuple:
-        pieces = re.findall(r"\d+|\D+", token)
-        keyed: list[tuple[int, int | str]] = []
-        for piece in pieces:
-            if piece.isdigit():
-                keyed.append((0, int(piece)))
-            else:
-                keyed.append((1, piece))
-        return tuple(keyed)
-
-    def passage_key(passage: str) -> tuple:
-        return tuple(token_key(part) for part in passage.split("."))
+def range_passages(urn: str) -> tuple[str, str, str]:
+    """Split a CTS range URN into its work-level base and first and last passages.
 
+    A last passage with fewer levels than the first borrows the missing
+    leading levels from it, so that `1.1-5` ends at `1.5`.
+    """
     range_base, range_passage = split_urn_parts(urn)
     start_passage, end_component = range_passage.split("-", 1)
     if not start_passage or not end_component:
@@ -68,56 +278,300 @@ def retrieve_leafnode_range(df: pl.DataFrame, urn: str) -> pl.DataFrame:
         end_base, end_passage = split_urn_parts(end_component)
     else:
         end_base = range_base
-        end_passage = normalize_range_end(start_passage, end_component)
+        end_passage = end_component
+        start_parts = start_passage.split(".")
+        end_parts = end_component.split(".")
+        if "." in start_passage and "." not in end_component and len(end_parts) < len(start_parts):
+            end_passage = ".".join([*start_parts[: len(start_parts) - len(end_parts)], *end_parts])
 
     if end_base != range_base:
         raise ValueError("Range URN start and end must have the same work component.")
+    return range_base, start_passage, end_passage
+
+
+@instrumented
+def retrieve_leafnode_range(df: pl.DataFrame, urn: str) -> pl.DataFrame:
+    "Return a dataframe containing all rows whose URN falls between the first and last values of a range urn."
+    if "urn" not in df.columns:
+        raise ValueError("DataFrame must include an 'urn' column.")
 
-    start_key = passage_key(start_passage)
-    end_key = passage_key(end_passage)
+    if "-" not in urn:
+        return df.filter(pl.col("urn") == urn)
 
+    range_base, start_passage, end_passage = range_passages(urn)
+    start_key, end_key = pl.select(
+        citation_key(start_passage).alias("start"), citation_key(end_passage).alias("end")
+    ).row(0)
     if start_key > end_key:
         start_key, end_key = end_key, start_key
 
-    urn_values = df.get_column("urn").to_list()
-    mask = []
-    for row_urn in urn_values:
-        if row_urn is None:
-            mask.append(False)
-            continue
-        try:
-            row_base, row_passage = split_urn_parts(row_urn)
-        except ValueError:
-            mask.append(False)
-            continue
+    prefix = f"{range_base}:"
+    row_passage = pl.col("urn").str.slice(len(prefix))
+    work = df.filter(pl.col("urn").str.starts_with(prefix) & ~row_passage.str.contains(":", literal=True))
+
+    # Keys compare level by level, and a level's key ends at its first "\x00", so
+    # a passage whose first level falls strictly between those of the range's
+    # ends is in the range and one outside them is not: only passages sharing a
+    # first level with an end need a full key.
+    first_level = work.select(row_passage.str.splitn(".", 2).struct.field("field_0")).to_series()
+    start_level, end_level = (key[: key.index("\x00") + 1] for key in (start_key, end_key))
+    levels = first_level.unique().to_frame("level").with_columns(citation_key(pl.col("level")))
+    inner = levels.filter(pl.col("citekey") > start_level, pl.col("citekey") < end_level).get_column("level")
+    edges = levels.filter(pl.col("citekey").is_in([start_level, end_level])).get_column("level")
+    edge_rows = first_level.is_in(edges.implode())
+    matched = (
+        work.filter(edge_rows)
+        .filter(citation_key(row_passage).is_between(pl.lit(start_key), pl.lit(end_key)))
+        .get_column("urn")
+    )
+    return work.filter(first_level.is_in(inner.implode()) | (edge_rows & work.get_column("urn").is_in(matched.implode())))
 
-        if row_base != range_base:
-            mask.append(False)
-            continue
 
-        row_key = passage_key(row_passage)
-        mask.append(start_key <= row_key <= end_key)
+@instrumented
+def retrieve_leafnode_ranges(df: pl.DataFrame, urns) -> pl.DataFrame:
+    """Return the rows of a dataframe falling in each of a list of range URNs, in a single join.
 
-    return df.filter(pl.Series("_mask", mask))
+    Each result row is tagged with the range URN it falls in, in a `range`
+    column, so a row in several ranges appears once for each. URNs without a
+    range match equal URNs only, as in `retrieve_leafnode_range`. Results
+    follow the order of `urns`, then citation order.
+    """
+    if "urn" not in df.columns:
+        raise ValueError("DataFrame must include an 'urn' column.")
+    return _leafnode_ranges(df, urns, citation_key(pl.col("urn").str.extract(r":([^:]*)$", 1)))
 
 
+def _leafnode_ranges(df: pl.DataFrame, urns, rowkey: pl.Expr) -> pl.DataFrame:
+    """Match the rows of `df` to a list of range URNs with two as-of joins on the citation key `rowkey`.
 
-def md_passages(df: pl.DataFrame, highlighter = "*") -> list[str]:
-    "Generates a formatted string for each passage in the dataframe consisting of the final passage component of the urn, surrounded by the highlighter string, followed by a space and the text content."
+    Rows sorted by work and key are numbered; the first row at or after the
+    start of each range and the last row at or before its end bound a
+    contiguous run of row numbers, which is expanded and gathered.
+    """
+    bounds = []
+    for urn in urns:
+        if urn is None:
+            continue
+        if "-" in urn:
+            base, start_passage, end_passage = range_passages(urn)
+        else:
+            base, start_passage = split_urn_parts(urn)
+            end_passage = start_passage
+        bounds.append((urn, base, start_passage, end_passage, "-" not in urn))
+    ranges = (
+        pl.DataFrame(
+            bounds,
+            schema={"range": pl.String, "_base": pl.String, "_start": pl.String, "_end": pl.String, "_exact": pl.Boolean},
+            orient="row",
+        )
+        .with_row_index("_query")
+        .with_columns(citation_key(pl.col("_start")).alias("_start"), citation_key(pl.col("_end")).alias("_end"))
+        .with_columns(pl.min_horizontal("_start", "_end").alias("_start"), pl.max_horizontal("_start", "_end").alias("_end"))
+    )
+
+    row_base = pl.col("urn").str.replace(passagecomponent_re, "")
     rows = (
-        df.select("urn", "text")
-        .filter(pl.col("urn").is_not_null() & pl.col("text").is_not_null())
-        .iter_rows(named=True)
+        df.filter(row_base.is_in(ranges.get_column("_base").unique().implode()))
+        .with_columns(row_base.alias("_base"), rowkey.alias("_key"))
+        .drop_nulls("_key")
+        .sort("_base", "_key", maintain_order=True)
+    )
+    positions = rows.select("_base", "_key").with_row_index("_position")
+    matched = (
+        ranges.sort("_base", "_start")
+        .join_asof(positions, left_on="_start", right_on="_key", by="_base", strategy="forward", check_sortedness=False)
+        .rename({"_position": "_first"})
+        .drop("_key")
+        .sort("_base", "_end")
+        .join_asof(positions, left_on="_end", right_on="_key", by="_base", strategy="backward", check_sortedness=False)
+        .rename({"_position": "_last"})
+        .filter(pl.col("_first") <= pl.col("_last"))
+        .sort("_query")
+        .select("range", "_exact", pl.int_ranges("_first", pl.col("_last") + 1, dtype=pl.UInt32).alias("_position"))
+        .explode("_position")
+    )
+    found = pl.concat(
+        [matched.drop("_position"), rows.drop("_base", "_key")[matched.get_column("_position")]],
+        how="horizontal",
+    )
+    return found.filter(~pl.col("_exact") | (pl.col("urn") == pl.col("range"))).drop("_exact")
+
+
+def md_lines(df: pl.DataFrame, highlighter: str = "*") -> pl.Series:
+    "Series of the `md_passages` line for each passage with both a `urn` and a `text`, computed with one string expression."
+    return (
+        df.filter(pl.col("urn").is_not_null() & pl.col("text").is_not_null())
+        .select(
+            pl.concat_str(
+                [
+                    pl.lit(highlighter),
+                    pl.col("urn").str.split(":").list.last(),
+                    pl.lit(highlighter + " "),
+                    pl.col("text"),
+                ]
+            ).alias("md")
+        )
+        .to_series()
     )
-    return [
-        f"{highlighter}{row['urn'].rsplit(':', 1)[-1]}{highlighter} {row['text']}"
-        for row in rows
-    ]
 
+
+@instrumented
+def md_passages(df: pl.DataFrame, highlighter = "*") -> list[str]:
+    "Generates a formatted string for each passage in the dataframe consisting of the final passage component of the urn, surrounded by the highlighter string, followed by a space and the text content."
+    return md_lines(df, highlighter).to_list()
+
+
+@instrumented
+def write_md_passages(df: pl.DataFrame, target: str | Path | TextIO, highlighter: str = "*", chunk_size: int = 100_000) -> int:
+    """Write the lines of `md_passages` to a file path or text stream, each followed by a newline.
+
+    Lines are formatted and written `chunk_size` passages at a time, without
+    building a Python list of every line. Returns the number of lines written.
+    """
+    if isinstance(target, (str, Path)):
+        with open(target, "w", encoding="utf-8", newline="") as stream:
+            return write_md_passages(df, stream, highlighter, chunk_size)
+
+    written = 0
+    for chunk in df.select("urn", "text").iter_slices(chunk_size):
+        lines = md_lines(chunk, highlighter)
+        if lines.len():
+            target.write(lines.str.join("\n").item() + "\n")
+        written += lines.len()
+    return written
+
+
+@instrumented
 def textcontents(df: pl.DataFrame) -> list[str]:
     "Return a python list of all text contents in the dataframe, as strings."
     return df.select("text").filter(pl.col("text").is_not_null()).to_series().to_list()
 
+def range_ends(passage: pl.Expr) -> pl.Expr:
+    """Polars struct expression with the `start` and `end` passages of a range, null if `passage` is not a range.
+
+    `passage` is everything after the fourth colon of a CTS URN. An
+    abbreviated last passage such as `5` in `1.1-5` borrows the leading
+    levels of the first; a last passage given as a full URN is reduced to its
+    passage component. Each step is a field of the struct, so that it is
+    computed once.
+    """
+    return (
+        pl.struct(
+            passage.str.extract(r"^([^-]*)-", 1).alias("start"),
+            passage.str.extract(r"-(.*)$", 1).alias("_end_component"),
+        )
+        .struct.with_fields(pl.field("_end_component").str.extract(r"([^:]*)$", 1).alias("end"))
+        .struct.with_fields(
+            pl.when(
+                ~pl.field("_end_component").str.starts_with("urn:")
+                & pl.field("start").str.contains(".", literal=True)
+                & ~pl.field("end").str.contains(".", literal=True)
+            )
+            .then(pl.concat_str([pl.field("start").str.replace(r"[^.]*$", ""), pl.field("end")]))
+            .otherwise(pl.field("end"))
+            .alias("end")
+        )
+    )
+
+
+def urn_components(urn: pl.Expr) -> list[pl.Expr]:
+    "Polars expressions for the `spec`, `spectype`, `namespace`, `group`, `work`, `version` and `passage` of CTS URNs."
+    parts = urn.str.split_exact(":", 4)
+    workparts = parts.struct.field("field_3").str.split_exact(".", 2)
+    return [
+        parts.struct.field("field_0").alias("spec"),
+        parts.struct.field("field_1").alias("spectype"),
+        parts.struct.field("field_2").alias("namespace"),
+        workparts.struct.field("field_0").alias("group"),
+        workparts.struct.field("field_1").alias("work"),
+        workparts.struct.field("field_2").alias("version"),
+        parts.struct.field("field_4").alias("passage"),
+    ]
+
+
+def passage_prefixes(frame: pl.DataFrame, passage: str) -> pl.DataFrame:
+    """Expand each row of a frame into one row for every passage containing its `passage` column, in `_candidate`.
+
+    Following `ctsurn_contains`, these are the passage itself, the empty
+    passage, and each run of its leading levels followed by at least one
+    more character. Rows with a null passage are dropped.
+    """
+    column = pl.col(passage)
+    frame = frame.filter(column.is_not_null())
+    depth = frame.select(column.str.count_matches(".", literal=True).max()).item() or 0
+    ancestors = [
+        frame.with_columns(column.str.extract(rf"(?s)^((?:[^.]*\.){{{dots}}}[^.]*)\..", 1).alias("_candidate"))
+        for dots in range(depth)
+    ]
+    return pl.concat(
+        [
+            frame.with_columns(pl.lit("").alias("_candidate")),
+            frame.with_columns(column.alias("_candidate")),
+            *(ancestor.drop_nulls("_candidate") for ancestor in ancestors),
+        ]
+    )
+
+
+@instrumented
+def cts_containment_join(left: pl.DataFrame, right: pl.DataFrame, left_on: str = "urn", right_on: str = "urn", suffix: str = "_right") -> pl.DataFrame:
+    """Join each row of `left` to every row of `right` whose URN contains its URN, as `ctsurn_contains` decides.
+
+    The URNs of each side are parsed once. Each left passage (or the first
+    and last passages of a left range) is expanded into the passages that
+    contain it, which are matched to the right passages with an equi-join
+    on the namespace, group and work; versions are compared afterwards, so
+    that a missing version matches any. Results follow the order of `left`,
+    then of `right`; columns of `right` also in `left` get `suffix`.
+    """
+    keys = ["spec", "spectype", "namespace", "group", "work"]
+    lefts = left.select(pl.col(left_on).alias("_urn"), *urn_components(pl.col(left_on))).with_row_index("_left")
+    rights = (
+        right.select(pl.col(right_on).alias("_urn"), *urn_components(pl.col(right_on)))
+        .with_row_index("_right")
+        .rename({"version": "_version", "passage": "_candidate"})
+    )
+
+    # Only URNs with a hyphen can be ranges; the others are their own first passage.
+    maybe_range = pl.col("_urn").str.contains("-", literal=True)
+    ends = range_ends(pl.col("_urn").str.splitn(":", 5).struct.field("field_4"))
+    # A URN without a passage component is contained only by URNs with an empty passage.
+    lefts = pl.concat(
+        [
+            lefts.filter(~maybe_range | pl.col("_urn").is_null()).with_columns(
+                pl.coalesce(pl.col("passage"), pl.lit("")).alias("_start"), pl.lit(None, dtype=pl.String).alias("_end")
+            ),
+            lefts.filter(maybe_range).with_columns(
+                pl.coalesce(ends.struct.field("start"), pl.col("passage"), pl.lit("")).alias("_start"),
+                ends.struct.field("end").alias("_end"),
+            ),
+        ]
+    )
+    candidates = passage_prefixes(lefts, "_start")
+    ranges = lefts.filter(pl.col("_end").is_not_null())
+    if ranges.height:
+        # A range is contained by the passages containing both its first and its last passage.
+        last = passage_prefixes(ranges.select("_left", "_end"), "_end").select("_left", "_candidate")
+        candidates = pl.concat(
+            [
+                candidates.filter(pl.col("_end").is_null()),
+                candidates.filter(pl.col("_end").is_not_null()).join(last, on=["_left", "_candidate"], how="semi"),
+            ]
+        )
+
+    contained = (
+        candidates.join(rights, on=[*keys, "_candidate"])
+        .filter((pl.col("version") == pl.col("_version")) | pl.col("version").is_null() | pl.col("_version").is_null())
+        .select("_left", "_right")
+    )
+    equal = lefts.select("_left", "_urn").join(rights.select("_right", "_urn"), on="_urn").select("_left", "_right")
+    pairs = pl.concat([contained, equal]).unique().sort("_left", "_right")
+    return (
+        pairs.join(left.with_row_index("_left"), on="_left", maintain_order="left")
+        .join(right.with_row_index("_right"), on="_right", suffix=suffix, maintain_order="left")
+        .drop("_left", "_right")
+    )
+
+
 def ctsurn_containedby(u1: pl.Expr | str, u2: pl.Expr | str) -> pl.Expr:
     "Inverse of ctsurn_contains: true if u1 is contained by u2 as a CTS URN."
     return ctsurn_contains(u2, u1)
@@ -134,42 +588,47 @@ def ctsurn_contains(u1: pl.Expr | str, u2: pl.Expr | str) -> pl.Expr:
     urn1 = u1 if isinstance(u1, pl.Expr) else pl.lit(u1)
     urn2 = u2 if isinstance(u2, pl.Expr) else pl.lit(u2)
 
-    parts1 = urn1.str.split_exact(":", 4)
-    parts2 = urn2.str.split_exact(":", 4)
-
-    spec1 = parts1.struct.field("field_0")
-    spectype1 = parts1.struct.field("field_1")
-    ns1 = parts1.struct.field("field_2")
-    workcomponent1 = parts1.struct.field("field_3")
-    passage1 = parts1.struct.field("field_4")
-
-    spec2 = parts2.struct.field("field_0")
-    spectype2 = parts2.struct.field("field_1")
-    ns2 = parts2.struct.field("field_2")
-    workcomponent2 = parts2.struct.field("field_3")
-    passage2 = parts2.struct.field("field_4")
-
-    workparts1 = workcomponent1.str.split_exact(".", 2)
-    workparts2 = workcomponent2.str.split_exact(".", 2)
-
-    wp10 = workparts1.struct.field("field_0")
-    wp11 = workparts1.struct.field("field_1")
-    wp12 = workparts1.struct.field("field_2")
+    # Each part is a field of one struct, computed once, since common
+    # subexpressions are not shared when the expression is a filter.
+    def part(name: str, index: int) -> pl.Expr:
+        return pl.field(name).struct.field(f"field_{index}")
 
-    wp20 = workparts2.struct.field("field_0")
-    wp21 = workparts2.struct.field("field_1")
-    wp22 = workparts2.struct.field("field_2")
+    spec1, spectype1, ns1, passage1 = (part("parts1", i) for i in (0, 1, 2, 4))
+    spec2, spectype2, ns2, passage2 = (part("parts2", i) for i in (0, 1, 2, 4))
+    wp10, wp11, wp12 = (part("workparts1", i) for i in range(3))
+    wp20, wp21, wp22 = (part("workparts2", i) for i in range(3))
 
     group_eq = (spec1 == spec2) & (spectype1 == spectype2) & (ns1 == ns2)
     work_eq = (wp10 == wp20) & (wp11 == wp21)
     work3_compatible = (wp12 == wp22) | wp12.is_null() | wp22.is_null()
 
-    passage_prefix = passage1.str.starts_with(passage2 + pl.lit(".")) & (
-        passage1.str.len_chars() > (passage2.str.len_chars() + pl.lit(1))
+    def passage_within(passage: pl.Expr) -> pl.Expr:
+        passage_prefix = passage.str.starts_with(passage2 + pl.lit(".")) & (
+            passage.str.len_chars() > (passage2.str.len_chars() + pl.lit(1))
+        )
+        return (passage == passage2) | (passage2 == "") | passage_prefix
+
+    # A range in u1 is contained if its first and last passages both are.
+    start1 = pl.field("range1").struct.field("start")
+    end1 = pl.field("range1").struct.field("end")
+    passage_ok = pl.when(start1.is_not_null()).then(passage_within(start1) & passage_within(end1)).otherwise(passage_within(passage1))
+
+    return (
+        pl.struct(urn1.alias("urn1"), urn2.alias("urn2"))
+        .struct.with_fields(
+            pl.field("urn1").str.split_exact(":", 4).alias("parts1"),
+            pl.field("urn2").str.split_exact(":", 4).alias("parts2"),
+            range_ends(pl.field("urn1").str.splitn(":", 5).struct.field("field_4")).alias("range1"),
+        )
+        .struct.with_fields(
+            part("parts1", 3).str.split_exact(".", 2).alias("workparts1"),
+            part("parts2", 3).str.split_exact(".", 2).alias("workparts2"),
+        )
+        .struct.with_fields(
+            ((pl.field("urn1") == pl.field("urn2")) | (group_eq & work_eq & work3_compatible & passage_ok)).alias("contains")
+        )
+        .struct.field("contains")
     )
-    passage_ok = (passage1 == passage2) | (passage2 == "") | passage_prefix
-
-    return (urn1 == urn2) | (group_eq & work_eq & work3_compatible & passage_ok)
 
     # workparts1 and workparts2 must have either 2 or 3 elements
     #
@@ -187,4 +646,7 @@ def ctsurn_contains(u1: pl.Expr | str, u2: pl.Expr | str) -> pl.Expr:
     # AND
     # passage1 == passage2 OR passage2 is empty OR 
     # passage1 starts with passage2 + "." + 1 or more characters
-    # ]
\ No newline at end of file
+    # ]
+    #
+    # If passage1 is a range, the passage condition must hold for both its
+    # first and its last passage.
\ No newline at end of file
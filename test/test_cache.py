@@ -0,0 +1,53 @@
+import polars as pl
+import pytest
+
+from dse_polars.cache import SelectorCache, cache_key
+
+
+def test_selector_cache_counts_hits_and_misses():
+    cache = SelectorCache(maxsize=2)
+    calls = []
+
+    def compute(value):
+        calls.append(value)
+        return value * 2
+
+    assert cache.get("a", lambda: compute(1)) == 2
+    assert cache.get("a", lambda: compute(1)) == 2
+    assert calls == [1]
+    assert cache.info() == {"hits": 1, "misses": 1, "size": 1, "maxsize": 2}
+
+
+def test_selector_cache_evicts_least_recently_used():
+    cache = SelectorCache(maxsize=2)
+    cache.get("a", lambda: 1)
+    cache.get("b", lambda: 2)
+    cache.get("a", lambda: 1)
+    cache.get("c", lambda: 3)
+
+    assert "a" in cache
+    assert "b" not in cache
+    assert "c" in cache
+    assert len(cache) == 2
+
+
+def test_selector_cache_clear_keeps_counts():
+    cache = SelectorCache()
+    cache.get("a", lambda: 1)
+    cache.clear()
+
+    assert len(cache) == 0
+    assert cache.info()["misses"] == 1
+
+
+def test_selector_cache_rejects_non_positive_maxsize():
+    with pytest.raises(ValueError, match="maxsize"):
+        SelectorCache(maxsize=0)
+
+
+def test_cache_key_freezes_sequences_and_rejects_frames():
+    assert cache_key("f", (["a", "b"],), {"edition": None}) == ("f", (("a", "b"),), (("edition", None),))
+    assert cache_key("f", (("a", "b"),), {}) == cache_key("f", (["a", "b"],), {})
+    assert cache_key("f", (pl.DataFrame({"a": [1]}),), {}) is None
+    assert cache_key("f", ([object()],), {}) is None
+    assert cache_key("f", (), {"other": object()}) is None
@@ -0,0 +1,147 @@
+from pathlib import Path
+
+import polars as pl
+import pytest
+
+from dse_polars import CexLibrary, DSE
+from dse_polars.cex import (
+    CexScanner,
+    dse_relations,
+    dse_urns,
+    iter_dse_batches,
+    parse_cex,
+    read_dse_relations,
+    relation_frame,
+    scan_cex,
+)
+
+
+CEX_TEXT = """// leading comment
+#!datamodels
+Collection|Model|Label|Description
+urn:cite2:demo:dse.v1:all|urn:cite2:cite:datamodels.v1:dsemodel|Demo DSE|Demo DSE collection
+urn:cite2:demo:comments.v1:all|urn:cite2:cite:datamodels.v1:commentarymodel|Comments|Demo comments
+
+#!citerelationset
+urn|urn:cite2:demo:comments.v1:all
+label|Demo commentary
+passage|comment|source
+urn:cts:demo:text.v1:1.1|urn:cts:demo:commentary.v1:1.1|urn:cite2:demo:sources.v1:s1
+
+#!citerelationset
+urn|urn:cite2:demo:dse.v1:all
+label|Demo relations
+passage|imageroi|surface
+// a comment inside the block
+urn:cts:demo:text.v1:1.1|urn:cite2:demo:images.v1:img1@1,2,3,4|urn:cite2:demo:surfaces.v1:s1
+
+urn:cts:demo:text.v1:1.2|urn:cite2:demo:images.v1:img1@5,6,7,8|urn:cite2:demo:surfaces.v1:s1
+urn:cts:demo:text.v1:1.3|urn:cite2:demo:images.v1:img2|urn:cite2:demo:surfaces.v1:s2
+"""
+
+
+@pytest.fixture
+def cexfile(tmp_path: Path) -> Path:
+    path = tmp_path / "demo.cex"
+    path.write_text(CEX_TEXT, encoding="utf-8")
+    return path
+
+
+def test_scan_cex_skips_comments_and_blank_lines_and_numbers_blocks():
+    tokens = scan_cex(CEX_TEXT.splitlines())
+
+    assert tokens.row(0) == (0, "datamodels", 3, 0, "Collection|Model|Label|Description", "Collection|Model|Label|Description")
+    assert set(tokens["label"]) == {"datamodels", "citerelationset"}
+    assert tokens["block"].is_sorted()
+    assert not any(line.startswith("//") or not line for line in tokens["line"])
+    assert tokens.filter(pl.col("lineno") == 18).select("position", "head").row(0) == (3, "urn|urn:cite2:demo:dse.v1:all")
+
+
+@pytest.mark.parametrize("size", [1, 2, 5, 7])
+def test_scanning_in_chunks_matches_scanning_at_once(size: int):
+    lines = CEX_TEXT.splitlines()
+    scanner = CexScanner()
+
+    chunks = [scanner.scan(lines[start:start + size]) for start in range(0, len(lines), size)]
+
+    assert pl.concat(chunks).equals(scan_cex(lines))
+
+
+def test_dse_urns_finds_collections_declared_with_the_dse_model():
+    assert dse_urns(CEX_TEXT.splitlines()) == ["urn:cite2:demo:dse.v1:all"]
+
+
+def test_every_loader_finds_a_dse_model_mentioned_in_a_description(tmp_path: Path):
+    # The description of the second collection mentions the DSE model, so it counts as a DSE collection.
+    text = CEX_TEXT.replace("|Comments|Demo comments", "|Comments|Links like urn:cite2:cite:datamodels.v1:dsemodel")
+    text = text.replace("urn:cts:demo:commentary.v1:1.1", "urn:cite2:demo:images.v1:img3")
+    path = tmp_path / "described.cex"
+    path.write_text(text, encoding="utf-8")
+
+    heights = {
+        DSE.from_cex_text(text).df.height,
+        DSE.from_cex_file(str(path)).df.height,
+        DSE.from_cex_stream(path).df.height,
+        DSE.from_cex_files([path]).df.height,
+        CexLibrary.from_cex_text(text).dse.df.height,
+        read_dse_relations(path).height,
+        sum(batch.height for batch in iter_dse_batches(path)),
+    }
+    assert heights == {4}
+    assert DSE.get_dse_urns(text) == dse_urns(text.splitlines()) == [
+        "urn:cite2:demo:dse.v1:all",
+        "urn:cite2:demo:comments.v1:all",
+    ]
+
+
+def test_iter_dse_batches_respects_batch_size_and_limit(cexfile: Path):
+    batches = list(iter_dse_batches(cexfile, batch_size=2))
+    assert [batch.height for batch in batches] == [2, 1]
+    assert batches[0].columns == ["passage", "image", "surface"]
+
+    limited = list(iter_dse_batches(cexfile, batch_size=2, limit=1))
+    assert [batch.height for batch in limited] == [1]
+    assert list(iter_dse_batches(cexfile, limit=0)) == []
+
+
+def test_iter_dse_batches_rejects_non_positive_batch_size(cexfile: Path):
+    with pytest.raises(ValueError, match="batch_size"):
+        list(iter_dse_batches(cexfile, batch_size=0))
+
+
+def test_relation_frame_splits_rows_into_columns():
+    frame = relation_frame(["p1|i1|s1", "p2|i2@1,2,3,4|s2"])
+
+    assert frame.columns == ["passage", "image", "surface"]
+    assert frame.rows() == [("p1", "i1", "s1"), ("p2", "i2@1,2,3,4", "s2")]
+
+
+def test_relation_frame_reports_row_positions_and_truncates_long_lists():
+    rows = ["p|i|s", "p|i"] + ["p"] * 12
+
+    with pytest.raises(ValueError, match=r"Offending rows: 2, 3, .*, 11 and 3 more\."):
+        relation_frame(rows)
+
+
+def test_parse_cex_collects_datamodels_relations_and_ctsdata_in_one_pass():
+    datamodels, relations, ctsdata = parse_cex((CEX_TEXT + "#!ctsdata\nurn:cts:demo:text.v1:1.1#Text\n").splitlines())
+
+    assert datamodels["model"].to_list() == [
+        "urn:cite2:cite:datamodels.v1:dsemodel",
+        "urn:cite2:cite:datamodels.v1:commentarymodel",
+    ]
+    assert relations["relationset"].to_list() == [
+        "urn:cite2:demo:comments.v1:all",
+        "urn:cite2:demo:dse.v1:all",
+        "urn:cite2:demo:dse.v1:all",
+        "urn:cite2:demo:dse.v1:all",
+    ]
+    assert relations["lineno"].to_list() == [11, 18, 20, 21]
+    assert ctsdata.rows() == [("urn:cts:demo:text.v1:1.1", "Text")]
+
+    dse_frame = dse_relations(datamodels, relations)
+    assert dse_frame["passage"].to_list() == [
+        "urn:cts:demo:text.v1:1.1",
+        "urn:cts:demo:text.v1:1.2",
+        "urn:cts:demo:text.v1:1.3",
+    ]
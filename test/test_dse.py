@@ -3,7 +3,11 @@ from pathlib import Path
 import polars as pl
 import pytest
 
-from dse_polars.dse import DSE
+from dse_polars.dse import DSE, DSE_COLUMNS, INDEXED_COLUMNS
+from dse_polars.graph import DSEGraph
+from dse_polars.images import ptinrect, rectsintersect
+from dse_polars.index import ColumnIndex
+from dse_polars.texts import ctsurn_contains
 from dse_polars.urnutils import passagecomponent_re
 
 
@@ -94,6 +98,14 @@ def test_init_adds_image_part_columns():
         "y",
         "w",
         "h",
+        "surfacenamespace",
+        "surfacecollection",
+        "surfaceversion",
+        "surfaceobject",
+        "imagenamespace",
+        "imagecollection",
+        "imageversion",
+        "imageobject",
     ]
     assert dse.df["passageref"].to_list() == ["1.1", "1.2"]
     assert dse.df["group"].to_list() == ["bar", "bar"]
@@ -365,3 +377,901 @@ def test_selector_image_vs_wholeimage_behavior():
         "urn:cite2:img:collection.v1:img1@5,6,7,8",
     ]
     assert wholeimages == ["urn:cite2:img:collection.v1:img1"]
+
+
+@pytest.mark.parametrize("path", DATA_FILES, ids=[p.name for p in DATA_FILES])
+def test_scan_selectors_return_lazyframes_matching_eager_results(path: Path):
+    eager = DSE(_load_df(path))
+    lazy = DSE.scan(path)
+    surface = eager.df["surface"][0]
+    passage = eager.df["passage"][0]
+
+    assert lazy.is_lazy
+    assert not eager.is_lazy
+    actual = lazy.passagesforsurface(surface)
+    assert isinstance(actual, pl.LazyFrame)
+    assert actual.collect().equals(eager.passagesforsurface(surface))
+    assert lazy.wholeimagesforpassage(passage).collect(engine="streaming").equals(
+        eager.wholeimagesforpassage(passage)
+    )
+    assert lazy.texts().collect().equals(eager.texts())
+
+
+def test_lazy_collect_builds_equivalent_eager_dse():
+    data = {
+        "passage": ["urn:cts:compnov:bible.genesis.sept_latin:1.1"],
+        "image": ["urn:cite2:img:collection.v1:img1@10,20,30,40"],
+        "surface": ["urn:cite2:surf:collection.v1:s1"],
+    }
+
+    collected = DSE.lazy(pl.DataFrame(data)).collect()
+
+    assert not collected.is_lazy
+    assert collected.df.equals(DSE(data).df)
+
+
+@pytest.mark.parametrize("format", ["ipc", "parquet"])
+def test_scan_snapshot_keeps_derived_and_extra_columns(tmp_path: Path, format: str):
+    combined = DSE.combine({"sept": DSE(_load_df(DATA_FILES[0])), "targum": DSE(_load_df(DATA_FILES[1]))})
+    combined.save(tmp_path / "snapshot", format=format)
+    framefile = next((tmp_path / "snapshot").glob("frame.*"))
+
+    lazy = DSE.scan(framefile)
+
+    assert lazy._pending == []
+    assert lazy.categorical
+    assert lazy.df.collect_schema().names() == combined.df.columns
+    surface = combined.df["surface"][0]
+    assert lazy.passagesforsurface(surface, edition="targum").collect().equals(
+        combined.passagesforsurface(surface, edition="targum")
+    )
+    assert lazy.collect().df.equals(combined.df)
+
+
+def test_lazy_collect_keeps_categorical_setting_and_cache():
+    eager = DSE(_load_df(DATA_FILES[0]), categorical=True)
+    lazy = DSE.lazy(eager.df.select("passage", "image", "surface")).cache(16)
+
+    collected = lazy.collect()
+
+    assert collected.categorical
+    assert collected.df.schema == eager.df.schema
+    assert collected.cacheinfo() == {"hits": 0, "misses": 0, "size": 0, "maxsize": 16}
+    collected.texts()
+    collected.texts()
+    assert collected.cacheinfo()["hits"] == 1
+
+
+def test_lazy_collect_rejects_invalid_roi():
+    lazy = DSE.lazy(
+        pl.LazyFrame(
+            {
+                "passage": ["urn:cts:foo:bar:1.1"],
+                "image": ["urn:cite2:img:collection.v1:img1@10,abc,30,40"],
+                "surface": ["urn:cite2:surf:collection.v1:s1"],
+            }
+        )
+    )
+
+    with pytest.raises(ValueError, match="ROI must have four comma-separated numeric values"):
+        lazy.collect()
+
+
+@pytest.mark.parametrize("path", DATA_FILES, ids=[p.name for p in DATA_FILES])
+def test_indexed_selectors_match_scanning_selectors(path: Path):
+    df = _load_df(path)
+    plain = DSE(df)
+    indexed = DSE(df, indexed=True)
+    passage = df["passage"][5]
+    surface = df["surface"][5]
+    image = df["image"][5]
+    wholeimage = image.split("@", 1)[0]
+
+    assert indexed.surfacesforpassage(passage).equals(plain.surfacesforpassage(passage))
+    assert indexed.imagesforpassage(passage).equals(plain.imagesforpassage(passage))
+    assert indexed.wholeimagesforpassage(passage).equals(plain.wholeimagesforpassage(passage))
+    assert indexed.imagesforsurface(surface).equals(plain.imagesforsurface(surface))
+    assert indexed.rectsforsurface(surface).equals(plain.rectsforsurface(surface))
+    assert indexed.passagesforsurface(surface).equals(plain.passagesforsurface(surface))
+    assert indexed.surfacesforimage(image).equals(plain.surfacesforimage(image))
+    assert indexed.passagesforimage(wholeimage).equals(plain.passagesforimage(wholeimage))
+
+
+def test_indexes_are_built_on_first_use_or_on_request():
+    data = {
+        "passage": ["urn:cts:foo:bar:1.1", "urn:cts:foo:bar:1.2", "urn:cts:foo:bar:1.1"],
+        "image": [
+            "urn:cite2:img:collection.v1:img1@1,2,3,4",
+            "urn:cite2:img:collection.v1:img1@5,6,7,8",
+            "urn:cite2:img:collection.v1:img2",
+        ],
+        "surface": ["urn:cite2:surf:collection.v1:s1"] * 3,
+    }
+    dse = DSE(data, indexed=True)
+    assert dse._indexes == {}
+
+    actual = dse.surfacesforpassage("urn:cts:foo:bar:1.3")
+    assert actual.height == 0
+    assert list(dse._indexes) == ["passage"]
+    assert dse.index("passage").rows("urn:cts:foo:bar:1.1").to_list() == [0, 2]
+
+    eager = DSE(data).build_indexes()
+    assert eager.indexed
+    assert sorted(eager._indexes) == ["passage", "surface", "wholeimage"]
+    assert len(eager.index("wholeimage")) == 2
+
+
+def test_column_index_stores_sorted_keys_and_row_runs():
+    df = pl.DataFrame({"surface": ["s2", "s1", None, "s2", "s3", "s1"]})
+
+    index = ColumnIndex.build(df, "surface")
+
+    assert index.keys.to_list() == ["s1", "s2", "s3"]
+    assert index.indptr.to_list() == [0, 2, 4, 5]
+    assert index.positions.to_list() == [1, 5, 0, 3, 4]
+    assert index.rows("s2").to_list() == [0, 3]
+    assert "s3" in index and "s0" not in index
+    assert index.rows("s0").dtype == index.rows("s1").dtype
+    assert index.rows("s0").len() == 0
+
+
+def test_column_index_keeps_changes_pending_until_compacted(monkeypatch: pytest.MonkeyPatch):
+    frame = pl.DataFrame({"surface": ["s2", "s1", None, "s2", "s3", "s1"]})
+    index = ColumnIndex.build(frame, "surface")
+
+    index.remove(pl.Series([0, 4]))
+    frame = frame.filter(~pl.int_range(pl.len()).is_in([0, 4]))
+    added = pl.DataFrame({"surface": ["s4", "s1", "s2"]})
+    index.extend(added, frame.height)
+    frame = pl.concat([frame, added])
+    index.remove(pl.Series([1, 4]))
+    frame = frame.filter(~pl.int_range(pl.len()).is_in([1, 4]))
+
+    assert index.positions.to_list() == [1, 5, 0, 3, 4]
+    assert index.pending() == 7
+    expected = ColumnIndex.build(frame, "surface")
+    for key in ["s1", "s2", "s3", "s4"]:
+        assert index.rows(key).equals(expected.rows(key))
+    assert "s3" not in index
+    index.compact()
+    assert index.pending() == 0
+    for part in ("keys", "indptr", "positions"):
+        assert getattr(index, part).equals(getattr(expected, part))
+
+    monkeypatch.setattr("dse_polars.index.COMPACT_MIN_ROWS", 1)
+    index.remove(pl.Series([0, 1]))
+    assert index.pending() == 0
+    assert index.keys.to_list() == ["s1", "s2"]
+    assert index.positions.to_list() == [0, 1, 2]
+
+
+def test_lazy_dse_has_no_indexes():
+    lazy = DSE.scan(DATA_FILES[0])
+    with pytest.raises(ValueError, match="lazy DSE"):
+        lazy.index("passage")
+
+
+def test_batch_selectors_tag_results_with_query_in_input_order():
+    dse = DSE(
+        {
+            "passage": [
+                "urn:cts:foo:bar:1.1",
+                "urn:cts:foo:bar:1.2",
+                "urn:cts:foo:bar:1.3",
+                "urn:cts:foo:bar:1.3",
+            ],
+            "image": [
+                "urn:cite2:img:collection.v1:img1@1,2,3,4",
+                "urn:cite2:img:collection.v1:img1@5,6,7,8",
+                "urn:cite2:img:collection.v1:img2@1,2,3,4",
+                "urn:cite2:img:collection.v1:img2@5,6,7,8",
+            ],
+            "surface": [
+                "urn:cite2:surf:collection.v1:s1",
+                "urn:cite2:surf:collection.v1:s1",
+                "urn:cite2:surf:collection.v1:s2",
+                "urn:cite2:surf:collection.v1:s2",
+            ],
+        }
+    )
+
+    actual = dse.passagesforsurfaces(
+        [
+            "urn:cite2:surf:collection.v1:s2",
+            "urn:cite2:surf:collection.v1:missing",
+            "urn:cite2:surf:collection.v1:s1",
+        ]
+    )
+    assert actual.columns == ["surface", "passage"]
+    assert actual.rows() == [
+        ("urn:cite2:surf:collection.v1:s2", "urn:cts:foo:bar:1.3"),
+        ("urn:cite2:surf:collection.v1:s1", "urn:cts:foo:bar:1.1"),
+        ("urn:cite2:surf:collection.v1:s1", "urn:cts:foo:bar:1.2"),
+    ]
+
+    surfaces = dse.surfacesforimages(["urn:cite2:img:collection.v1:img2@9,9,9,9"])
+    assert surfaces.rows() == [
+        ("urn:cite2:img:collection.v1:img2@9,9,9,9", "urn:cite2:surf:collection.v1:s2"),
+    ]
+
+
+@pytest.mark.parametrize("path", DATA_FILES, ids=[p.name for p in DATA_FILES])
+def test_batch_selectors_match_single_key_selectors(path: Path):
+    df = _load_df(path)
+    dse = DSE(df)
+    passages = df["passage"].drop_nulls().unique(maintain_order=True).head(20).to_list()
+    surfaces = df["surface"].drop_nulls().unique(maintain_order=True).head(5).to_list()
+    images = df["image"].head(5).to_list()
+    wholeimages = [image.split("@", 1)[0] for image in images]
+
+    def stacked(selector, keys, key):
+        return pl.concat(
+            [selector(value).select(pl.lit(value).alias(key), pl.all()) for value in keys]
+        )
+
+    cases = [
+        (dse.surfacesforpassages, dse.surfacesforpassage, passages, "passage"),
+        (dse.imagesforpassages, dse.imagesforpassage, passages, "passage"),
+        (dse.wholeimagesforpassages, dse.wholeimagesforpassage, passages, "passage"),
+        (dse.imagesforsurfaces, dse.imagesforsurface, surfaces, "surface"),
+        (dse.wholeimagesforsurfaces, dse.wholeimagesforsurface, surfaces, "surface"),
+        (dse.rectsforsurfaces, dse.rectsforsurface, surfaces, "surface"),
+        (dse.passagesforsurfaces, dse.passagesforsurface, surfaces, "surface"),
+        (dse.surfacesforimages, dse.surfacesforimage, images, "image"),
+        (dse.passagesforimages, dse.passagesforimage, wholeimages, "image"),
+    ]
+    for batch, single, keys, key in cases:
+        assert batch(keys).equals(stacked(single, keys, key)), batch.__name__
+
+
+def test_batch_selectors_on_lazy_dse_return_lazyframes():
+    lazy = DSE.scan(DATA_FILES[1])
+    eager = lazy.collect()
+    surfaces = eager.df["surface"].unique(maintain_order=True).head(3).to_list()
+
+    actual = lazy.wholeimagesforsurfaces(surfaces)
+
+    assert isinstance(actual, pl.LazyFrame)
+    assert actual.collect().equals(eager.wholeimagesforsurfaces(surfaces))
+
+
+def test_init_adds_cite2_part_columns_for_surface_and_wholeimage():
+    dse = DSE(
+        {
+            "passage": ["urn:cts:compnov:bible.genesis.sept_latin:1.1"],
+            "image": ["urn:cite2:citebne:complutensian.v1:v1p19@0.1,0.2,0.3,0.4"],
+            "surface": ["urn:cite2:complut:pages.bne:vol1_a_1r"],
+        }
+    )
+
+    assert dse.df.select(
+        "surfacenamespace", "surfacecollection", "surfaceversion", "surfaceobject"
+    ).row(0) == ("complut", "pages", "bne", "vol1_a_1r")
+    assert dse.df.select(
+        "imagenamespace", "imagecollection", "imageversion", "imageobject"
+    ).row(0) == ("citebne", "complutensian", "v1", "v1p19")
+
+
+@pytest.mark.parametrize("path", DATA_FILES, ids=[p.name for p in DATA_FILES])
+def test_categorical_dse_encodes_urn_columns_and_keeps_selector_results(path: Path):
+    df = _load_df(path)
+    plain = DSE(df)
+    encoded = DSE(df, categorical=True)
+    passage = df["passage"][0]
+    surface = df["surface"][0]
+
+    assert encoded.df.schema["passage"] == pl.String
+    assert encoded.df.schema["image"] == pl.String
+    assert encoded.df.schema["surface"] == pl.Categorical
+    assert encoded.df.schema["imagecollection"] == pl.Categorical
+    assert encoded.df.schema["x"] == pl.Float64
+    assert encoded.df.estimated_size() < plain.df.estimated_size()
+    assert encoded.df.cast(pl.String).equals(plain.df.cast(pl.String))
+
+    def same(actual: pl.DataFrame, expected: pl.DataFrame) -> bool:
+        return actual.cast(pl.String).equals(expected.cast(pl.String))
+
+    assert same(encoded.surfacesforpassage(passage), plain.surfacesforpassage(passage))
+    assert same(encoded.passagesforsurface(surface), plain.passagesforsurface(surface))
+    assert same(encoded.texts(), plain.texts())
+    assert same(
+        encoded.passagesforsurfaces([surface, "urn:cite2:surf:collection.v1:missing"]),
+        plain.passagesforsurfaces([surface]),
+    )
+    assert encoded.surfacesforpassage("urn:cts:foo:bar:missing").height == 0
+
+
+@pytest.mark.parametrize("format", ["ipc", "parquet"])
+def test_save_and_load_round_trip_frame_and_indexes(tmp_path: Path, format: str):
+    dse = DSE(_load_df(DATA_FILES[0]), categorical=True)
+    surface = dse.df["surface"][0]
+    expected = dse.passagesforsurface(surface)
+    dse.index("surface")
+
+    dse.save(tmp_path / "snapshot", format=format)
+    loaded = DSE.load(tmp_path / "snapshot")
+
+    assert loaded.df.equals(dse.df)
+    assert loaded.df.schema == dse.df.schema
+    assert loaded.categorical
+    assert list(loaded._indexes) == ["surface"]
+    for part in ("keys", "indptr", "positions"):
+        assert getattr(loaded.index("surface"), part).equals(getattr(dse.index("surface"), part))
+    assert loaded.passagesforsurface(surface).equals(expected)
+
+
+def test_save_lazy_dse_streams_frame(tmp_path: Path):
+    DSE.scan(DATA_FILES[1]).save(tmp_path / "snapshot")
+
+    loaded = DSE.load(tmp_path / "snapshot", memory_map=False)
+
+    assert not loaded.is_lazy
+    assert loaded.df.equals(DSE(_load_df(DATA_FILES[1])).df)
+
+
+def test_save_rejects_unknown_format(tmp_path: Path):
+    dse = DSE({"passage": [], "image": [], "surface": []})
+    with pytest.raises(ValueError, match="Unknown snapshot format"):
+        dse.save(tmp_path, format="csv")
+
+
+def _write_cex(path: Path, relation_rows: list[str]) -> Path:
+    path.write_text(
+        "\n".join(
+            [
+                "#!datamodels",
+                "Collection|Model|Label|Description",
+                "urn:cite2:demo:dse.v1:all|urn:cite2:cite:datamodels.v1:dsemodel|Demo DSE|Demo DSE collection",
+                "",
+                "#!citerelationset",
+                "urn|urn:cite2:demo:dse.v1:all",
+                "label|Demo relations",
+                "passage|imageroi|surface",
+                *relation_rows,
+            ]
+        ),
+        encoding="utf-8",
+    )
+    return path
+
+
+@pytest.mark.parametrize("path", DATA_FILES, ids=[p.name for p in DATA_FILES])
+def test_from_cex_stream_matches_from_cex_file(tmp_path: Path, path: Path):
+    rows = path.read_text(encoding="utf-8").splitlines()[1:]
+    cexfile = _write_cex(tmp_path / "dse.cex", rows)
+
+    streamed = DSE.from_cex_stream(cexfile, batch_size=100)
+    expected = DSE.from_cex_file(cexfile)
+
+    assert streamed.df.equals(expected.df)
+
+
+def test_from_cex_stream_limit_and_constructor_options(tmp_path: Path):
+    rows = DATA_FILES[0].read_text(encoding="utf-8").splitlines()[1:]
+    cexfile = _write_cex(tmp_path / "dse.cex", rows)
+
+    preview = DSE.from_cex_stream(cexfile, batch_size=7, limit=10, indexed=True)
+
+    assert preview.df.height == 10
+    assert preview.indexed
+    assert preview.df["passage"].to_list() == DSE.from_cex_file(cexfile).df["passage"].head(10).to_list()
+
+
+def test_from_cex_stream_without_relation_rows_is_empty(tmp_path: Path):
+    cexfile = _write_cex(tmp_path / "dse.cex", [])
+
+    assert DSE.from_cex_stream(cexfile).df.height == 0
+
+
+def test_from_cex_stream_rejects_rows_with_wrong_column_count(tmp_path: Path):
+    cexfile = _write_cex(tmp_path / "dse.cex", ["urn:cts:demo:text.v1:1.1|urn:cite2:demo:images.v1:img1"])
+
+    with pytest.raises(ValueError, match="expected 3 pipe-delimited fields"):
+        DSE.from_cex_stream(cexfile)
+
+
+@pytest.mark.parametrize("processes", [False, True], ids=["threads", "processes"])
+def test_from_cex_files_concatenates_files_and_tags_source(tmp_path: Path, processes: bool):
+    cexfiles = [
+        _write_cex(tmp_path / f"{path.stem}.cex", path.read_text(encoding="utf-8").splitlines()[1:])
+        for path in DATA_FILES
+    ]
+
+    dse = DSE.from_cex_files(cexfiles, workers=2, processes=processes)
+
+    singles = [DSE.from_cex_file(cexfile) for cexfile in cexfiles]
+    assert dse.df.columns[-1] == "source"
+    assert dse.df.drop("source").equals(pl.concat([single.df for single in singles]))
+    assert dse.df["source"].unique(maintain_order=True).to_list() == [str(cexfile) for cexfile in cexfiles]
+    assert dse.df.filter(pl.col("source") == str(cexfiles[1])).height == singles[1].df.height
+
+
+def test_from_cex_files_with_no_files_is_empty():
+    dse = DSE.from_cex_files([])
+
+    assert dse.df.height == 0
+    assert "source" in dse.df.columns
+
+
+def test_from_cex_text_reports_line_numbers_of_invalid_relation_rows():
+    cex_text = """#!datamodels
+Collection|Model|Label|Description
+urn:cite2:demo:dse.v1:all|urn:cite2:cite:datamodels.v1:dsemodel|Demo DSE|Demo DSE collection
+
+#!citerelationset
+urn|urn:cite2:demo:dse.v1:all
+label|Demo relations
+passage|imageroi|surface
+urn:cts:demo:text.v1:1.1|urn:cite2:demo:images.v1:img1@1,2,3,4|urn:cite2:demo:surfaces.v1:s1
+urn:cts:demo:text.v1:1.2|urn:cite2:demo:images.v1:img2@5,6,7,8
+urn:cts:demo:text.v1:1.3|urn:cite2:demo:images.v1:img2|urn:cite2:demo:surfaces.v1:s2|extra
+"""
+
+    with pytest.raises(ValueError, match=r"expected 3 pipe-delimited fields .* Offending lines: 10, 11\."):
+        DSE.from_cex_text(cex_text)
+
+
+def test_trusted_dse_defers_derived_columns_until_needed():
+    df = _load_df(DATA_FILES[0])
+    dse = DSE.trusted(df)
+    surface = df["surface"][0]
+    passage = df["passage"][0]
+
+    assert dse._pending == ["image", "passage", "roi", "cite2"]
+    assert dse.surfacesforpassage(passage).equals(DSE(df).surfacesforpassage(passage))
+    assert dse._pending == ["image", "passage", "roi", "cite2"]
+
+    dse.wholeimagesforsurface(surface)
+    assert dse._pending == ["passage", "roi", "cite2"]
+
+    dse.rectsforsurface(surface)
+    assert dse._pending == ["passage", "cite2"]
+
+    assert dse.df.equals(DSE(df).df)
+    assert dse._pending == []
+
+
+def test_trusted_dse_skips_roi_validation_until_geometry_is_needed():
+    dse = DSE.trusted(
+        {
+            "passage": ["urn:cts:foo:bar:1.1"],
+            "image": ["urn:cite2:img:collection.v1:img1@10,abc,30,40"],
+            "surface": ["urn:cite2:surf:collection.v1:s1"],
+        }
+    )
+
+    assert dse.passagesforsurface("urn:cite2:surf:collection.v1:s1").height == 1
+    with pytest.raises(ValueError, match="ROI must have four comma-separated numeric values"):
+        dse.rectsforsurface("urn:cite2:surf:collection.v1:s1")
+
+
+def test_trusted_dse_keeps_derived_columns_it_is_given():
+    full = DSE(_load_df(DATA_FILES[1]), categorical=True).df
+
+    dse = DSE.trusted(full)
+
+    assert dse._pending == []
+    assert dse.df is full
+
+
+def test_categorical_frame_is_wrapped_without_re_encoding():
+    full = DSE(_load_df(DATA_FILES[1]), categorical=True).df
+
+    assert DSE._from_frame(full, categorical=True)._df is full
+    assert DSE.trusted(full, categorical=True).df.schema == full.schema
+
+
+def test_assigning_df_resets_pending_columns_and_indexes():
+    dse = DSE(_load_df(DATA_FILES[0]), indexed=True)
+    dse.surfacesforpassage(dse.df["passage"][0])
+    assert dse._indexes
+
+    dse.df = dse.df.head(3).select(DSE_COLUMNS)
+
+    assert dse._indexes == {}
+    assert dse._pending == ["image", "passage", "roi", "cite2"]
+    assert dse.df.height == 3
+
+
+def _demo_rows(start: int, stop: int, surface: str = "s1") -> dict:
+    return {
+        "passage": [f"urn:cts:foo:bar.baz:1.{i}" for i in range(start, stop)],
+        "image": [f"urn:cite2:img:collection.v1:img{i % 2}@{i},{i},1,1" for i in range(start, stop)],
+        "surface": [f"urn:cite2:surf:collection.v1:{surface}"] * (stop - start),
+    }
+
+
+@pytest.mark.parametrize("categorical", [False, True], ids=["string", "categorical"])
+def test_extend_matches_dse_built_from_all_rows(categorical: bool):
+    dse = DSE(_demo_rows(0, 5), indexed=True, categorical=categorical).build_indexes()
+
+    dse.extend(_demo_rows(5, 8, surface="s2"))
+
+    expected = DSE(
+        pl.concat([pl.DataFrame(_demo_rows(0, 5)), pl.DataFrame(_demo_rows(5, 8, surface="s2"))]),
+        indexed=True,
+    )
+    assert dse.df.cast(pl.String).equals(expected.df.cast(pl.String))
+    assert dse.df.schema["surface"] == (pl.Categorical if categorical else pl.String)
+    for column in INDEXED_COLUMNS:
+        index = dse.index(column)
+        assert index.pending() > 0
+        for key in expected.index(column).keys:
+            assert index.rows(key).equals(expected.index(column).rows(key))
+        index.compact()
+        for part in ("keys", "indptr", "positions"):
+            assert getattr(index, part).equals(getattr(expected.index(column), part))
+    assert dse.passagesforsurface("urn:cite2:surf:collection.v1:s2").cast(pl.String).equals(
+        expected.passagesforsurface("urn:cite2:surf:collection.v1:s2")
+    )
+
+
+def test_extend_validates_only_new_rows_and_fills_extra_columns():
+    dse = DSE.trusted(DSE(_demo_rows(0, 2)).df.with_columns(pl.lit("a.cex").alias("source")))
+
+    dse.extend({**_demo_rows(2, 3), "source": ["b.cex"]})
+    dse.extend(_demo_rows(3, 4))
+
+    assert dse.df["source"].to_list() == ["a.cex", "a.cex", "b.cex", None]
+    with pytest.raises(ValueError, match="ROI must have four comma-separated numeric values"):
+        dse.extend(
+            {
+                "passage": ["urn:cts:foo:bar:9.9"],
+                "image": ["urn:cite2:img:collection.v1:img1@1,2"],
+                "surface": ["urn:cite2:surf:collection.v1:s1"],
+            }
+        )
+    assert dse.df.height == 4
+
+
+def test_remove_drops_rows_and_renumbers_indexes():
+    dse = DSE(_demo_rows(0, 8), indexed=True).build_indexes()
+
+    dse.remove(pl.col("x").is_between(2, 4) | (pl.col("passageref") == "1.7"))
+
+    expected = DSE(
+        {
+            column: [value for i, value in enumerate(values) if i not in (2, 3, 4, 7)]
+            for column, values in _demo_rows(0, 8).items()
+        },
+        indexed=True,
+    )
+    assert dse.df.equals(expected.df)
+    for column in INDEXED_COLUMNS:
+        index = dse.index(column)
+        assert index.pending() > 0
+        for key in expected.index(column).keys:
+            assert index.rows(key).equals(expected.index(column).rows(key))
+        index.compact()
+        for part in ("keys", "indptr", "positions"):
+            assert getattr(index, part).equals(getattr(expected.index(column), part))
+    assert dse.imagesforsurface("urn:cite2:surf:collection.v1:s1").equals(
+        expected.imagesforsurface("urn:cite2:surf:collection.v1:s1")
+    )
+
+
+def test_lazy_dse_cannot_be_updated_in_place():
+    lazy = DSE.scan(DATA_FILES[0])
+
+    with pytest.raises(ValueError, match="lazy DSE"):
+        lazy.extend(_demo_rows(0, 1))
+    with pytest.raises(ValueError, match="lazy DSE"):
+        lazy.remove(pl.col("passage").is_null())
+
+
+@pytest.fixture
+def combined_dse() -> DSE:
+    return DSE.combine(
+        {
+            "lxx": DSE(_load_df(DATA_FILES[0])),
+            "targum": DSE(_load_df(DATA_FILES[1])),
+        }
+    )
+
+
+def test_combine_tags_rows_with_edition_and_shares_dictionaries(combined_dse: DSE):
+    lxx = DSE(_load_df(DATA_FILES[0]))
+    targum = DSE(_load_df(DATA_FILES[1]))
+
+    assert combined_dse.df.height == lxx.df.height + targum.df.height
+    assert combined_dse.df.columns[-1] == "edition"
+    assert combined_dse.df.schema["edition"] == pl.Enum(["lxx", "targum"])
+    assert combined_dse.df.schema["wholeimage"] == pl.Categorical
+    assert combined_dse.editions()["edition"].cast(pl.String).to_list() == ["lxx", "targum"]
+    assert (
+        combined_dse.df.filter(pl.col("edition") == "targum")
+        .drop("edition")
+        .cast(pl.String)
+        .equals(targum.df.cast(pl.String))
+    )
+
+
+def test_selectors_accept_edition_filter(combined_dse: DSE):
+    targum = DSE(_load_df(DATA_FILES[1]))
+    surface = targum.df["surface"][0]
+    image = targum.df["image"][0]
+
+    actual = combined_dse.passagesforsurface(surface, edition="targum")
+    assert actual.cast(pl.String).equals(targum.passagesforsurface(surface))
+    assert combined_dse.surfacesforimage(image, edition=["targum"]).cast(pl.String).equals(
+        targum.surfacesforimage(image)
+    )
+    assert combined_dse.imagesforsurfaces([surface], edition="targum").cast(pl.String).equals(
+        targum.imagesforsurfaces([surface])
+    )
+    assert combined_dse.surfaces(edition="lxx").height == DSE(_load_df(DATA_FILES[0])).surfaces().height
+
+
+def test_cross_edition_lookups():
+    lxx = DSE(_load_df(DATA_FILES[0]))
+    images = lxx.images()["image"].drop_nulls().sort().to_list()
+    shared, only_lxx = images[0], images[1]
+    targum_df = _load_df(DATA_FILES[1])
+    targum = DSE(targum_df.filter(~pl.col("image").str.starts_with(only_lxx + "@")))
+    combined = DSE.combine({"lxx": lxx, "targum": targum})
+
+    assert combined.editionsforimage(shared + "@0,0,1,1")["edition"].cast(pl.String).to_list() == ["lxx", "targum"]
+    assert combined.editionsforimage(only_lxx)["edition"].cast(pl.String).to_list() == ["lxx"]
+    assert combined.editionsforimages([only_lxx, shared]).cast(pl.String).rows() == [
+        (only_lxx, "lxx"),
+        (shared, "lxx"),
+        (shared, "targum"),
+    ]
+    passage = targum.df["passage"][0]
+    assert combined.editionsforpassage(passage)["edition"].cast(pl.String).to_list() == ["targum"]
+    surface = targum.df["surface"][0]
+    assert combined.editionsforsurface(surface)["edition"].cast(pl.String).to_list() == ["lxx", "targum"]
+
+
+def test_edition_filter_requires_edition_column():
+    dse = DSE(_load_df(DATA_FILES[0]))
+
+    with pytest.raises(ValueError, match="no edition column"):
+        dse.surfaces(edition="lxx")
+    with pytest.raises(ValueError, match="no edition column"):
+        dse.editionsforimage("urn:cite2:img:collection.v1:img1")
+
+
+@pytest.mark.parametrize("path", DATA_FILES, ids=[p.name for p in DATA_FILES])
+def test_roisforpoint_matches_ptinrect_filter(path: Path):
+    dse = DSE(_load_df(path))
+    df = dse.df
+    sample = df.drop_nulls("x").gather_every(50)
+    for image, x, y, w, h in sample.select("wholeimage", "x", "y", "w", "h").iter_rows():
+        for px, py in [(x + w / 2, y + h / 2), (x, y), (x + w, y + h), (x - 0.001, y)]:
+            expected = df.filter((pl.col("wholeimage") == image) & ptinrect(px, py))
+            assert dse.roisforpoint(image, px, py).equals(expected)
+    assert dse.roisforpoint("urn:cite2:demo:img.v1:missing", 0.5, 0.5).height == 0
+
+
+@pytest.mark.parametrize("path", DATA_FILES, ids=[p.name for p in DATA_FILES])
+def test_roisforrect_matches_rectsintersect_filter(path: Path):
+    dse = DSE(_load_df(path), categorical=True)
+    df = dse.df
+    image = df["wholeimage"][0]
+    for viewport in [(0.0, 0.0, 1.0, 1.0), (0.4, 0.4, 0.1, 0.1), (0.5, 0.75, 0.0, 0.0), (2.0, 2.0, 1.0, 1.0)]:
+        expected = df.filter((pl.col("wholeimage") == image) & rectsintersect(*viewport))
+        assert dse.roisforrect(image + "@0,0,1,1", *viewport).equals(expected)
+
+
+def test_spatial_queries_on_lazy_dse_match_eager():
+    eager = DSE(_load_df(DATA_FILES[0]))
+    lazy = DSE.lazy(_load_df(DATA_FILES[0]))
+    image, x, y = eager.df.drop_nulls("x").select("wholeimage", "x", "y").row(0)
+
+    columns = ["passage", "image", "surface"]
+    assert lazy.roisforpoint(image, x, y).collect().select(columns).equals(eager.roisforpoint(image, x, y).select(columns))
+    assert (
+        lazy.roisforrect(image, x, y, 0.1, 0.1).collect().select(columns)
+        .equals(eager.roisforrect(image, x, y, 0.1, 0.1).select(columns))
+    )
+    with pytest.raises(ValueError, match="lazy"):
+        lazy.spatialindex()
+
+
+def test_spatial_index_is_rebuilt_after_updates():
+    dse = DSE(_demo_rows(0, 3))
+    image = "urn:cite2:img:collection.v1:img0"
+    assert dse.roisforpoint(image, 2.5, 2.5)["passage"].to_list() == ["urn:cts:foo:bar.baz:1.2"]
+
+    dse.extend(_demo_rows(3, 5))
+    assert dse.roisforpoint(image, 4.5, 4.5)["passage"].to_list() == ["urn:cts:foo:bar.baz:1.4"]
+
+    dse.remove(pl.col("passage") == "urn:cts:foo:bar.baz:1.2")
+    assert dse.roisforpoint(image, 2.5, 2.5).height == 0
+    assert dse.roisforpoint(image, 4.5, 4.5)["passage"].to_list() == ["urn:cts:foo:bar.baz:1.4"]
+
+
+@pytest.mark.parametrize("categorical", [False, True], ids=["string", "categorical"])
+def test_roisforpoints_matches_roisforpoint(categorical: bool):
+    dse = DSE(_load_df(DATA_FILES[1]), categorical=categorical)
+    sample = dse.df.drop_nulls("x").gather_every(40)
+    points = sample.select(
+        pl.col("image").cast(pl.String),
+        (pl.col("x") + pl.col("w") / 2).alias("px"),
+        (pl.col("y") + pl.col("h") / 2).alias("py"),
+    )
+
+    actual = dse.roisforpoints(points)
+
+    expected = pl.concat(
+        [
+            dse.roisforpoint(image, px, py)
+            .select(pl.lit(image).alias("image"), pl.lit(px).alias("px"), pl.lit(py).alias("py"), "passage", "surface", "roi")
+            .cast({"passage": pl.String, "surface": pl.String, "roi": pl.String})
+            for image, px, py in points.iter_rows()
+        ]
+    )
+    assert actual.height >= points.height
+    assert actual.cast({"passage": pl.String, "surface": pl.String, "roi": pl.String}).equals(expected)
+    assert DSE.lazy(_load_df(DATA_FILES[1])).roisforpoints(points.lazy()).collect().equals(
+        actual.cast({"passage": pl.String, "surface": pl.String, "roi": pl.String})
+    )
+
+
+def test_roioverlaps_and_roicoverage_on_combined_dse():
+    from dse_polars.spatial import roi_overlaps
+
+    combined = DSE.combine({"lxx": DSE(_load_df(DATA_FILES[0])), "targum": DSE(_load_df(DATA_FILES[1]))})
+    lxx = combined.df.filter(pl.col("edition") == "lxx")
+    targum = combined.df.filter(pl.col("edition") == "targum")
+
+    # The two editions are printed in separate columns of each page.
+    between = combined.roioverlaps(edition="lxx", otheredition="targum")
+    assert between.equals(roi_overlaps(lxx, targum))
+    assert between.height == 0
+
+    within = combined.roioverlaps(edition="lxx")
+    assert within.equals(roi_overlaps(lxx))
+    assert combined.roioverlaps().height == within.height + combined.roioverlaps(edition="targum").height
+
+    image = within["wholeimage"][0]
+    rects = lxx.filter(pl.col("wholeimage") == image).select("x", "y", "w", "h", pl.col("passage").cast(pl.String)).rows()
+    expected = [
+        (a[4], b[4])
+        for i, a in enumerate(rects)
+        for b in rects[i + 1:]
+        if min(a[0] + a[2], b[0] + b[2]) > max(a[0], b[0]) and min(a[1] + a[3], b[1] + b[3]) > max(a[1], b[1])
+    ]
+    assert within.filter(pl.col("wholeimage") == image).select("passage", "passage_right").rows() == expected
+
+    coverage = combined.roicoverage(edition="targum")
+    assert coverage.height == targum.drop_nulls("x")["wholeimage"].n_unique()
+    assert (coverage["coverage"] <= coverage["area"] + 1e-9).all()
+    assert (coverage["coverage"] > 0).all()
+
+
+def test_cached_dse_serves_repeated_calls_from_cache():
+    dse = DSE(_load_df(DATA_FILES[0])).cache(maxsize=8)
+    surface = dse.df["surface"][0]
+
+    first = dse.passagesforsurface(surface)
+    again = dse.passagesforsurface(surface)
+    assert again is first
+    assert dse.texts() is dse.texts()
+    assert dse.passagesforsurfaces([surface]) is dse.passagesforsurfaces((surface,))
+    assert dse.cacheinfo() == {"hits": 3, "misses": 3, "size": 3, "maxsize": 8}
+    assert DSE(_load_df(DATA_FILES[0])).cacheinfo() is None
+
+
+def test_cached_dse_is_invalidated_when_records_change():
+    dse = DSE(_demo_rows(0, 3)).cache()
+    surface = "urn:cite2:surf:collection.v1:s1"
+    assert dse.passagesforsurface(surface).height == 3
+
+    dse.extend(_demo_rows(3, 5))
+    assert dse.passagesforsurface(surface).height == 5
+
+    dse.remove(pl.col("passage") == "urn:cts:foo:bar.baz:1.0")
+    assert dse.passagesforsurface(surface).height == 4
+
+    dse.df = dse.df.head(1)
+    assert dse.passagesforsurface(surface).height == 1
+    assert dse.cacheinfo()["hits"] == 0
+
+
+def test_graph_matches_selectors_and_is_updated_in_place():
+    dse = DSE(_load_df(DATA_FILES[0]))
+    image = dse.df["wholeimage"][0]
+    graph = dse.graph()
+
+    assert dse.graph() is graph
+    assert set(graph.neighbors([image], "passage")["urn"].to_list()) == set(
+        dse.passagesforimage(image)["passage"].drop_nulls().to_list()
+    )
+    assert set(graph.neighbors([image], "surface")["urn"].to_list()) == set(dse.surfacesforimage(image)["surface"].to_list())
+
+    dse.extend(_demo_rows(0, 1))
+    assert dse.graph() is graph
+    assert graph.neighbors(["urn:cts:foo:bar.baz:1.0"])["urn"].to_list() == [
+        "urn:cite2:surf:collection.v1:s1",
+        "urn:cite2:img:collection.v1:img0",
+    ]
+
+    dse.remove(pl.col("passage") == "urn:cts:foo:bar.baz:1.0")
+    assert dse.graph() is graph
+    assert graph.ids(["urn:cts:foo:bar.baz:1.0"]).len() == 0
+    assert graph.components().sort("urn").equals(DSEGraph.build(dse.df).components().sort("urn"))
+
+
+def _both_editions() -> DSE:
+    return DSE(pl.concat([_load_df(path) for path in DATA_FILES]))
+
+
+@pytest.mark.parametrize(
+    "urn",
+    [
+        "urn:cts:compnov:bible.genesis:1",
+        "urn:cts:compnov:bible.genesis.sept_latin:2",
+        "urn:cts:compnov:bible.genesis.targum_latin:1.1",
+        "urn:cts:compnov:bible.genesis:",
+        "urn:cts:other:bible.genesis:1",
+        "urn:cts:compnov:bible.exodus:1",
+    ],
+)
+def test_citation_selectors_match_ctsurn_contains(urn: str):
+    dse = _both_editions()
+    expected = dse.df.filter(ctsurn_contains(pl.col("passage"), urn))
+
+    actual = dse.imagesforcitation(urn)
+
+    assert sorted(actual.rows()) == sorted(expected.select("passage", "image").rows())
+    assert set(dse.surfacesforcitation(urn)["surface"].to_list()) == set(expected["surface"].to_list())
+    assert dse.passagesforcitation(urn)["passage"].to_list() == actual["passage"].unique(maintain_order=True).to_list()
+
+
+def test_citation_selectors_return_citation_order():
+    dse = _both_editions()
+
+    passages = dse.passagesforcitation("urn:cts:compnov:bible.genesis.sept_latin:1")["passage"].to_list()
+    verses = [int(passage.rsplit(".", 1)[1].split("@")[0]) for passage in passages]
+    assert verses == sorted(verses)
+    assert len(verses) > 9
+
+    # Without a version, each verse of every version is listed before the next verse.
+    passages = dse.passagesforcitation("urn:cts:compnov:bible.genesis:1.1")["passage"].to_list()
+    assert passages[:2] == [
+        "urn:cts:compnov:bible.genesis.sept_latin:1.1",
+        "urn:cts:compnov:bible.genesis.targum_latin:1.1",
+    ]
+
+
+def test_citation_selectors_on_lazy_and_combined_dse_match_eager():
+    dse = _both_editions()
+    urn = "urn:cts:compnov:bible.genesis:2"
+    lazy = DSE.lazy(_load_df(DATA_FILES[0]))
+    eager = DSE(_load_df(DATA_FILES[0]))
+    combined = DSE.combine({"lxx": DSE(_load_df(DATA_FILES[0])), "targum": DSE(_load_df(DATA_FILES[1]))})
+
+    assert lazy.imagesforcitation(urn).collect().equals(eager.imagesforcitation(urn))
+    assert combined.imagesforcitation(urn, edition="lxx").cast(pl.String).equals(eager.imagesforcitation(urn))
+    assert dse.imagesforcitation(urn).height > eager.imagesforcitation(urn).height
+
+
+def test_citation_index_is_updated_in_place():
+    dse = DSE(_demo_rows(0, 3))
+    index = dse.citationindex()
+
+    assert dse.citationindex() is index
+    assert dse.passagesforcitation("urn:cts:foo:bar.baz:1").height == 3
+
+    dse.extend(_demo_rows(3, 5))
+    dse.remove(pl.col("passage") == "urn:cts:foo:bar.baz:1.1")
+    assert dse.citationindex() is index
+    assert index.pending() == 3
+    assert dse.passagesforcitation("urn:cts:foo:bar.baz:1").equals(
+        DSE(dse.df.select(DSE_COLUMNS)).passagesforcitation("urn:cts:foo:bar.baz:1")
+    )
+
+
+def test_indexes_are_rebuilt_once_changes_pile_up(monkeypatch: pytest.MonkeyPatch):
+    dse = DSE(_demo_rows(0, 3))
+    dse.spatialindex(), dse.graph(), dse.citationindex()
+
+    dse.extend(_demo_rows(3, 4))
+    assert dse._spatial is not None and dse._graph is not None and dse._citations is not None
+
+    monkeypatch.setattr("dse_polars.index.COMPACT_MIN_ROWS", 1)
+    dse.extend(_demo_rows(4, 6))
+    assert dse._spatial is None and dse._graph is None and dse._citations is None
+    assert dse.passagesforcitation("urn:cts:foo:bar.baz:1").height == 6
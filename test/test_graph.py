@@ -0,0 +1,103 @@
+import polars as pl
+import pytest
+
+from dse_polars.graph import DSEGraph
+
+
+@pytest.fixture
+def graph() -> DSEGraph:
+    # Two pages: p1 and p2 on s1 (image i1); p3 on s1 and s2 (images i1, i2); p4 alone on s3 (i3).
+    df = pl.DataFrame(
+        {
+            "passage": ["p1", "p2", "p3", "p3", "p4"],
+            "surface": ["s1", "s1", "s1", "s2", "s3"],
+            "wholeimage": ["i1", "i1", "i1", "i2", "i3"],
+        }
+    )
+    return DSEGraph.build(df)
+
+
+def test_build_interns_urns_and_stores_csr_adjacency(graph: DSEGraph):
+    assert len(graph) == 10
+    assert graph.nodes["urn"].to_list() == ["p1", "p2", "p3", "p4", "s1", "s2", "s3", "i1", "i2", "i3"]
+    assert graph.nodes["kind"].to_list() == ["passage"] * 4 + ["surface"] * 3 + ["image"] * 3
+    assert graph.indptr.len() == 11
+    p3 = graph.indices[graph.indptr[2]:graph.indptr[3]].to_list()
+    assert graph.urns(pl.Series(p3))["urn"].to_list() == ["s1", "s2", "i1", "i2"]
+
+
+def test_neighbors_by_kind(graph: DSEGraph):
+    assert graph.neighbors(["i1"], "passage")["urn"].to_list() == ["p1", "p2", "p3"]
+    assert graph.neighbors(["i1", "i2"]).rows() == [
+        ("p1", "passage"),
+        ("p2", "passage"),
+        ("p3", "passage"),
+        ("s1", "surface"),
+        ("s2", "surface"),
+    ]
+    assert graph.neighbors(["missing"]).height == 0
+
+
+def test_expand_records_hop_counts(graph: DSEGraph):
+    actual = graph.expand(["p1"], hops=2)
+
+    assert actual.rows() == [
+        ("p1", "passage", 0),
+        ("s1", "surface", 1),
+        ("i1", "image", 1),
+        ("p2", "passage", 2),
+        ("p3", "passage", 2),
+    ]
+    assert graph.expand(["p1"], hops=3, kind="image")["urn"].to_list() == ["i1", "i2"]
+    assert graph.expand(["p1"], hops=0)["urn"].to_list() == ["p1"]
+
+
+def test_components(graph: DSEGraph):
+    components = graph.components()
+
+    assert components.filter(pl.col("component") == 0)["urn"].to_list() == ["p1", "p2", "p3", "s1", "s2", "i1", "i2"]
+    assert components.filter(pl.col("component") == 1)["urn"].to_list() == ["p4", "s3", "i3"]
+    assert graph.component("i3")["urn"].to_list() == ["p4", "s3", "i3"]
+    assert graph.component("missing").height == 0
+
+
+def test_components_of_a_chain_need_many_rounds():
+    # Passage i lies on surfaces i and i + 1, so the records form one long chain.
+    n = 50
+    df = pl.DataFrame(
+        {
+            "passage": [f"p{i}" for i in range(n) for _ in range(2)],
+            "surface": [f"s{i + offset}" for i in range(n) for offset in range(2)],
+            "wholeimage": [None] * (2 * n),
+        },
+        schema={"passage": pl.String, "surface": pl.String, "wholeimage": pl.String},
+    )
+    graph = DSEGraph.build(df)
+
+    assert graph.componentids().unique().to_list() == [0]
+    assert graph.expand(["s0"], hops=2 * n).tail(1).rows() == [(f"s{n}", "surface", 2 * n)]
+
+
+def test_extend_and_remove_match_a_rebuilt_graph(graph: DSEGraph):
+    df = pl.DataFrame(
+        {
+            "passage": ["p1", "p2", "p3", "p3", "p4"],
+            "surface": ["s1", "s1", "s1", "s2", "s3"],
+            "wholeimage": ["i1", "i1", "i1", "i2", "i3"],
+        }
+    )
+    added = pl.DataFrame({"passage": ["p5", "p4"], "surface": ["s3", "s2"], "wholeimage": ["i3", "i2"]})
+
+    graph.extend(added)
+    graph.remove(df.slice(1, 1))
+    expected = DSEGraph.build(pl.concat([df, added]).filter(pl.col("passage") != "p2"))
+
+    assert graph.pending() > 0
+    assert len(graph) == len(expected) == 10
+    assert graph.ids(["p2"]).len() == 0
+    assert graph.neighbors(["s2"])["urn"].to_list() == ["p3", "p4", "i2"]
+    assert graph.neighbors(["i1"], "passage")["urn"].to_list() == ["p1", "p3"]
+    assert graph.expand(["p5"], hops=2).sort("hops", "urn").equals(expected.expand(["p5"], hops=2).sort("hops", "urn"))
+    assert graph.components().select("urn", "component").sort("urn").equals(
+        expected.components().select("urn", "component").sort("urn")
+    )
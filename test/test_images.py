@@ -4,6 +4,7 @@ import pytest
 from dse_polars.images import (
     CitableIIIFService,
     ptinrect,
+    rectsintersect,
     rois,
     roi,
     strip_roi,
@@ -205,3 +206,23 @@ def test_rois_returns_empty_list_when_all_null():
     df = pl.DataFrame({"roi": [None, None]}, schema={"roi": pl.String})
     actual = rois(df)
     assert actual == []
+
+
+def test_rectsintersect_inclusive_bounds_and_nulls():
+    df = pl.DataFrame(
+        {
+            "x": [10.0, 10.0, None],
+            "y": [20.0, 20.0, 20.0],
+            "w": [30.0, 30.0, 30.0],
+            "h": [40.0, 40.0, 40.0],
+        }
+    )
+    actual = df.select(
+        rectsintersect(0.0, 0.0, 10.0, 20.0).alias("touching"),
+        rectsintersect(41.0, 20.0, 5.0, 5.0).alias("right"),
+        rectsintersect(15.0, 25.0, 1.0, 1.0).alias("inside"),
+    )
+
+    assert actual["touching"].to_list() == [True, True, False]
+    assert actual["right"].to_list() == [False, False, False]
+    assert actual["inside"].to_list() == [True, True, False]
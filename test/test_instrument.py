@@ -0,0 +1,84 @@
+import polars as pl
+
+from dse_polars.dse import DSE
+from dse_polars.instrument import Operation, Recorder, add_hook, instrumented, recording, remove_hook
+from dse_polars.texts import DSEPassages, textcontents
+
+
+CEX_TEXT = """#!datamodels
+Collection|Model|Label|Description
+urn:cite2:demo:dse.v1:all|urn:cite2:cite:datamodels.v1:dsemodel|Demo DSE|Demo DSE collection
+
+#!citerelationset
+urn|urn:cite2:demo:dse.v1:all
+label|Demo relations
+passage|imageroi|surface
+urn:cts:demo:text.v1:1.1|urn:cite2:demo:images.v1:img1@1,2,3,4|urn:cite2:demo:surfaces.v1:s1
+urn:cts:demo:text.v1:1.2|urn:cite2:demo:images.v1:img1@5,6,7,8|urn:cite2:demo:surfaces.v1:s1
+urn:cts:demo:text.v1:1.3|urn:cite2:demo:images.v1:img2|urn:cite2:demo:surfaces.v1:s2
+"""
+
+
+def test_recording_reports_construction_phases_and_selectors():
+    with recording() as recorder:
+        dse = DSE.from_cex_text(CEX_TEXT)
+        passages = dse.passagesforsurface("urn:cite2:demo:surfaces.v1:s1")
+
+    names = [operation.name for operation in recorder.operations]
+    assert names[:3] == ["parse_cex", "relation_frame", "dse_relations"]
+    assert "derive_columns" in names
+    assert "check_rois" in names
+    assert names.index("DSE.__init__") < names.index("DSE.from_cex_text") < names.index("DSE.passagesforsurface")
+
+    selector = recorder.operations[-1]
+    assert selector.name == "DSE.passagesforsurface"
+    assert selector.rows_in == 3
+    assert selector.rows_out == passages.height == 2
+    assert set(selector.memory) == {"passage"}
+    assert selector.seconds >= 0
+
+    constructor = recorder.operations[names.index("DSE.__init__")]
+    assert constructor.rows_in == 3
+    assert constructor.rows_out == 3
+
+
+def test_summary_counts_calls_by_name():
+    dse = DSE.from_cex_text(CEX_TEXT)
+    with recording() as recorder:
+        for _ in range(3):
+            dse.surfaces()
+        textcontents(DSEPassages({"urn": ["urn:cts:demo:text.v1:1.1"], "text": ["alpha"]}).df)
+
+    summary = recorder.summary()
+    assert summary.columns == ["name", "calls", "total_seconds", "mean_seconds", "rows_in", "rows_out"]
+    counts = dict(summary.select("name", "calls").iter_rows())
+    assert counts == {"DSE.surfaces": 3, "DSEPassages.__init__": 1, "textcontents": 1}
+    assert recorder.frame().filter(pl.col("name") == "textcontents")["rows_out"].to_list() == [1]
+
+
+def test_hooks_are_only_called_while_registered():
+    calls = []
+
+    @instrumented
+    def double(df: pl.DataFrame) -> pl.DataFrame:
+        return pl.concat([df, df])
+
+    df = pl.DataFrame({"a": [1, 2]})
+    double(df)
+    add_hook(calls.append)
+    try:
+        double(df)
+    finally:
+        remove_hook(calls.append)
+    double(df)
+
+    assert len(calls) == 1
+    operation = calls[0]
+    assert isinstance(operation, Operation)
+    assert operation.name.endswith("double")
+    assert (operation.rows_in, operation.rows_out) == (2, 4)
+    assert operation.memory == {"a": 32}
+
+
+def test_recorder_frame_is_empty_without_operations():
+    assert Recorder().frame().height == 0
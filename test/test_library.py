@@ -0,0 +1,56 @@
+from pathlib import Path
+
+from dse_polars.dse import DSE
+from dse_polars.library import CexLibrary
+from dse_polars.texts import DSEPassages
+
+
+CEX_TEXT = """#!cexversion
+3.0
+
+#!ctsdata
+urn:cts:demo:text.v1:1.1#In principio
+urn:cts:demo:text.v1:1.2#Terra autem # erat inanis
+
+#!datamodels
+Collection|Model|Label|Description
+urn:cite2:demo:dse.v1:all|urn:cite2:cite:datamodels.v1:dsemodel|Demo DSE|Demo DSE collection
+urn:cite2:demo:comments.v1:all|urn:cite2:cite:datamodels.v1:commentarymodel|Demo comments|Demo commentary collection
+
+#!citerelationset
+urn|urn:cite2:demo:comments.v1:all
+label|Demo commentary relations
+passage|comment|source
+urn:cts:demo:text.v1:1.1|urn:cts:demo:commentary.v1:1.1|urn:cite2:demo:sources.v1:s1
+
+#!citerelationset
+urn|urn:cite2:demo:dse.v1:all
+label|Demo relations
+passage|imageroi|surface
+urn:cts:demo:text.v1:1.1|urn:cite2:demo:images.v1:img1@1,2,3,4|urn:cite2:demo:surfaces.v1:s1
+urn:cts:demo:text.v1:1.2|urn:cite2:demo:images.v1:img2@5,6,7,8|urn:cite2:demo:surfaces.v1:s2
+"""
+
+
+def test_cex_library_loads_dse_passages_and_datamodels():
+    library = CexLibrary.from_cex_text(CEX_TEXT, indexed=True)
+
+    assert library.dse.df.equals(DSE.from_cex_text(CEX_TEXT).df)
+    assert library.dse.indexed
+    assert library.passages.df.equals(DSEPassages.from_cex_text(CEX_TEXT).df)
+    assert library.passages.df["text"].to_list() == ["In principio", "Terra autem # erat inanis"]
+    assert library.datamodels.columns == ["collection", "model", "label", "description"]
+    assert library.datamodels["collection"].to_list() == [
+        "urn:cite2:demo:dse.v1:all",
+        "urn:cite2:demo:comments.v1:all",
+    ]
+
+
+def test_cex_library_from_cex_file(tmp_path: Path):
+    cexfile = tmp_path / "library.cex"
+    cexfile.write_text(CEX_TEXT, encoding="utf-8")
+
+    library = CexLibrary.from_cex_file(cexfile)
+
+    assert library.dse.df.height == 2
+    assert library.passages.df["passageref"].to_list() == ["1.1", "1.2"]
@@ -0,0 +1,165 @@
+import polars as pl
+import pytest
+
+from dse_polars.spatial import SpatialIndex, default_cellsize, points_in_rois, roi_coverage, roi_overlaps
+
+
+@pytest.fixture
+def rects() -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "wholeimage": ["img1", "img1", "img1", "img2", None],
+            "x": [0.0, 5.0, 0.0, 0.0, 1.0],
+            "y": [0.0, 5.0, 0.0, 0.0, 1.0],
+            "w": [2.0, 1.0, 10.0, 2.0, 1.0],
+            "h": [2.0, 1.0, 10.0, 2.0, 1.0],
+        }
+    )
+
+
+def test_build_lists_each_rectangle_under_the_cells_it_touches(rects: pl.DataFrame):
+    index = SpatialIndex.build(rects, cellsize=4.0)
+
+    assert "img1" in index
+    assert "img2" in index
+    assert index.cellsize == 4.0
+    assert index.cells.head(3).rows() == [("img1", 0, 0), ("img1", 0, 1), ("img1", 0, 2)]
+    assert index.indptr.head(4).to_list() == [0, 2, 3, 4]
+    assert index.positions.head(4).to_list() == [0, 2, 2, 2]
+    assert index.pointcandidates("img1", 5.5, 5.5).to_list() == [1, 2]
+    assert index.pointcandidates("img1", 9.0, 9.0).to_list() == [2]
+    assert len(index) == 10
+    assert index.large.height == 0
+
+
+def test_rectangles_over_many_cells_are_kept_apart(rects: pl.DataFrame):
+    index = SpatialIndex.build(rects, cellsize=1.0)
+
+    assert index.large.rows() == [("img1", 2)]
+    assert len(index) == 9 + 4 + 9
+    assert index.pointcandidates("img1", 0.5, 0.5).to_list() == [0, 2]
+    assert index.pointcandidates("img1", 9.5, 9.5).to_list() == [2]
+    assert index.pointcandidates("img1", 50.0, 50.0).to_list() == [2]
+    assert index.rectcandidates("img1", 5.0, 5.0, 0.5, 0.5).to_list() == [1, 2]
+    assert index.rectcandidates("img2", 5.0, 5.0, 0.5, 0.5).to_list() == []
+
+
+def test_extend_and_remove_keep_candidates_in_row_order(rects: pl.DataFrame):
+    index = SpatialIndex.build(rects, cellsize=4.0)
+    added = pl.DataFrame({"wholeimage": ["img1", "img2"], "x": [5.0, 0.0], "y": [5.0, 0.0], "w": [1.0, 1.0], "h": [1.0, 1.0]})
+
+    index.remove(pl.Series([1]))
+    index.extend(added, 4)
+    index.remove(pl.Series([0]))
+
+    assert index.pending() == 4
+    assert index.pointcandidates("img1", 5.5, 5.5).to_list() == [0, 3]
+    assert index.rectcandidates("img1", 0.0, 0.0, 5.0, 5.0).to_list() == [0, 3]
+    assert index.rectcandidates("img2", 0.0, 0.0, 1.0, 1.0).to_list() == [1, 4]
+    assert "img2" in index
+    index.remove(pl.Series([1, 4]))
+    assert "img2" not in index
+
+
+def test_pointcandidates_returns_rows_of_the_cell_in_row_order(rects: pl.DataFrame):
+    index = SpatialIndex.build(rects, cellsize=4.0)
+
+    assert index.pointcandidates("img1", 5.5, 5.5).to_list() == [1, 2]
+    assert index.pointcandidates("img1", 100.0, 100.0).to_list() == []
+    assert index.pointcandidates("missing", 0.0, 0.0).to_list() == []
+
+
+def test_rectcandidates_unions_the_cells_covered(rects: pl.DataFrame):
+    index = SpatialIndex.build(rects, cellsize=4.0)
+
+    assert index.rectcandidates("img1", 0.0, 0.0, 5.0, 5.0).to_list() == [0, 1, 2]
+    assert index.rectcandidates("img1", -1000.0, -1000.0, 2000.0, 2000.0).to_list() == [0, 1, 2]
+    assert index.rectcandidates("img2", 9.0, 9.0, 1.0, 1.0).to_list() == []
+
+
+def test_default_cellsize_is_median_larger_side(rects: pl.DataFrame):
+    assert default_cellsize(rects) == 2.0
+    assert default_cellsize(rects.clear()) == 1.0
+    assert SpatialIndex.build(rects).cellsize == 2.0
+
+
+def test_build_rejects_non_positive_cellsize(rects: pl.DataFrame):
+    with pytest.raises(ValueError, match="cellsize"):
+        SpatialIndex.build(rects, cellsize=0)
+
+
+def test_points_in_rois_matches_cross_join(rects: pl.DataFrame):
+    rois = rects.with_columns(pl.Series("passage", ["p0", "p1", "p2", "p3", "p4"]))
+    points = pl.DataFrame(
+        {
+            "id": [1, 2, 3, 4, 5],
+            "image": ["img1", "img1@0,0,1,1", "img2", "img3", None],
+            "px": [5.5, 1.0, 2.0, 0.0, 1.5],
+            "py": [5.5, 1.0, 2.0, 0.0, 1.5],
+        }
+    )
+
+    actual = points_in_rois(points, rois, columns=["passage"], cellsize=4.0)
+
+    assert actual.columns == ["id", "image", "px", "py", "passage"]
+    assert actual.select("id", "passage").rows() == [(1, "p1"), (1, "p2"), (2, "p0"), (2, "p2"), (3, "p3")]
+    assert points_in_rois(points, rois, columns=["passage"]).equals(actual)
+    assert points_in_rois(points.lazy(), rois, columns=["passage"]).collect().equals(actual)
+    # With unit cells the 10x10 rectangle of p2 touches 121 cells and is joined on image only.
+    assert points_in_rois(points, rois, columns=["passage"], cellsize=1.0).equals(actual)
+
+
+@pytest.fixture
+def overlapping() -> pl.DataFrame:
+    return pl.DataFrame(
+        {
+            "wholeimage": ["a", "a", "a", "a", "b", "b"],
+            "x": [0.0, 1.0, 0.0, 5.0, 0.0, 1.0],
+            "y": [0.0, 1.0, 0.0, 5.0, 0.0, 0.0],
+            "w": [2.0, 2.0, 2.0, 1.0, 1.0, 1.0],
+            "h": [2.0, 2.0, 2.0, 1.0, 1.0, 1.0],
+            "passage": ["p", "q", "r", "s", "t", "u"],
+        }
+    )
+
+
+def _brute_force_overlaps(left: pl.DataFrame, right: pl.DataFrame, self_pairs: bool) -> list[tuple]:
+    found = []
+    for i, a in enumerate(left.iter_rows(named=True)):
+        for j, b in enumerate(right.iter_rows(named=True)):
+            if a["wholeimage"] != b["wholeimage"] or (self_pairs and j <= i):
+                continue
+            width = min(a["x"] + a["w"], b["x"] + b["w"]) - max(a["x"], b["x"])
+            height = min(a["y"] + a["h"], b["y"] + b["h"]) - max(a["y"], b["y"])
+            if width > 0 and height > 0:
+                found.append((a["passage"], b["passage"], width * height))
+    return found
+
+
+def test_roi_overlaps_within_one_frame(overlapping: pl.DataFrame):
+    actual = roi_overlaps(overlapping, columns=["passage"])
+
+    assert actual.columns == ["wholeimage", "passage", "passage_right", "intersection", "iou"]
+    assert actual.select("passage", "passage_right", "intersection").rows() == [
+        ("p", "q", 1.0),
+        ("p", "r", 4.0),
+        ("q", "r", 1.0),
+    ]
+    assert actual["iou"].to_list() == pytest.approx([1 / 7, 1.0, 1 / 7])
+
+
+def test_roi_overlaps_between_frames_matches_brute_force(overlapping: pl.DataFrame):
+    left = overlapping.head(3)
+    right = overlapping.tail(4).with_columns(pl.col("passage").str.to_uppercase())
+
+    actual = roi_overlaps(left, right, columns=["passage"])
+
+    assert actual.select("passage", "passage_right", "intersection").rows() == _brute_force_overlaps(left, right, False)
+    assert roi_overlaps(left.lazy(), right, columns=["passage"]).collect().equals(actual)
+
+
+def test_roi_coverage_measures_union_area(overlapping: pl.DataFrame):
+    actual = roi_coverage(overlapping)
+
+    assert actual.rows() == [("a", 4, 13.0, 8.0), ("b", 2, 2.0, 2.0)]
+    assert roi_coverage(overlapping.lazy()).collect().equals(actual)
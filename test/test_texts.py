@@ -1,13 +1,21 @@
+import io
+import random
+import re
+
 import polars as pl
 import pytest
 
 from dse_polars.texts import (
     DSEPassages,
+    citation_key,
+    cts_containment_join,
     ctsurn_containedby,
     ctsurn_contains,
     md_passages,
     retrieve_leafnode_range,
+    retrieve_leafnode_ranges,
     textcontents,
+    write_md_passages,
 )
 
 
@@ -27,7 +35,7 @@ def test_dsepassages_init_expands_urn_parts_to_columns():
         }
     )
 
-    assert passages.df.columns == ["urn", "text", "passageref", "group", "work", "version"]
+    assert passages.df.columns == ["urn", "text", "passageref", "group", "work", "version", "citekey"]
     assert passages.df["passageref"].to_list() == ["1.1", "2.3"]
     assert passages.df["group"].to_list() == ["bible", "bible"]
     assert passages.df["work"].to_list() == ["genesis", "genesis"]
@@ -83,6 +91,26 @@ def test_ctsurn_contains_expr_semantics(u1: str, u2: str, expected: bool):
     assert _eval_expr(u1, u2) is expected
 
 
+@pytest.mark.parametrize(
+    "u1,u2,expected",
+    [
+        ("urn:cts:compnov:bible.genesis.sept_latin:1.1-1.25", "urn:cts:compnov:bible.genesis:1", True),
+        ("urn:cts:compnov:bible.genesis.sept_latin:1.20-2.3", "urn:cts:compnov:bible.genesis.sept_latin:1", False),
+        ("urn:cts:compnov:bible.genesis.sept_latin:1.1-5", "urn:cts:compnov:bible.genesis.sept_latin:1", True),
+        (
+            "urn:cts:compnov:bible.genesis.sept_latin:1.1-urn:cts:compnov:bible.genesis.sept_latin:2.9",
+            "urn:cts:compnov:bible.genesis.sept_latin:1",
+            False,
+        ),
+        ("urn:cts:compnov:bible.genesis.sept_latin:1.1-1.5", "urn:cts:compnov:bible.genesis.sept_latin:1.1", False),
+        ("urn:cts:compnov:bible.genesis.sept_latin:1.1-1.5", "urn:cts:compnov:bible.genesis.sept_latin:", True),
+        ("urn:cts:compnov:bible.genesis.sept_latin:1.1-1.5", "urn:cts:compnov:bible.exodus:1", False),
+    ],
+)
+def test_ctsurn_contains_ranges(u1: str, u2: str, expected: bool):
+    assert _eval_expr(u1, u2) is expected
+
+
 def test_ctsurn_contains_mixed_expr_and_literal_inputs():
     df = pl.DataFrame(
         {
@@ -210,6 +238,40 @@ def test_md_passages_allows_custom_highlighter_and_skips_nulls():
     assert actual == ["**1.1** In principio"]
 
 
+def test_md_passages_uses_last_urn_component():
+    df = pl.DataFrame({"urn": ["urn:cts:compnov:bible.genesis.sept_latin:1.1@principio", "no-colons"], "text": ["a", "b"]})
+
+    assert md_passages(df) == ["*1.1@principio* a", "*no-colons* b"]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 100])
+def test_write_md_passages_streams_md_passages_lines(chunk_size: int):
+    df = pl.DataFrame(
+        {
+            "urn": [f"urn:cts:compnov:bible.genesis.sept_latin:1.{i}" for i in range(5)] + [None],
+            "text": ["In principio", None, "Terra\nautem", "erat", "inanis", "Ignored"],
+        },
+        schema={"urn": pl.String, "text": pl.String},
+    )
+    stream = io.StringIO()
+
+    written = write_md_passages(df, stream, highlighter="**", chunk_size=chunk_size)
+
+    lines = md_passages(df, highlighter="**")
+    assert written == len(lines) == 4
+    assert stream.getvalue() == "".join(f"{line}\n" for line in lines)
+
+
+def test_write_md_passages_to_path(tmp_path):
+    df = pl.DataFrame({"urn": ["urn:cts:compnov:bible.genesis.sept_latin:1.1"], "text": ["In principio"]})
+    path = tmp_path / "passages.md"
+
+    assert write_md_passages(df, path) == 1
+    assert path.read_text(encoding="utf-8") == "*1.1* In principio\n"
+    assert write_md_passages(df.clear(), path) == 0
+    assert path.read_text(encoding="utf-8") == ""
+
+
 def test_retrieve_leafnode_range_filters_rows_between_start_and_end():
     df = pl.DataFrame(
         {
@@ -255,3 +317,274 @@ def test_retrieve_leafnode_range_supports_abbreviated_end_value():
         "urn:cts:compnov:bible.genesis.sept_latin:1.2",
         "urn:cts:compnov:bible.genesis.sept_latin:1.3",
     ]
+
+
+def _reference_key(passage: str) -> tuple:
+    "Natural-order key computed in Python, as retrieve_leafnode_range used to."
+    return tuple(
+        tuple((0, int(piece)) if piece.isdigit() else (1, piece) for piece in re.findall(r"\d+|\D+", level))
+        for level in passage.split(".")
+    )
+
+
+def test_citation_key_orders_like_python_natural_key():
+    rng = random.Random(7)
+    pieces = ["1", "2", "9", "10", "002", "0", "a", "b", "ab", "A", "rev", "σ"]
+    passages = ["", "1", "1..2", "1.1", "1.10", "1.2a", "12r", "12v", "2"] + [
+        ".".join("".join(rng.choice(pieces) for _ in range(rng.randint(1, 2))) for _ in range(rng.randint(1, 3)))
+        for _ in range(300)
+    ]
+
+    keys = pl.DataFrame({"passage": passages}).select(citation_key(pl.col("passage")))["citekey"].to_list()
+
+    for (left, left_key), (right, right_key) in zip(zip(passages, keys), zip(passages[1:], keys[1:])):
+        assert (left_key < right_key) == (_reference_key(left) < _reference_key(right)), (left, right)
+        assert (left_key == right_key) == (_reference_key(left) == _reference_key(right)), (left, right)
+
+
+def test_citation_key_literal_input():
+    assert pl.select(citation_key("1.2a")).item() == "0011\x01\x000012\x011a\x01\x00"
+
+
+def test_retrieve_leafnode_range_accepts_swapped_bounds_and_skips_invalid_rows():
+    df = pl.DataFrame(
+        {
+            "urn": [
+                "urn:cts:compnov:bible.genesis.sept_latin:1.9",
+                "urn:cts:compnov:bible.genesis.sept_latin:1.10",
+                "urn:cts:compnov:bible.genesis.sept_latin:1.10a",
+                "urn:cts:compnov:bible.genesis.sept_latin:1.11",
+                "urn:cts:compnov:bible.genesis.sept_latin:2",
+                None,
+                "not-a-urn",
+            ],
+            "text": ["a", "b", "c", "d", "e", "f", "g"],
+        },
+        schema={"urn": pl.String, "text": pl.String},
+    )
+
+    actual = retrieve_leafnode_range(df, "urn:cts:compnov:bible.genesis.sept_latin:1.11-1.10")
+
+    assert actual["text"].to_list() == ["b", "c", "d"]
+
+
+def test_retrieve_leafnode_range_matches_python_reference():
+    rng = random.Random(11)
+    base = "urn:cts:compnov:bible.genesis.sept_latin"
+    urns = [
+        f"{rng.choice([base, 'urn:cts:compnov:bible.exodus.sept_latin'])}:{rng.randint(1, 4)}.{rng.randint(1, 12)}{rng.choice(['', '', 'a', 'b'])}"
+        for _ in range(200)
+    ]
+    df = pl.DataFrame({"urn": urns})
+
+    for start, end in [("1.3", "2.5"), ("2.10", "1.2"), ("3.4a", "3.9"), ("1", "2")]:
+        low, high = sorted([_reference_key(start), _reference_key(end)])
+        expected = [
+            urn for urn in urns
+            if urn.rpartition(":")[0] == base and low <= _reference_key(urn.rpartition(":")[2]) <= high
+        ]
+        assert retrieve_leafnode_range(df, f"{base}:{start}-{end}")["urn"].to_list() == expected
+
+
+def test_retrieve_leafnode_range_over_many_first_levels_matches_python_reference():
+    rng = random.Random(13)
+    base = "urn:cts:compnov:bible.genesis.sept_latin"
+    levels = ["1", "1a", "2", "3", "9", "10", "10b", "pr", "x"]
+    urns = [f"{base}:{rng.choice(levels)}.{rng.randint(1, 12)}" for _ in range(300)] + [f"{base}:2", f"{base}:pr"]
+    df = pl.DataFrame({"urn": urns})
+
+    for start, end in [("1.5", "10.2"), ("1a.3", "3.1"), ("10.4", "pr.2"), ("2", "9"), ("3.1", "3.7"), ("x.1", "1.1")]:
+        low, high = sorted([_reference_key(start), _reference_key(end)])
+        expected = [urn for urn in urns if low <= _reference_key(urn.rpartition(":")[2]) <= high]
+        assert retrieve_leafnode_range(df, f"{base}:{start}-{end}")["urn"].to_list() == expected
+
+
+def test_dsepassages_from_cex_text_reads_ctsdata_blocks():
+    cex_text = """#!ctsdata
+urn:cts:compnov:bible.genesis.sept_latin:1.1#In principio
+// comment
+urn:cts:compnov:bible.genesis.sept_latin:1.2#Terra autem
+
+#!ctsdata
+urn:cts:compnov:bible.genesis.targum_latin:1.1#In principio creavit
+"""
+
+    passages = DSEPassages.from_cex_text(cex_text)
+
+    assert passages.df["urn"].to_list() == [
+        "urn:cts:compnov:bible.genesis.sept_latin:1.1",
+        "urn:cts:compnov:bible.genesis.sept_latin:1.2",
+        "urn:cts:compnov:bible.genesis.targum_latin:1.1",
+    ]
+    assert passages.df["text"].to_list() == ["In principio", "Terra autem", "In principio creavit"]
+    assert passages.df["version"].to_list() == ["sept_latin", "sept_latin", "targum_latin"]
+
+
+def test_dsepassages_sorts_by_work_and_citation_key():
+    passages = DSEPassages(
+        {
+            "urn": [
+                "urn:cts:compnov:bible.genesis.sept_latin:1.10",
+                "urn:cts:compnov:bible.exodus.sept_latin:1.1",
+                "urn:cts:compnov:bible.genesis:1.1",
+                "urn:cts:compnov:bible.genesis.sept_latin:1.2",
+                "urn:cts:compnov:bible.genesis.sept_latin:1.1",
+            ],
+            "text": ["a", "b", "c", "d", "e"],
+        }
+    )
+
+    assert passages.df["text"].to_list() == ["b", "e", "d", "a", "c"]
+
+
+def test_dsepassages_passagerange_matches_retrieve_leafnode_range():
+    rng = random.Random(5)
+    base = "urn:cts:compnov:bible.genesis.sept_latin"
+    urns = [
+        f"{rng.choice([base, 'urn:cts:compnov:bible.genesis', 'urn:cts:compnov:bible.exodus.sept_latin'])}:"
+        f"{rng.randint(1, 4)}.{rng.randint(1, 12)}{rng.choice(['', '', 'a'])}"
+        for _ in range(300)
+    ]
+    passages = DSEPassages({"urn": urns, "text": [str(i) for i in range(len(urns))]})
+
+    for urn in [
+        f"{base}:1.3-2.5",
+        f"{base}:2.10-1.2",
+        f"{base}:3.4a-3.9",
+        f"{base}:1-2",
+        f"{base}:2.1-5",
+        "urn:cts:compnov:bible.genesis:1.1-1.8",
+        "urn:cts:compnov:bible.leviticus.sept_latin:1.1-1.8",
+        urns[0],
+    ]:
+        expected = retrieve_leafnode_range(passages.df, urn)
+        assert sorted(passages.passagerange(urn)["text"].to_list()) == sorted(expected["text"].to_list()), urn
+
+
+def test_dsepassages_passagerange_is_in_citation_order():
+    passages = DSEPassages(
+        {
+            "urn": [f"urn:cts:compnov:bible.genesis.sept_latin:{chapter}.{verse}" for chapter in (2, 1) for verse in (10, 2, 1)],
+            "text": ["2.10", "2.2", "2.1", "1.10", "1.2", "1.1"],
+        }
+    )
+
+    actual = passages.passagerange("urn:cts:compnov:bible.genesis.sept_latin:1.2-2.2")
+
+    assert actual["text"].to_list() == ["1.2", "1.10", "2.1", "2.2"]
+
+
+def test_dsepassages_next_and_previous_passage():
+    base = "urn:cts:compnov:bible.genesis.sept_latin"
+    passages = DSEPassages(
+        {
+            "urn": [f"{base}:1.{verse}" for verse in range(1, 6)] + ["urn:cts:compnov:bible.exodus.sept_latin:1.1"],
+            "text": ["1", "2", "3", "4", "5", "exodus"],
+        }
+    )
+
+    assert passages.nextpassage(f"{base}:1.2")["text"].to_list() == ["3"]
+    assert passages.nextpassage(f"{base}:1.2", n=10)["text"].to_list() == ["3", "4", "5"]
+    assert passages.nextpassage(f"{base}:1.5").height == 0
+    assert passages.previouspassage(f"{base}:1.4", n=2)["text"].to_list() == ["2", "3"]
+    assert passages.previouspassage(f"{base}:1.1").height == 0
+    # A passage not in the text still has neighbors in citation order.
+    assert passages.nextpassage(f"{base}:1.2a")["text"].to_list() == ["3"]
+    assert passages.previouspassage(f"{base}:1.2a")["text"].to_list() == ["2"]
+    assert passages.nextpassage("urn:cts:compnov:bible.numbers.sept_latin:1.1").height == 0
+
+
+def test_retrieve_leafnode_ranges_matches_single_range_lookups():
+    rng = random.Random(3)
+    base = "urn:cts:compnov:bible.genesis.sept_latin"
+    urns = [
+        f"{rng.choice([base, 'urn:cts:compnov:bible.genesis', 'urn:cts:compnov:bible.exodus.sept_latin'])}:"
+        f"{rng.randint(1, 4)}.{rng.randint(1, 12)}{rng.choice(['', '', 'a'])}"
+        for _ in range(300)
+    ]
+    df = pl.DataFrame({"urn": urns, "text": [str(i) for i in range(len(urns))]})
+    ranges = [
+        f"{base}:2.10-1.2",
+        f"{base}:1.3-2.5",
+        "urn:cts:compnov:bible.genesis:1.1-1.8",
+        f"{base}:9.1-9.3",
+        urns[0],
+        f"{base}:1.3-2.5",
+    ]
+
+    actual = retrieve_leafnode_ranges(df, ranges)
+
+    assert actual.columns == ["range", "urn", "text"]
+    assert actual["range"].unique(maintain_order=True).to_list() == [
+        f"{base}:2.10-1.2",
+        f"{base}:1.3-2.5",
+        "urn:cts:compnov:bible.genesis:1.1-1.8",
+        urns[0],
+    ]
+    passages = DSEPassages(df)
+    for urn in set(ranges):
+        expected = retrieve_leafnode_range(df, urn)
+        tagged = actual.filter(pl.col("range") == urn)
+        assert sorted(tagged["text"].to_list()) == sorted(expected["text"].to_list() * ranges.count(urn)), urn
+        assert passages.passageranges([urn])["text"].to_list() == passages.passagerange(urn)["text"].to_list()
+
+
+def test_retrieve_leafnode_ranges_without_ranges():
+    df = pl.DataFrame({"urn": ["urn:cts:compnov:bible.genesis.sept_latin:1.1"], "text": ["a"]})
+
+    assert retrieve_leafnode_ranges(df, []).columns == ["range", "urn", "text"]
+    assert retrieve_leafnode_ranges(df, []).height == 0
+    with pytest.raises(ValueError):
+        retrieve_leafnode_ranges(df.drop("urn"), [])
+
+
+def _random_cts_urn(rng: random.Random) -> str | None:
+    namespace = rng.choice(["compnov", "compnov", "other"])
+    work = rng.choice(["bible.genesis.sept_latin", "bible.genesis", "bible.genesis.targum", "bible.exodus.sept_latin", "bible"])
+
+    def passage() -> str:
+        return ".".join(rng.choice(["1", "2", "10", "1a", ""]) for _ in range(rng.randint(1, 3)))
+
+    kind = rng.random()
+    if kind < 0.1:
+        return f"urn:cts:{namespace}:{work}:"
+    if kind < 0.25:
+        end = rng.choice([passage(), "5", f"urn:cts:{namespace}:{work}:{passage()}"])
+        return f"urn:cts:{namespace}:{work}:{passage()}-{end}"
+    if kind < 0.3:
+        return rng.choice([None, "not-a-urn", f"urn:cts:{namespace}:{work}"])
+    return f"urn:cts:{namespace}:{work}:{passage()}"
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+def test_cts_containment_join_matches_ctsurn_contains(seed: int):
+    rng = random.Random(seed)
+    left = pl.DataFrame({"urn": [_random_cts_urn(rng) for _ in range(150)], "a": range(150)}, schema={"urn": pl.String, "a": pl.Int64})
+    right = pl.DataFrame({"urn": [_random_cts_urn(rng) for _ in range(100)], "b": range(100)}, schema={"urn": pl.String, "b": pl.Int64})
+
+    expected = (
+        left.join(right, how="cross")
+        .filter(ctsurn_contains(pl.col("urn"), pl.col("urn_right")))
+        .sort("a", "b")
+    )
+
+    assert cts_containment_join(left, right).equals(expected)
+
+
+def test_cts_containment_join_columns():
+    passages = pl.DataFrame(
+        {
+            "passage": [
+                "urn:cts:compnov:bible.genesis.sept_latin:1.1",
+                "urn:cts:compnov:bible.genesis.sept_latin:2.1",
+                "urn:cts:compnov:bible.genesis.sept_latin:1.1-1.3",
+            ],
+            "text": ["a", "b", "c"],
+        }
+    )
+    queries = pl.DataFrame({"urn": ["urn:cts:compnov:bible.genesis:1", "urn:cts:compnov:bible.genesis:"], "text": ["x", "y"]})
+
+    actual = cts_containment_join(passages, queries, left_on="passage", suffix="_query")
+
+    assert actual.columns == ["passage", "text", "urn", "text_query"]
+    assert actual.select("text", "text_query").rows() == [("a", "x"), ("a", "y"), ("b", "y"), ("c", "x"), ("c", "y")]